@@ -42,6 +42,10 @@ setup(
         'pyfiglet==0.8.post1',
         'SPARQLWrapper==1.8.5'
     ],
+    extras_require={
+        # receive status updates of results, see `wait_for_results`
+        'events': ['python-socketio[client]==5.5.0']
+    },
     tests_require=["pytest"],
     package_data={
         'vantage6.client': [
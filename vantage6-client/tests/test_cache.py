@@ -0,0 +1,60 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from vantage6.client.cache import PublicKeyCache
+
+
+class TestPublicKeyCache(TestCase):
+
+    def test_key_is_fetched_once(self):
+        fetch = MagicMock(return_value='public-key')
+        cache = PublicKeyCache()
+
+        for _ in range(50):
+            assert cache.get(1, fetch) == 'public-key'
+
+        fetch.assert_called_once_with(1)
+
+    def test_key_expires(self):
+        fetch = MagicMock(return_value='public-key')
+        cache = PublicKeyCache(ttl=10)
+
+        with patch('vantage6.client.cache.time.monotonic', return_value=0):
+            cache.get(1, fetch)
+        with patch('vantage6.client.cache.time.monotonic', return_value=5):
+            cache.get(1, fetch)
+        assert fetch.call_count == 1
+
+        with patch('vantage6.client.cache.time.monotonic', return_value=11):
+            cache.get(1, fetch)
+        assert fetch.call_count == 2
+
+    def test_invalidate(self):
+        fetch = MagicMock(side_effect=['old-key', 'new-key'])
+        cache = PublicKeyCache()
+
+        assert cache.get(1, fetch) == 'old-key'
+        cache.invalidate(1)
+        assert cache.get(1, fetch) == 'new-key'
+
+    def test_size_is_bounded(self):
+        cache = PublicKeyCache(max_size=2)
+        fetch = MagicMock(side_effect=lambda id_: f'key-{id_}')
+
+        cache.get(1, fetch)
+        cache.get(2, fetch)
+        cache.get(1, fetch)
+        cache.get(3, fetch)
+
+        # organization 2 was used least recently
+        assert len(cache) == 2
+        cache.get(1, fetch)
+        cache.get(2, fetch)
+        assert fetch.call_count == 4
+
+    def test_missing_key_is_not_cached(self):
+        fetch = MagicMock(side_effect=[None, 'public-key'])
+        cache = PublicKeyCache()
+
+        assert cache.get(1, fetch) is None
+        assert cache.get(1, fetch) == 'public-key'
@@ -1,4 +1,5 @@
 import base64
+import io
 import json
 import pickle
 from typing import Dict
@@ -67,6 +68,151 @@ class TestClient(TestCase):
 
         assert results == [{'result': [1, 2, 3, 4, 5]}]
 
+    def test_get_binary_results(self):
+        mock_result = b'json.' + json.dumps({'some_key': 'some_value'}).encode()
+        mock_result_response = {'id': FAKE_ID, 'finished_at': 'yesterday'}
+        version = {'version': '', 'features': ['result_payload']}
+
+        mock_requests = MagicMock()
+        mock_requests.get.return_value.status_code = 200
+        mock_requests.post.return_value.status_code = 200
+        mock_requests.get.return_value.json.side_effect = [
+            TestClient._user(), TestClient._organization(), version,
+            mock_result_response
+        ]
+        mock_requests.request.return_value.status_code = 200
+        mock_requests.request.return_value.raw = io.BytesIO(mock_result)
+
+        mock_jwt = TestClient._create_mock_jwt()
+        with patch.multiple('vantage6.client', requests=mock_requests, jwt=mock_jwt):
+            client = TestClient.setup_client()
+            result = client.result.get(FAKE_ID)
+
+            # the result is left out of the JSON, and downloaded separately
+            params = mock_requests.get.call_args[1]['params']
+            assert params['exclude'] == ['result']
+            assert mock_requests.request.call_args[0][0] == 'get'
+
+        assert result['result'] == {'some_key': 'some_value'}
+
+    def test_list_results_without_binary_payloads(self):
+        mock_result = base64.b64encode(b'json.{"some_key": "some_value"}').decode()
+        mock_result_response = [
+            {'id': id_, 'finished_at': 'yesterday', 'result': mock_result}
+            for id_ in (1, 2)
+        ]
+
+        mock_requests = MagicMock()
+        mock_requests.get.return_value.status_code = 200
+        mock_requests.post.return_value.status_code = 200
+        mock_requests.get.return_value.json.side_effect = [
+            TestClient._user(), TestClient._organization(), mock_result_response
+        ]
+
+        mock_jwt = TestClient._create_mock_jwt()
+        with patch.multiple('vantage6.client', requests=mock_requests, jwt=mock_jwt):
+            client = TestClient.setup_client()
+            results = client.result.from_task(task_id=FAKE_ID)
+
+            # the results are part of the list, no request per result
+            params = mock_requests.get.call_args[1]['params']
+            assert 'exclude' not in params
+            mock_requests.request.assert_not_called()
+
+        assert all(result['result'] == {'some_key': 'some_value'} for result in results)
+
+    def test_wait_for_results(self):
+        mock_result = base64.b64encode(b'json.{"some_key": "some_value"}').decode()
+        task = {'id': FAKE_ID, 'collaboration': {'id': COLLABORATION_ID}}
+
+        mock_requests = MagicMock()
+        mock_requests.get.return_value.status_code = 200
+        mock_requests.post.return_value.status_code = 200
+        mock_requests.get.return_value.json.side_effect = [
+            TestClient._user(), TestClient._organization(), task,
+            [{'id': 1, 'finished_at': 'yesterday'}, {'id': 2, 'finished_at': None}],
+            {'version': ''}, {'id': 1, 'result': mock_result},
+            {'id': 2, 'finished_at': 'today'}, {'id': 2, 'result': mock_result}
+        ]
+
+        # the node of result 2 reports that it is finished
+        mock_events = MagicMock()
+        mock_events.return_value.connected = True
+        mock_events.return_value.wait.return_value = 2
+
+        mock_jwt = TestClient._create_mock_jwt()
+        with patch.multiple('vantage6.client', requests=mock_requests, jwt=mock_jwt,
+                            ResultEvents=mock_events):
+            client = TestClient.setup_client()
+            results = client.wait_for_results(FAKE_ID)
+
+            # each result is retrieved once, the status of all results is
+            # only checked at the start
+            urls = [call[0][0] for call in mock_requests.get.call_args_list]
+            assert urls[2:] == [f'{HOST}:{PORT}/api/{endpoint}' for endpoint in [
+                f'task/{FAKE_ID}', 'result', 'version', 'result/1', 'result/2',
+                'result/2'
+            ]]
+
+        assert [result['id'] for result in results] == [1, 2]
+        assert all(result['result'] == {'some_key': 'some_value'} for result in results)
+        mock_events.return_value.disconnect.assert_called_once()
+
+    def test_wait_for_results_polling(self):
+        task = {'id': FAKE_ID, 'collaboration': {'id': COLLABORATION_ID}}
+
+        mock_requests = MagicMock()
+        mock_requests.get.return_value.status_code = 200
+        mock_requests.post.return_value.status_code = 200
+        mock_requests.get.return_value.json.side_effect = [
+            TestClient._user(), TestClient._organization(), task,
+            [{'id': 1, 'finished_at': None}], [{'id': 1, 'finished_at': None}],
+            [{'id': 1, 'finished_at': 'today'}], {'version': ''}, {'id': 1},
+            task, [{'id': 1, 'finished_at': None}]
+        ]
+
+        # the websocket is not available
+        mock_events = MagicMock()
+        mock_events.return_value.connected = False
+        mock_time = MagicMock()
+        mock_time.monotonic.return_value = 0
+
+        mock_jwt = TestClient._create_mock_jwt()
+        with patch.multiple('vantage6.client', requests=mock_requests, jwt=mock_jwt,
+                            ResultEvents=mock_events, time=mock_time):
+            client = TestClient.setup_client()
+            results = client.wait_for_results(FAKE_ID)
+            assert [result['id'] for result in results] == [1]
+
+            # the interval is doubled after each check
+            sleeps = [call[0][0] for call in mock_time.sleep.call_args_list]
+            assert sleeps == [1, 2]
+
+            with self.assertRaises(TimeoutError):
+                client.wait_for_results(FAKE_ID, timeout=0)
+
+    def test_public_key_updates(self):
+        mock_requests = MagicMock()
+        mock_requests.get.return_value.status_code = 200
+        mock_requests.post.return_value.status_code = 200
+        mock_requests.get.return_value.json.side_effect = [
+            TestClient._user(), TestClient._organization()
+        ]
+        mock_events = MagicMock()
+
+        mock_jwt = TestClient._create_mock_jwt()
+        with patch.multiple('vantage6.client', requests=mock_requests, jwt=mock_jwt,
+                            PublicKeyEvents=mock_events):
+            client = Client(HOST, PORT)
+            client.authenticate(FAKE_USERNAME, FAKE_PASSWORD)
+
+        # the cached key is invalidated when the server reports a new one
+        url, _, on_update = mock_events.return_value.connect.call_args[0]
+        assert url == f'{HOST}:{PORT}'
+        client.public_keys.get(FAKE_ID, lambda id_: 'old-key')
+        on_update(FAKE_ID)
+        assert client.public_keys.get(FAKE_ID, lambda id_: 'new-key') == 'new-key'
+
     @staticmethod
     def post_task_on_mock_client(input_, serialization: str) -> Dict[str, any]:
         mock_requests = MagicMock()
@@ -98,11 +244,13 @@ class TestClient(TestCase):
         mock_requests.get.return_value.status_code = 200
         mock_requests.post.return_value.status_code = 200
 
-        user = {'id': FAKE_ID, 'firstname': 'naam', 'organization': {'id': FAKE_ID}}
-        organization = {'id': FAKE_ID, 'name': FAKE_NAME}
+        user = TestClient._user()
+        organization = TestClient._organization()
 
-        # The client will first send a post request for authentication, then for retrieving results.
-        mock_requests.get.return_value.json.side_effect = [user, organization, mock_result_response]
+        # The client will first send a post request for authentication, then
+        # for retrieving results.
+        mock_requests.get.return_value.json.side_effect = [user, organization,
+                                                           mock_result_response]
 
         with patch.multiple('vantage6.client', requests=mock_requests, jwt=mock_jwt):
             client = TestClient.setup_client()
@@ -111,6 +259,14 @@ class TestClient(TestCase):
 
             return results
 
+    @staticmethod
+    def _user() -> dict:
+        return {'id': FAKE_ID, 'firstname': 'naam', 'organization': {'id': FAKE_ID}}
+
+    @staticmethod
+    def _organization() -> dict:
+        return {'id': FAKE_ID, 'name': FAKE_NAME}
+
     @staticmethod
     def setup_client() -> Client:
         client = Client(HOST, PORT)
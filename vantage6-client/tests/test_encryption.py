@@ -0,0 +1,149 @@
+import io
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from vantage6.common import Singleton, bytes_to_base64s
+from vantage6.client.encryption import RSACryptor, DummyCryptor, CHUNK_SIZE
+
+MESSAGE = b'some input for an algorithm' * 100
+
+# spans several chunks, and does not end at a chunk boundary
+LARGE_MESSAGE = os.urandom(3 * CHUNK_SIZE + 1001)
+
+
+class ShortReads(io.BytesIO):
+    """File-like object that returns less bytes than requested."""
+    def read(self, size=-1):
+        return super().read(min(size, 1000) if size > 0 else size)
+
+
+def generate_private_key():
+    return rsa.generate_private_key(
+        backend=default_backend(),
+        key_size=2048,
+        public_exponent=65537
+    )
+
+
+def public_key_str(private_key):
+    return bytes_to_base64s(RSACryptor.create_public_key_bytes(private_key))
+
+
+class TestRSACryptor(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.private_keys = {id_: generate_private_key() for id_ in [1, 2, 3]}
+
+        Singleton._instances.pop(RSACryptor, None)
+        with tempfile.TemporaryDirectory() as tmp:
+            key_file = Path(tmp) / 'private_key.pem'
+            key_file.write_bytes(cls.private_keys[1].private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.TraditionalOpenSSL,
+                encryption_algorithm=serialization.NoEncryption()
+            ))
+            cls.cryptor = RSACryptor(key_file)
+
+    @classmethod
+    def tearDownClass(cls):
+        Singleton._instances.pop(RSACryptor, None)
+
+    def decrypt_as(self, organization_id, data):
+        self.cryptor.private_key = self.private_keys[organization_id]
+        return self.cryptor.decrypt_str_to_bytes(data)
+
+    def test_encrypt_decrypt(self):
+        encrypted = self.cryptor.encrypt_bytes_to_str(
+            MESSAGE, public_key_str(self.private_keys[2])
+        )
+        assert self.decrypt_as(2, encrypted) == MESSAGE
+
+    def test_encrypt_multi(self):
+        public_keys = {
+            id_: public_key_str(key) for id_, key in self.private_keys.items()
+        }
+        shared, keys = self.cryptor.encrypt_bytes_to_str_multi(
+            MESSAGE, public_keys
+        )
+
+        # the message is encrypted only once
+        assert len(shared) > len(MESSAGE)
+        assert all(len(key) < len(MESSAGE) for key in keys.values())
+
+        for id_ in self.private_keys:
+            assert self.decrypt_as(id_, keys[id_] + shared) == MESSAGE
+
+        # the key of another organization can not be used
+        with self.assertRaises(ValueError):
+            self.decrypt_as(1, keys[2] + shared)
+
+    def test_encrypt_decrypt_stream(self):
+        encrypted = io.BytesIO()
+        self.cryptor.encrypt_stream(
+            io.BytesIO(LARGE_MESSAGE), encrypted,
+            public_key_str(self.private_keys[2])
+        )
+
+        # same format as the string based encryption
+        encrypted = encrypted.getvalue().decode()
+        assert self.decrypt_as(2, encrypted) == LARGE_MESSAGE
+
+        decrypted = io.BytesIO()
+        self.cryptor.private_key = self.private_keys[2]
+        self.cryptor.decrypt_stream(io.StringIO(encrypted), decrypted)
+        assert decrypted.getvalue() == LARGE_MESSAGE
+
+    def test_encrypt_decrypt_binary_stream(self):
+        encrypted = io.BytesIO()
+        self.cryptor.encrypt_stream(
+            io.BytesIO(LARGE_MESSAGE), encrypted,
+            public_key_str(self.private_keys[2]), binary=True
+        )
+
+        # only the message is not base64 encoded
+        assert len(encrypted.getvalue()) < len(LARGE_MESSAGE) + 1000
+
+        encrypted.seek(0)
+        decrypted = io.BytesIO()
+        self.cryptor.private_key = self.private_keys[2]
+        self.cryptor.decrypt_stream(encrypted, decrypted, binary=True)
+        assert decrypted.getvalue() == LARGE_MESSAGE
+
+    def test_decrypt_stream_short_reads(self):
+        encrypted = self.cryptor.encrypt_bytes_to_str(
+            LARGE_MESSAGE, public_key_str(self.private_keys[3])
+        )
+
+        decrypted = io.BytesIO()
+        self.cryptor.private_key = self.private_keys[3]
+        self.cryptor.decrypt_stream(ShortReads(encrypted.encode()), decrypted)
+        assert decrypted.getvalue() == LARGE_MESSAGE
+
+
+class TestDummyCryptor(TestCase):
+
+    def test_encrypt_multi(self):
+        cryptor = DummyCryptor()
+        shared, keys = cryptor.encrypt_bytes_to_str_multi(
+            MESSAGE, {1: None, 2: None}
+        )
+        assert cryptor.decrypt_str_to_bytes(keys[1] + shared) == MESSAGE
+        assert cryptor.decrypt_str_to_bytes(keys[2] + shared) == MESSAGE
+
+    def test_encrypt_decrypt_stream(self):
+        cryptor = DummyCryptor()
+        encrypted = io.BytesIO()
+        cryptor.encrypt_stream(ShortReads(LARGE_MESSAGE), encrypted, None)
+        encrypted = encrypted.getvalue().decode()
+        assert cryptor.decrypt_str_to_bytes(encrypted) == LARGE_MESSAGE
+
+        decrypted = io.BytesIO()
+        cryptor.decrypt_stream(io.StringIO(encrypted), decrypted)
+        assert decrypted.getvalue() == LARGE_MESSAGE
@@ -4,6 +4,7 @@ vantage6 clients
 This module is contains a base client. From this base client the container
 client (client used by master algorithms) and the user client are derived.
 """
+import io
 import logging
 import pickle
 import time
@@ -13,14 +14,21 @@ import requests
 import pyfiglet
 import json as json_lib
 
+from http import HTTPStatus
 from pathlib import Path
-from typing import Tuple
+from typing import BinaryIO, Tuple
 
 from vantage6.common import bytes_to_base64s, base64s_to_bytes
-from vantage6.common.globals import APPNAME
+from vantage6.common.globals import (
+    APPNAME,
+    FEATURE_SHARED_INPUT,
+    FEATURE_RESULT_PAYLOAD
+)
 from vantage6.client import serialization, deserialization
 from vantage6.client.filter import post_filtering
 from vantage6.client.encryption import RSACryptor, DummyCryptor
+from vantage6.client.cache import PublicKeyCache
+from vantage6.client.events import PublicKeyEvents, ResultEvents
 
 
 module_name = __name__.split('.')[1]
@@ -59,6 +67,10 @@ class ClientBase(object):
     to authenticate, generic request, creating tasks and result retrieval.
     """
 
+    # fields of results that are left out of the JSON when a single result
+    # is retrieved, if the server can send them as binary data instead
+    binary_payload_fields = ['result']
+
     def __init__(self, host: str, port: int, path: str = '/api'):
         """Basic setup for the client
 
@@ -87,6 +99,12 @@ class ClientBase(object):
         self.cryptor = None
         self.whoami = None
 
+        # public keys of organizations
+        self.public_keys = PublicKeyCache()
+
+        # optional API features of the server, obtained on first use
+        self._server_features = None
+
     @property
     def name(self) -> str:
         """Return the node's/client's name"""
@@ -214,6 +232,71 @@ class ClientBase(object):
 
         return response.json()
 
+    def _payload_request(self, method: str, id: int, params: dict = None,
+                         data: BinaryIO = None, first_try: bool = True
+                         ) -> requests.Response:
+        """Send binary data to, or receive it from, /result/<id>/payload
+
+        Like `request`, connection errors are retried and the token is
+        refreshed once if the server responds with an error.
+        """
+        url = self.generate_path_to(f"result/{id}/payload")
+        self.log.debug(f'Making request: {method.upper()} | {url} | {params}')
+
+        headers = self.headers
+        if data is not None:
+            headers['Content-Type'] = 'application/octet-stream'
+            data.seek(0)
+
+        try:
+            response = requests.request(method, url, headers=headers,
+                                        params=params, data=data,
+                                        stream=True)
+        except requests.exceptions.ConnectionError as e:
+            self.log.error('Connection error... Retrying')
+            self.log.debug(e)
+            time.sleep(1)
+            return self._payload_request(method, id, params, data, first_try)
+
+        if response.status_code > 210:
+            self.log.error(
+                f'Server responded with error code: {response.status_code}')
+            if first_try:
+                self.refresh_token()
+                return self._payload_request(method, id, params, data,
+                                             first_try=False)
+        return response
+
+    def get_result_payload(self, id: int, fp: BinaryIO,
+                           field: str = 'result') -> bool:
+        """Download the result (or input) of a result as binary data
+
+        The payload is decrypted while it is downloaded and written to
+        `fp`, so it never needs to be in memory completely. Only available
+        if the server supports `FEATURE_RESULT_PAYLOAD`.
+
+        Parameters
+        ----------
+        id : int
+            Id of the result
+        fp : BinaryIO
+            File-like object to write the decrypted payload to
+        field : str, optional
+            What to download, 'result' or 'input', by default 'result'
+
+        Returns
+        -------
+        bool
+            False if there is no payload or it could not be retrieved
+        """
+        response = self._payload_request('get', id, params={'field': field})
+        if response.status_code != HTTPStatus.OK:
+            return False
+
+        response.raw.decode_content = True
+        self.cryptor.decrypt_stream(response.raw, fp, binary=True)
+        return True
+
     def setup_encryption(self, private_key_file: str) -> None:
         """Enable the encryption module fot the communication
 
@@ -272,10 +355,55 @@ class ClientBase(object):
                 method="patch",
                 json={"public_key": cryptor.public_key_str}
             )
+            self.public_keys.invalidate(self.whoami.organization_id)
             self.log.info("The public key on the server is updated!")
 
         self.cryptor = cryptor
 
+    def get_public_key(self, organization_id: int) -> str:
+        """Get the public key of an organization
+
+        The key is obtained from the public key cache, and only retrieved
+        from the server if it is not cached (anymore).
+
+        Parameters
+        ----------
+        organization_id : int
+            Id of the organization
+
+        Returns
+        -------
+        str
+            Public key of the organization, None if it could not be
+            retrieved
+        """
+        return self.public_keys.get(
+            organization_id,
+            lambda id_: self.request(f"organization/{id_}").get("public_key")
+        )
+
+    def server_supports(self, feature: str) -> bool:
+        """Check whether the server supports an optional API feature
+
+        The features are retrieved from the server only once.
+
+        Parameters
+        ----------
+        feature : str
+            Name of the feature, e.g. `FEATURE_SHARED_INPUT`
+
+        Returns
+        -------
+        bool
+            True if the server supports the feature
+        """
+        if self._server_features is None:
+            response = self.request("version")
+            features = response.get("features") \
+                if isinstance(response, dict) else None
+            self._server_features = features or []
+        return feature in self._server_features
+
     def authenticate(self, credentials: dict,
                      path: str = "token/user") -> None:
         """Authenticate to the vantage6-server
@@ -357,7 +485,9 @@ class ClientBase(object):
                   data_format=LEGACY, database: str = 'default') -> dict:
         """Post a new task at the server
 
-        It will also encrypt `input_` for each receiving organization.
+        It will also encrypt `input_` for each receiving organization. If
+        the server supports it, the input is encrypted only once and shared
+        by the organizations, which each receive the encrypted key to it.
 
         Parameters
         ----------
@@ -399,26 +529,33 @@ class ClientBase(object):
             serialized_input = data_format.encode() + b'.' \
                 + serialization.serialize(input_, data_format)
 
-        organization_json_list = []
-        for org_id in organization_ids:
-            pub_key = self.request(f"organization/{org_id}").get("public_key")
-            # pub_key = base64s_to_bytes(pub_key)
-            # self.log.debug(pub_key)
-
-            organization_json_list.append({
-                "id": org_id,
-                "input": self.cryptor.encrypt_bytes_to_str(serialized_input,
-                                                           pub_key)
-            })
-
-        return self.request('task', method='post', json={
+        task_json = {
             "name": name,
             "image": image,
             "collaboration_id": collaboration_id,
             "description": description,
-            "organizations": organization_json_list,
             'database': database
-        })
+        }
+
+        pub_keys = {id_: self.get_public_key(id_) for id_ in organization_ids}
+        if len(organization_ids) > 1 and \
+                self.server_supports(FEATURE_SHARED_INPUT):
+            shared_input, inputs = self.cryptor.encrypt_bytes_to_str_multi(
+                serialized_input, pub_keys
+            )
+            task_json["shared_input"] = shared_input
+        else:
+            inputs = {
+                id_: self.cryptor.encrypt_bytes_to_str(serialized_input, key)
+                for id_, key in pub_keys.items()
+            }
+
+        task_json["organizations"] = [
+            {"id": org_id, "input": inputs[org_id]}
+            for org_id in organization_ids
+        ]
+
+        return self.request('task', method='post', json=task_json)
 
     def get_results(self, id: int = None, state: str = None,
                     include_task: bool = False, task_id: int = None,
@@ -431,6 +568,10 @@ class ClientBase(object):
         key at the server is not derived from the currently private key
         or when the result is not from your organization.
 
+        If the server supports it, a single result is downloaded separately
+        as binary data, which is more compact than JSON. A list of results
+        is retrieved in a single request, so it is not.
+
         Parameters
         ----------
         id : int, optional
@@ -454,6 +595,13 @@ class ClientBase(object):
         # Determine endpoint and create dict with query parameters
         endpoint = 'result' if not id else f'result/{id}'
 
+        params = dict(params)
+        # a payload request per result would undo the batching of a list
+        binary_payloads = bool(id) and \
+            self.server_supports(FEATURE_RESULT_PAYLOAD)
+        if binary_payloads:
+            params['exclude'] = self.binary_payload_fields
+
         if state:
             params['state'] = state
         if include_task:
@@ -477,14 +625,10 @@ class ClientBase(object):
             wrapper = results
             results = results['data']
 
-        if id:
-            # Single result
-            self._decrypt_result(results)
-
-        else:
-            # Multiple results
-            for result in results:
-                self._decrypt_result(result)
+        for result in ([results] if id else results):
+            self._decrypt_result(result)
+            if binary_payloads:
+                self._get_binary_payloads(result)
 
         if 'wrapper' in locals():
             wrapper['data'] = results
@@ -501,17 +645,19 @@ class ClientBase(object):
         assert self.cryptor, "Encryption has not been initialized"
         cryptor = self.cryptor
         try:
-            self.log.info('Decrypting input')
-            # TODO this only works when the results belong to the
-            # same organization... We should make different implementation
-            # of get_results
-            result["input"] = cryptor.decrypt_str_to_bytes(result["input"])
+            if "input" in result:
+                self.log.info('Decrypting input')
+                # TODO this only works when the results belong to the
+                # same organization... We should make different
+                # implementation of get_results
+                result["input"] = \
+                    cryptor.decrypt_str_to_bytes(result["input"])
 
         except Exception as e:
             self.log.debug(e)
 
         try:
-            if result["result"]:
+            if result.get("result"):
                 self.log.info('Decrypting result')
                 result["result"] = \
                     cryptor.decrypt_str_to_bytes(result["result"])
@@ -521,6 +667,21 @@ class ClientBase(object):
             self.log.error(e)
             # raise
 
+    def _get_binary_payloads(self, result: dict):
+        """Helper to download (and decrypt) the fields of a result that
+        were left out of the JSON. Changes are made *in-place*."""
+        for field in self.binary_payload_fields:
+            # there is no result before the result is finished
+            if field == 'result' and not result.get('finished_at'):
+                continue
+            fp = io.BytesIO()
+            try:
+                if self.get_result_payload(result['id'], fp, field=field):
+                    result[field] = fp.getvalue()
+            except ValueError as e:
+                self.log.error(f"Could not decrypt/decode {field}.")
+                self.log.error(e)
+
     class SubClient:
         """Create sub groups of commands using this SubClient"""
         def __init__(self, parent):
@@ -556,6 +717,9 @@ class UserClient(ClientBase):
         self.node = self.Node(self)
         self.rule = self.Rule(self)
 
+        # invalidates cached public keys when the server reports a new one
+        self.public_key_events = PublicKeyEvents()
+
         # Display welcome message
         self.log.info(" Welcome to")
         for line in pyfiglet.figlet_format(APPNAME, font='big').split('\n'):
@@ -628,6 +792,109 @@ class UserClient(ClientBase):
             self.log.info('--> Retrieving additional user info failed!')
             self.log.debug(e)
 
+        url = f'{self.host}:{self.port}' if self.port else self.host
+        self.public_key_events.connect(url, self.headers,
+                                       self.public_keys.invalidate)
+
+    def wait_for_results(self, task_id: int, timeout: float = None,
+                         interval: float = 1,
+                         max_interval: float = 30) -> list:
+        """Wait for all results of a task to be finished
+
+        Each result is retrieved (and decrypted) once, as soon as its node
+        reports that it is finished. The client listens to the status updates
+        of the server for this, which requires the `python-socketio` package.
+        If the status updates are not available, the server is polled with
+        increasing intervals instead.
+
+        Parameters
+        ----------
+        task_id : int
+            Id of the task
+        timeout : float, optional
+            Maximum number of seconds to wait, by default no limit
+        interval : float, optional
+            Seconds before the status of the results is checked the first
+            time (without status updates), by default 1. The interval is
+            doubled after each check
+        max_interval : float, optional
+            Maximum number of seconds between two checks, by default 30
+
+        Returns
+        -------
+        list
+            The results of the task, as returned by `result.from_task`
+
+        Raises
+        ------
+        TimeoutError
+            When not all results are finished within `timeout` seconds
+        """
+        task = self.request(f'task/{task_id}')
+        if 'collaboration' not in task:
+            raise ValueError(f'Task id={task_id} not found!')
+        deadline = time.monotonic() + timeout if timeout is not None \
+            else None
+
+        events = ResultEvents()
+        url = f'{self.host}:{self.port}' if self.port else self.host
+        events.connect(url, self.headers, task['collaboration']['id'])
+
+        results = {}
+        try:
+            # the results that are finished already are retrieved first,
+            # after that only when a status update is received or when it is
+            # time to check again
+            statuses = self._result_statuses(task_id)
+            if not statuses:
+                raise ValueError(f'No results found for task id={task_id}!')
+            order = list(statuses)
+            while True:
+                for id_, finished_at in statuses.items():
+                    if finished_at and id_ not in results:
+                        results[id_] = self.result.get(id_)
+                if len(results) == len(order):
+                    return [results[id_] for id_ in order]
+
+                wait = interval
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        raise TimeoutError(
+                            f'{len(order) - len(results)} result(s) of task '
+                            f'id={task_id} are not finished!'
+                        )
+
+                updated_id = None
+                if events.connected:
+                    updated_id = events.wait(wait)
+                else:
+                    time.sleep(wait)
+
+                if updated_id in order and updated_id not in results:
+                    result = self.request(f'result/{updated_id}',
+                                          params={'fields': 'finished_at'})
+                    statuses = {updated_id: result.get('finished_at')}
+                elif updated_id is None:
+                    statuses = self._result_statuses(task_id)
+                    interval = min(interval * 2, max_interval)
+                else:
+                    # status update of a result of another task
+                    statuses = {}
+        finally:
+            events.disconnect()
+
+    def _result_statuses(self, task_id: int) -> dict:
+        """Returns the `finished_at` of each result of a task, by id."""
+        results = self.request('result', params={
+            'task_id': task_id, 'fields': 'finished_at'
+        })
+        if not isinstance(results, list):
+            self.log.warn('Retrieving the status of the results failed')
+            self.log.debug(results)
+            return {}
+        return {result['id']: result['finished_at'] for result in results}
+
     class Util(ClientBase.SubClient):
         """Collection of general utilities"""
 
@@ -0,0 +1,105 @@
+""" Public key cache
+
+The public keys of organizations are needed to encrypt the input of tasks
+and the results of algorithms. Rather than retrieving the public key from
+the server for every message, they are kept in this cache.
+
+Cached keys expire after a while, so that a changed public key is picked up
+eventually. When the server notifies that the public key of an organization
+has changed, its entry should be invalidated right away. Nodes always
+receive these notifications, user clients only when the `events` extra
+(`python-socketio`) is installed. Without it, a changed key is used by a user
+client once the cached key has expired.
+"""
+import time
+import logging
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable
+
+from vantage6.common import logger_name
+from vantage6.client.constants import (
+    PUBLIC_KEY_CACHE_TTL,
+    PUBLIC_KEY_CACHE_SIZE
+)
+
+
+class PublicKeyCache:
+    """Public keys of organizations, keyed by organization id."""
+
+    def __init__(self, ttl: float = PUBLIC_KEY_CACHE_TTL,
+                 max_size: int = PUBLIC_KEY_CACHE_SIZE):
+        """Create an empty cache
+
+        Parameters
+        ----------
+        ttl : float, optional
+            Number of seconds a public key is kept in the cache
+        max_size : int, optional
+            Maximum number of public keys in the cache. When the cache is
+            full, the least recently used key is removed
+        """
+        self.log = logging.getLogger(logger_name(__name__))
+        self.ttl = ttl
+        self.max_size = max_size
+
+        # organization_id -> (public_key, expiration time)
+        self.__keys = OrderedDict()
+        self.__lock = Lock()
+
+    def get(self, organization_id: int,
+            fetch: Callable[[int], str]) -> str:
+        """Get the public key of an organization
+
+        Parameters
+        ----------
+        organization_id : int
+            Id of the organization
+        fetch : Callable[[int], str]
+            Function that retrieves the public key of an organization from
+            the server, only called if the key is not in the cache (anymore)
+
+        Returns
+        -------
+        str
+            Public key of the organization
+        """
+        with self.__lock:
+            entry = self.__keys.get(organization_id)
+            if entry and entry[1] > time.monotonic():
+                self.__keys.move_to_end(organization_id)
+                return entry[0]
+
+        self.log.debug("Retrieving public key of organization="
+                       f"{organization_id}")
+        public_key = fetch(organization_id)
+
+        # do not cache missing keys, the organization may upload one later
+        if public_key:
+            with self.__lock:
+                self.__keys[organization_id] = \
+                    (public_key, time.monotonic() + self.ttl)
+                self.__keys.move_to_end(organization_id)
+                while len(self.__keys) > self.max_size:
+                    self.__keys.popitem(last=False)
+
+        return public_key
+
+    def invalidate(self, organization_id: int = None) -> None:
+        """Remove a public key from the cache
+
+        Parameters
+        ----------
+        organization_id : int, optional
+            Id of the organization of which the key has changed. If not
+            specified, all keys are removed
+        """
+        with self.__lock:
+            if organization_id is None:
+                self.__keys.clear()
+            else:
+                self.__keys.pop(organization_id, None)
+
+    def __len__(self) -> int:
+        return len(self.__keys)
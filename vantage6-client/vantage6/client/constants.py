@@ -11,4 +11,12 @@ PACKAGE_FOLDER = Path(__file__).parent.parent.parent
 APPNAME = "vantage6"
 
 # with open(Path(PACKAGE_FOLDER) / APPNAME / "client" / "VERSION") as f:
-#     VERSION = f.read()
\ No newline at end of file
+#     VERSION = f.read()
+
+#
+#   PUBLIC KEY CACHE
+#
+# Number of seconds public keys of organizations are cached, and the maximum
+# number of public keys in the cache
+PUBLIC_KEY_CACHE_TTL = 600
+PUBLIC_KEY_CACHE_SIZE = 1000
@@ -12,12 +12,26 @@ In the case we are sending messages (input/results) we need to encrypt
 it using the public key of the receiving organization. (retreiving
 these public keys is outside the scope of this module).
 
+When the same message is send to multiple organizations, it can be
+encrypted once using `encrypt_bytes_to_str_multi`. Only the (symmetric)
+key is then encrypted for each of the receiving organizations.
+
+Large messages can be encrypted and decrypted in chunks from one file-like
+object to another using `encrypt_stream` and `decrypt_stream`, so that they
+never have to be in memory completely. The encrypted stream has the same
+format as the string produced by `encrypt_bytes_to_str`. Optionally, the
+encrypted message itself is written as raw bytes instead of base64
+(`binary=True`), which is used when payloads are transferred as binary data.
+
 TODO handle no public key from other organization (should that happen here)
 """
 import os
+import base64
 import logging
+import itertools
 
 from pathlib import Path
+from typing import BinaryIO, Dict, IO, Tuple
 
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization
@@ -32,11 +46,18 @@ from vantage6.common import (
     Singleton,
     logger_name,
     bytes_to_base64s,
-    base64s_to_bytes
+    base64s_to_bytes,
+    read_chunks,
+    aligned_chunks
 )
+from vantage6.common.globals import STRING_ENCODING
 
 SEPARATOR = '$'
 
+# Number of bytes that are read at once when encrypting or decrypting a
+# stream. Needs to be a multiple of 3 (bytes) and 4 (base64 characters).
+CHUNK_SIZE = 3 * 4 * 2**14
+
 
 # ------------------------------------------------------------------------------
 # CryptorBase
@@ -61,10 +82,59 @@ class CryptorBase(metaclass=Singleton):
         """Encrypt bytes in `data` using a (base64 encoded) public key."""
         return self.bytes_to_str(data)
 
+    def encrypt_bytes_to_str_multi(
+            self, data: bytes, pubkeys_base64s: Dict[int, str]
+            ) -> Tuple[str, Dict[int, str]]:
+        """Encrypt bytes in `data` once for multiple public keys.
+
+        Returns the encrypted message, which is the same for all receivers,
+        and for each key the part that is specific to that receiver. The
+        receiver can decrypt the concatenation of both using
+        `decrypt_str_to_bytes`.
+        """
+        return self.bytes_to_str(data), {id_: '' for id_ in pubkeys_base64s}
+
     def decrypt_str_to_bytes(self, data: str) -> bytes:
         """Decrypt base64 encoded *string* `data."""
         return self.str_to_bytes(data)
 
+    def encrypt_stream(self, in_fp: BinaryIO, out_fp: BinaryIO,
+                       pubkey_base64s: str, binary: bool = False) -> None:
+        """Encrypt the bytes read from `in_fp` and write them to `out_fp`.
+
+        Parameters
+        ----------
+        in_fp : BinaryIO
+            File-like object to read the message from
+        out_fp : BinaryIO
+            File-like object to write the encrypted message to
+        pubkey_base64s : str
+            (base64 encoded) public key of the receiver
+        binary : bool, optional
+            Write the encrypted message as raw bytes instead of base64, by
+            default False
+        """
+        for chunk in aligned_chunks(read_chunks(in_fp, CHUNK_SIZE), 3):
+            out_fp.write(chunk if binary else base64.b64encode(chunk))
+
+    def decrypt_stream(self, in_fp: IO, out_fp: BinaryIO,
+                       binary: bool = False) -> None:
+        """Decrypt the message read from `in_fp` and write it to `out_fp`.
+
+        Parameters
+        ----------
+        in_fp : IO
+            Binary or text file-like object to read the encrypted message
+            from
+        out_fp : BinaryIO
+            File-like object to write the decrypted message to
+        binary : bool, optional
+            The encrypted message is in raw bytes instead of base64, by
+            default False
+        """
+        for chunk in aligned_chunks(read_chunks(in_fp, CHUNK_SIZE), 4):
+            out_fp.write(chunk if binary else base64.b64decode(chunk))
+
 
 # ------------------------------------------------------------------------------
 # DummyCryptor
@@ -151,19 +221,142 @@ class RSACryptor(CryptorBase):
 
     def encrypt_bytes_to_str(self, data: bytes, pubkey_base64s: str) -> str:
         """Encrypt bytes in `data` using a (base64 encoded) public key."""
+        encrypted_msg, encrypted_keys = self.encrypt_bytes_to_str_multi(
+            data, {None: pubkey_base64s}
+        )
+        return encrypted_keys[None] + encrypted_msg
+
+    def encrypt_bytes_to_str_multi(
+            self, data: bytes, pubkeys_base64s: Dict[int, str]
+            ) -> Tuple[str, Dict[int, str]]:
+        """Encrypt bytes in `data` once for multiple public keys.
+
+        The message is encrypted with a single shared key, which is then
+        encrypted with each of the public keys.
+
+        Parameters
+        ----------
+        data : bytes
+            Message to encrypt
+        pubkeys_base64s : Dict[int, str]
+            (base64 encoded) public keys of the receivers, by receiver id
+
+        Returns
+        -------
+        Tuple[str, Dict[int, str]]
+            Encrypted message and for each receiver id the encrypted shared
+            key. Appending the message to the key of a receiver gives the
+            same format as `encrypt_bytes_to_str`.
+        """
 
         # Use the shared key for symmetric encryption/decryption of the payload
         shared_key = os.urandom(32)
         iv_bytes = os.urandom(16)
 
-        cipher = Cipher(
+        encryptor = self._cipher(shared_key, iv_bytes).encryptor()
+        encrypted_msg_bytes = encryptor.update(data) + encryptor.finalize()
+
+        iv = self.bytes_to_str(iv_bytes)
+        encrypted_msg = self.bytes_to_str(encrypted_msg_bytes)
+
+        encrypted_keys = {
+            id_: self._encrypt_key(shared_key, pubkey_base64s) + SEPARATOR
+            for id_, pubkey_base64s in pubkeys_base64s.items()
+        }
+
+        return iv + SEPARATOR + encrypted_msg, encrypted_keys
+
+    def encrypt_stream(self, in_fp: BinaryIO, out_fp: BinaryIO,
+                       pubkey_base64s: str, binary: bool = False) -> None:
+        """Encrypt the bytes read from `in_fp` and write them to `out_fp`.
+
+        The message is encrypted in chunks, so memory usage does not depend
+        on the size of the message.
+
+        Parameters
+        ----------
+        in_fp : BinaryIO
+            File-like object to read the message from
+        out_fp : BinaryIO
+            File-like object to write the encrypted message to, in the same
+            format as `encrypt_bytes_to_str`
+        pubkey_base64s : str
+            (base64 encoded) public key of the receiver
+        binary : bool, optional
+            Write the encrypted message as raw bytes instead of base64. The
+            encrypted key and iv are base64 encoded either way, by default
+            False
+        """
+        shared_key = os.urandom(32)
+        iv_bytes = os.urandom(16)
+
+        header = SEPARATOR.join([
+            self._encrypt_key(shared_key, pubkey_base64s),
+            self.bytes_to_str(iv_bytes),
+            ''
+        ])
+        out_fp.write(header.encode(STRING_ENCODING))
+
+        # CTR mode does not pad, so finalize() never returns any bytes
+        encryptor = self._cipher(shared_key, iv_bytes).encryptor()
+        for chunk in aligned_chunks(read_chunks(in_fp, CHUNK_SIZE), 3):
+            chunk = encryptor.update(chunk)
+            out_fp.write(chunk if binary else base64.b64encode(chunk))
+        encryptor.finalize()
+
+    def decrypt_stream(self, in_fp: IO, out_fp: BinaryIO,
+                       binary: bool = False) -> None:
+        """Decrypt the message read from `in_fp` and write it to `out_fp`.
+
+        The message is decrypted in chunks, so memory usage does not depend
+        on the size of the message.
+
+        Parameters
+        ----------
+        in_fp : IO
+            Binary or text file-like object to read the encrypted message
+            from, in the format of `encrypt_bytes_to_str`
+        out_fp : BinaryIO
+            File-like object to write the decrypted message to
+        binary : bool, optional
+            The encrypted message is in raw bytes instead of base64, by
+            default False
+        """
+        separator = SEPARATOR.encode(STRING_ENCODING)
+        chunks = read_chunks(in_fp, CHUNK_SIZE)
+
+        # the encrypted key and iv are at the start of the message
+        header = b''
+        for chunk in chunks:
+            header += chunk
+            if header.count(separator) >= 2:
+                break
+        (encrypted_key, iv, encrypted_msg) = header.split(separator, 2)
+
+        shared_key = self.private_key.decrypt(
+            base64.b64decode(encrypted_key),
+            padding.PKCS1v15()
+        )
+        decryptor = self._cipher(shared_key, base64.b64decode(iv)).decryptor()
+
+        chunks = itertools.chain([encrypted_msg], chunks)
+        if not binary:
+            chunks = map(base64.b64decode, aligned_chunks(chunks, 4))
+        for chunk in chunks:
+            out_fp.write(decryptor.update(chunk))
+        out_fp.write(decryptor.finalize())
+
+    @staticmethod
+    def _cipher(shared_key: bytes, iv_bytes: bytes) -> Cipher:
+        """AES cipher used for the payload."""
+        return Cipher(
             algorithms.AES(shared_key),
             modes.CTR(iv_bytes),
             backend=default_backend()
         )
 
-        encryptor = cipher.encryptor()
-        encrypted_msg_bytes = encryptor.update(data) + encryptor.finalize()
+    def _encrypt_key(self, shared_key: bytes, pubkey_base64s: str) -> str:
+        """Encrypt the shared key using a (base64 encoded) public key."""
 
         # Create a public key instance.
         pubkey = load_pem_public_key(
@@ -175,12 +368,7 @@ class RSACryptor(CryptorBase):
             shared_key,
             padding.PKCS1v15()
         )
-
-        encrypted_key = self.bytes_to_str(encrypted_key_bytes)
-        iv = self.bytes_to_str(iv_bytes)
-        encrypted_msg = self.bytes_to_str(encrypted_msg_bytes)
-
-        return SEPARATOR.join([encrypted_key, iv, encrypted_msg])
+        return self.bytes_to_str(encrypted_key_bytes)
 
     def decrypt_str_to_bytes(self, data: str) -> bytes:
         """Decrypt base64 encoded *string* `data."""
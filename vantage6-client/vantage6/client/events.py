@@ -0,0 +1,169 @@
+""" Result status and public key events
+
+The server notifies connected clients over a websocket (the socketio
+namespace `/tasks`) when the status of a result changes. Listening to these
+events allows a client to retrieve a result as soon as it is finished,
+rather than polling the server for it. The server also notifies all users
+when the public key of an organization changes, so that the key is not
+used from the cache anymore.
+
+The websocket connection requires the `python-socketio` package. When it is
+not installed, or the connection can not be made, the client has to fall
+back to polling.
+"""
+import queue
+import logging
+
+from typing import Callable, Optional
+
+from vantage6.common import logger_name
+
+try:
+    import socketio
+except ImportError:
+    socketio = None
+
+
+class ResultEvents:
+    """Status updates of the results in a collaboration."""
+
+    def __init__(self):
+        self.log = logging.getLogger(logger_name(__name__))
+        self.__sio = None
+
+        # ids of results of which the status has changed
+        self.__updates = queue.Queue()
+
+    @property
+    def connected(self) -> bool:
+        """Whether status updates are being received."""
+        return bool(self.__sio and self.__sio.connected)
+
+    def connect(self, url: str, headers: dict,
+                collaboration_id: int) -> bool:
+        """Start listening to the status updates of a collaboration
+
+        Parameters
+        ----------
+        url : str
+            Address of the server, including protocol and port
+        headers : dict
+            Headers to authenticate the connection
+        collaboration_id : int
+            Id of the collaboration of which the updates are received
+
+        Returns
+        -------
+        bool
+            Whether the connection was made
+        """
+        if socketio is None:
+            self.log.debug("Package 'python-socketio' is not installed, "
+                           "status updates are not available")
+            return False
+
+        sio = socketio.Client()
+        sio.on('status_update', self._on_status_update, namespace='/tasks')
+        try:
+            sio.connect(url, headers=headers, namespaces=['/tasks'])
+            sio.emit('join_room', f'collaboration_{collaboration_id}',
+                     namespace='/tasks')
+        except Exception as e:
+            self.log.warning('Could not connect to the websocket of the '
+                             'server, status updates are not available')
+            self.log.debug(e)
+            return False
+
+        self.__sio = sio
+        return True
+
+    def _on_status_update(self, data: dict):
+        self.__updates.put(data.get('result_id'))
+
+    def wait(self, timeout: float = None) -> Optional[int]:
+        """Wait for the next status update
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum number of seconds to wait, by default no limit
+
+        Returns
+        -------
+        int or None
+            Id of the result of which the status changed, None if there was
+            no update within `timeout`
+        """
+        try:
+            return self.__updates.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def disconnect(self):
+        """Stop listening to status updates."""
+        if self.__sio:
+            self.__sio.disconnect()
+            self.__sio = None
+
+
+class PublicKeyEvents:
+    """Notifications of organizations that have a new public key."""
+
+    def __init__(self):
+        self.log = logging.getLogger(logger_name(__name__))
+        self.__sio = None
+
+    @property
+    def connected(self) -> bool:
+        """Whether the notifications are being received."""
+        return bool(self.__sio and self.__sio.connected)
+
+    def connect(self, url: str, headers: dict,
+                on_update: Callable[[int], None]) -> bool:
+        """Start listening to the public key notifications
+
+        Users join the room of all users when they connect, to which the
+        notifications are sent.
+
+        Parameters
+        ----------
+        url : str
+            Address of the server, including protocol and port
+        headers : dict
+            Headers to authenticate the connection
+        on_update : Callable[[int], None]
+            Called with the id of the organization of which the public key
+            has changed
+
+        Returns
+        -------
+        bool
+            Whether the connection was made
+        """
+        self.disconnect()
+        if socketio is None:
+            self.log.debug("Package 'python-socketio' is not installed, "
+                           "public keys are only refreshed when they expire")
+            return False
+
+        sio = socketio.Client()
+        sio.on('public_key_updated',
+               lambda data: on_update(data.get('organization_id')),
+               namespace='/tasks')
+        try:
+            sio.connect(url, headers=headers, namespaces=['/tasks'])
+        except Exception as e:
+            self.log.warning('Could not connect to the websocket of the '
+                             'server, public keys are only refreshed when '
+                             'they expire')
+            self.log.debug(e)
+            return False
+
+        self.__sio = sio
+        return True
+
+    def disconnect(self):
+        """Stop listening to the public key notifications."""
+        if self.__sio:
+            self.__sio.disconnect()
+            self.__sio = None
@@ -6,6 +6,7 @@ import string
 import random
 
 from colorama import init, Fore, Style
+from typing import IO, Iterable, Iterator
 
 from ._version import version_info, __version__
 from vantage6.common.globals import STRING_ENCODING
@@ -42,6 +43,31 @@ def base64s_to_bytes(bytes_string):
     return base64.b64decode(bytes_string.encode(STRING_ENCODING))
 
 
+def read_chunks(fp: IO, size: int) -> Iterator[bytes]:
+    """Read a binary or text file-like object in chunks of bytes."""
+    while True:
+        chunk = fp.read(size)
+        if not chunk:
+            return
+        if isinstance(chunk, str):
+            chunk = chunk.encode(STRING_ENCODING)
+        yield chunk
+
+
+def aligned_chunks(chunks: Iterable[bytes], multiple: int) -> Iterator[bytes]:
+    """Regroup chunks so that the length of each chunk, except the last one,
+    is a multiple of `multiple`. Needed to encode/decode base64 in parts."""
+    rest = b''
+    for chunk in chunks:
+        chunk = rest + chunk
+        cut = len(chunk) - len(chunk) % multiple
+        rest = chunk[cut:]
+        if cut:
+            yield chunk[:cut]
+    if rest:
+        yield rest
+
+
 #
 # CLI prints
 #
@@ -22,3 +22,22 @@ DEFAULT_SERVER_IMAGE = "infrastructure/server:petronas"
 PACAKAGE_FOLDER = Path(__file__).parent.parent.parent
 
 VPN_CONFIG_FILE = 'vpn-config.ovpn.conf'
+
+#
+#   SERVER FEATURES
+#
+# Optional features of the server API. The server lists the features it
+# supports at the version endpoint, so that clients know if they can use them
+
+# the input of a task is encrypted once and shared by all organizations,
+# which only receive their own (encrypted) key to it
+FEATURE_SHARED_INPUT = 'shared_input'
+
+# inputs and results can be transferred as binary data at
+# /result/<id>/payload, instead of base64 encoded in JSON
+FEATURE_RESULT_PAYLOAD = 'result_payload'
+
+# the nodes of the assigned organizations receive a `task_assigned` event with
+# the ids of the new task and of their result, in addition to the `new_task`
+# event with only the task id that is sent to the whole collaboration
+FEATURE_TASK_ASSIGNED = 'task_assigned'
@@ -0,0 +1,86 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from vantage6.common import Singleton
+from vantage6.node.metrics import TaskMetrics
+
+
+class TestTaskMetrics(TestCase):
+
+    def setUp(self):
+        # a new instance for each test, instead of the one of the node
+        Singleton._instances.pop(TaskMetrics, None)
+        self.metrics = TaskMetrics(history=2, max_active=2)
+
+    def tearDown(self):
+        Singleton._instances.pop(TaskMetrics, None)
+
+    @patch('vantage6.node.metrics.time.monotonic')
+    def test_record_since(self, monotonic):
+        monotonic.side_effect = [10.0, 12.5]
+        self.metrics.mark(1, 'queued')
+        self.metrics.record_since(1, 'queued', 'queue')
+
+        self.assertEqual(self.metrics.summary()['active'], [
+            {'result_id': 1, 'phases': {'queue': 2.5}}
+        ])
+
+        # the mark is used once, and a missing mark records nothing
+        self.metrics.record_since(1, 'queued', 'queue')
+        self.metrics.record_since(2, 'queued', 'queue')
+        self.assertEqual(self.metrics.summary()['phases']['queue']['count'],
+                         1)
+        self.assertEqual(len(self.metrics.summary()['active']), 1)
+
+    def test_finish(self):
+        for result_id in (1, 2, 3):
+            self.metrics.record(result_id, 'run', result_id)
+            self.metrics.finish(result_id)
+
+        summary = self.metrics.summary()
+        self.assertEqual(summary['active'], [])
+        # only the last `history` tasks are kept
+        self.assertEqual(summary['finished'], [
+            {'result_id': 2, 'phases': {'run': 2}},
+            {'result_id': 3, 'phases': {'run': 3}},
+        ])
+
+        # finishing an unknown task does nothing
+        self.metrics.finish(4)
+        self.assertEqual(len(self.metrics.summary()['finished']), 2)
+
+    def test_summary(self):
+        self.assertEqual(self.metrics.summary(),
+                         {'phases': {}, 'active': [], 'finished': []})
+
+        self.metrics.record(1, 'upload', 1.0)
+        self.metrics.record(1, 'upload', 3.0)
+        self.metrics.record(2, 'upload', 2.0)
+
+        self.assertEqual(self.metrics.summary()['phases'], {
+            'upload': {'count': 3, 'total': 6.0, 'mean': 2.0, 'max': 3.0}
+        })
+        # the durations of a phase that occurs several times are added
+        self.assertEqual(self.metrics.summary()['active'], [
+            {'result_id': 1, 'phases': {'upload': 4.0}},
+            {'result_id': 2, 'phases': {'upload': 2.0}},
+        ])
+
+    def test_discard(self):
+        self.metrics.mark(1, 'queued')
+        self.metrics.discard(1)
+        self.metrics.finish(1)
+
+        summary = self.metrics.summary()
+        self.assertEqual(summary['active'], [])
+        self.assertEqual(summary['finished'], [])
+
+    def test_active_tasks_are_capped(self):
+        for result_id in (1, 2, 3):
+            self.metrics.mark(result_id, 'queued')
+
+        # the oldest task is forgotten
+        self.assertEqual(
+            [task['result_id'] for task in self.metrics.summary()['active']],
+            [2, 3]
+        )
@@ -0,0 +1,96 @@
+from threading import Thread
+from unittest import TestCase
+
+from vantage6.node.task_queue import STATES, TaskQueue
+
+
+class TestTaskQueue(TestCase):
+
+    def test_get_in_order(self):
+        queue = TaskQueue()
+        for id_ in (3, 1, 2):
+            self.assertTrue(queue.put({'id': id_}))
+
+        self.assertEqual([queue.get()['id'] for _ in range(3)], [3, 1, 2])
+        self.assertEqual(queue.qsize(), 0)
+
+    def test_get_waits_for_task(self):
+        queue = TaskQueue()
+        tasks = []
+        worker = Thread(target=lambda: tasks.append(queue.get()))
+        worker.start()
+
+        queue.put({'id': 1})
+        worker.join(timeout=5)
+        self.assertEqual(tasks, [{'id': 1}])
+
+    def test_duplicate_is_rejected_in_every_state(self):
+        queue = TaskQueue()
+        queue.put({'id': 1})
+        for state in STATES:
+            if state == 'starting':
+                queue.get()
+            elif state != 'queued':
+                queue.set_state(1, state)
+            self.assertIn(1, queue)
+            self.assertFalse(queue.put({'id': 1}), state)
+            self.assertEqual(queue.qsize(), 0 if state != 'queued' else 1)
+
+        # a task that is done can be queued again
+        queue.remove(1)
+        self.assertNotIn(1, queue)
+        self.assertTrue(queue.put({'id': 1}))
+
+    def test_set_state_only_moves_forward(self):
+        queue = TaskQueue()
+        queue.put({'id': 1})
+        queue.get()
+
+        queue.set_state(1, 'uploading')
+        queue.set_state(1, 'running')
+        self.assertEqual(queue.status()['states']['uploading'], 1)
+        self.assertEqual(queue.status()['states']['running'], 0)
+
+        # unknown tasks are not added
+        queue.set_state(2, 'running')
+        self.assertNotIn(2, queue)
+
+    def test_remove_in_state(self):
+        queue = TaskQueue()
+        queue.put({'id': 1})
+        queue.put({'id': 2})
+        queue.get()
+        queue.set_state(1, 'running')
+
+        # not removed, the task is running already
+        queue.remove(1, state='starting')
+        self.assertIn(1, queue)
+        queue.remove(1, state='running')
+        self.assertNotIn(1, queue)
+
+        # a queued task is also taken from the queue
+        queue.remove(2, state='queued')
+        self.assertNotIn(2, queue)
+        self.assertEqual(queue.qsize(), 0)
+
+        # removing an unknown task does nothing
+        queue.remove(3)
+
+    def test_status(self):
+        queue = TaskQueue()
+        self.assertEqual(queue.status(), {
+            'queue_depth': 0,
+            'states': {state: 0 for state in STATES}
+        })
+
+        for id_ in range(1, 5):
+            queue.put({'id': id_})
+        queue.get()
+        queue.get()
+        queue.set_state(2, 'running')
+
+        self.assertEqual(queue.status(), {
+            'queue_depth': 2,
+            'states': {'queued': 2, 'starting': 1, 'running': 1,
+                       'uploading': 0}
+        })
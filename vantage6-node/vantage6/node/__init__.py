@@ -4,15 +4,23 @@ A node in its simplest would retrieve a task from the central server by
 an API call, run this task and finally return the results to the central
 server again.
 
-The node application is seperated in 4 threads:
-- main thread, waits for new tasks to be added to the queue and
-    run the tasks
+The node application is seperated in these threads:
+- main thread, starts the task workers and waits for the node to be
+    shut down
+- task worker threads, wait for new tasks to be added to the queue and
+    run the tasks. Multiple tasks are started in parallel, up to the
+    `max_concurrent_tasks` setting
 - listening thread, listens for incommin websocket messages. Which
     are handled by NodeTaskNamespace.
-- speaking thread, waits for results from docker to return and posts
-    them at the central server
+- speaking thread, waits for results from docker to return and hands
+    them to the upload workers
+- upload worker threads, post the results at the central server. Multiple
+    results are uploaded in parallel
 - proxy server thread, provides an interface for master containers
     to post tasks and retrieve results
+- metrics thread, periodically logs how long tasks spend in each phase
+- sync thread, periodically retrieves the open results that the node has
+    missed, or could not retrieve or start before
 """
 import sys
 import os
@@ -22,6 +30,7 @@ import datetime
 import logging
 import queue
 import json
+import functools
 
 from pathlib import Path
 from threading import Thread
@@ -33,10 +42,16 @@ from enum import Enum
 from vantage6.common.docker.addons import (
     ContainerKillListener, check_docker_running, running_in_docker
 )
-from vantage6.common.globals import VPN_CONFIG_FILE
+from vantage6.common.globals import VPN_CONFIG_FILE, FEATURE_TASK_ASSIGNED
 from vantage6.cli.context import NodeContext
 from vantage6.node.context import DockerNodeContext
-from vantage6.node.globals import NODE_PROXY_SERVER_HOSTNAME
+from vantage6.node.globals import (
+    NODE_PROXY_SERVER_HOSTNAME, DEFAULT_MAX_CONCURRENT_TASKS,
+    MAX_CONCURRENT_UPLOADS, UPLOAD_ATTEMPTS, DEFAULT_METRICS_LOG_INTERVAL,
+    DEFAULT_TASK_SYNC_INTERVAL
+)
+from vantage6.node.metrics import TaskMetrics
+from vantage6.node.task_queue import TaskQueue
 from vantage6.node.server_io import NodeClient
 from vantage6.node.proxy_server import app
 from vantage6.node.util import logger_name
@@ -79,8 +94,18 @@ class NodeTaskNamespace(ClientNamespace):
         self.log.info('Disconnected from the server')
 
     def on_new_task(self, task_id):
-        """ New task event."""
+        """ New task event.
+
+        Sent to all nodes in the collaboration. Servers that send the
+        `task_assigned` event only to the assigned nodes are left to that
+        event.
+        """
         if self.node_worker_ref:
+            server_io = self.node_worker_ref.server_io
+            if server_io.server_supports(FEATURE_TASK_ASSIGNED):
+                self.log.debug(f'New task task_id={task_id}, waiting for '
+                               'its assignment')
+                return
             self.node_worker_ref.get_task_and_add_to_queue(task_id)
             self.log.info(f'New task has been added task_id={task_id}')
 
@@ -89,6 +114,21 @@ class NodeTaskNamespace(ClientNamespace):
                 'Task Master Node reference not set is socket namespace'
             )
 
+    def on_task_assigned(self, data):
+        """ A new task is assigned to this node.
+
+        The server sends the ids of the task and of the result of this node.
+        """
+        if self.node_worker_ref:
+            self.node_worker_ref.get_result_and_add_to_queue(
+                data['result_id'])
+            self.log.info(f'New task has been added task_id={data["task_id"]}')
+
+        else:
+            self.log.critical(
+                'Task Master Node reference not set is socket namespace'
+            )
+
     def on_container_failed(self, run_id):
         """A container in the collaboration has failed event.
 
@@ -100,6 +140,20 @@ class NodeTaskNamespace(ClientNamespace):
             f"run_id={run_id} has exited with a non-zero status_code"
         )
 
+    def on_public_key_updated(self, data):
+        """An organization in the collaboration has a new public key."""
+        if self.node_worker_ref:
+            organization_id = data.get('organization_id')
+            self.log.debug(
+                f"Public key of organization={organization_id} has changed")
+            self.node_worker_ref.server_io.public_keys.invalidate(
+                organization_id)
+
+        else:
+            self.log.critical(
+                'Task Master Node reference not set is socket namespace'
+            )
+
     def on_expired_token(self, msg):
         self.log.warning("Your token is no longer valid... reconnecting")
         self.node_worker_ref.socketIO.disconnect()
@@ -151,9 +205,26 @@ class Node(object):
         check_docker_running()
 
         self.config = self.ctx.config
-        self.queue = queue.Queue()
+        self.queue = TaskQueue()
         self._using_encryption = None
 
+        # finished results that are waiting to be uploaded, and the task
+        # metadata of the results that are running (by result id)
+        self.__upload_queue = queue.Queue()
+        self.__task_metadata = {}
+
+        # highest result id handled by a sync with the server, the next
+        # sync only retrieves the results that were assigned after it
+        self.__last_result_id = None
+
+        # ids of open results that could not be retrieved or started, these
+        # are retried by the next sync
+        self.__retry_result_ids = set()
+
+        # ids of open results that are not run by this node (e.g. because
+        # their image is not allowed), these are not retrieved again
+        self.__rejected_result_ids = set()
+
         # initialize Node connection to the server
         self.server_io = NodeClient(
             host=self.config.get('server_url'),
@@ -230,6 +301,22 @@ class Node(object):
         t = Thread(target=self.__listening_worker, daemon=True)
         t.start()
 
+        # Log a summary of the task metrics every once in a while
+        metrics_log_interval = self.config.get('metrics_log_interval',
+                                               DEFAULT_METRICS_LOG_INTERVAL)
+        if metrics_log_interval:
+            t = Thread(target=self.__metrics_worker,
+                       args=(metrics_log_interval, ), daemon=True)
+            t.start()
+
+        # Retrieve the open results that were missed every once in a while
+        task_sync_interval = self.config.get('task_sync_interval',
+                                             DEFAULT_TASK_SYNC_INTERVAL)
+        if task_sync_interval:
+            t = Thread(target=self.__sync_worker,
+                       args=(task_sync_interval, ), daemon=True)
+            t.start()
+
         self.log.info('Init complete')
 
     def __proxy_server_worker(self):
@@ -264,6 +351,7 @@ class Node(object):
         # 'app' is defined in vantage6.node.proxy_server
         # app.debug = True
         app.config["SERVER_IO"] = self.server_io
+        app.config["TASK_QUEUE"] = self.queue
 
         # this is where we try to find a port for the proxyserver
         for try_number in range(5):
@@ -291,17 +379,40 @@ class Node(object):
                 self.log.error('Proxyserver could not be started or crashed!')
                 self.log.error(e)
 
-    def sync_task_queue_with_server(self):
-        """ Get all unprocessed tasks from the server for this node."""
-        assert self.server_io.cryptor, "Encrpytion has not been setup"
+    def sync_task_queue_with_server(self, full: bool = False):
+        """ Get the unprocessed tasks from the server for this node.
 
-        # request open tasks from the server
-        tasks = self.server_io.get_results(state="open", include_task=True)
-        self.log.debug(tasks)
-        for task in tasks:
-            self.queue.put(task)
+            Only the ids are requested of the open results that were
+            assigned since the last sync (all open results on the first
+            sync). These results, and those that could not be retrieved or
+            started before, are then retrieved one by one if they are not
+            queued or running already.
+
+            :param full: request the ids of all open results, to pick up
+                results that have been missed
+        """
+        assert self.server_io.cryptor, "Encrpytion has not been setup"
 
-        self.log.info(f"received {self.queue._qsize()} tasks")
+        result_ids = self.server_io.get_open_result_ids(
+            after_id=None if full else self.__last_result_id)
+        if full:
+            # results that are not open anymore are not retried
+            self.__retry_result_ids.intersection_update(result_ids)
+            self.__rejected_result_ids.intersection_update(result_ids)
+
+        result_ids_to_get = (set(result_ids) | self.__retry_result_ids) \
+            - self.__rejected_result_ids
+        queued = [result_id for result_id in sorted(result_ids_to_get)
+                  if self.get_result_and_add_to_queue(result_id)]
+        self.log.info(f"received {len(queued)} tasks")
+
+        # the next sync continues after the results that have been handled,
+        # the others are retried
+        handled = [result_id for result_id in result_ids
+                   if result_id not in self.__retry_result_ids]
+        if handled:
+            self.__last_result_id = max(handled +
+                                        [self.__last_result_id or 0])
 
     def __start_task(self, taskresult):
         """Start a task.
@@ -310,41 +421,72 @@ class Node(object):
             has been started.
 
             :param taskresult: an empty taskresult
+
+            :returns: whether the container has been started, None if the
+                task is not run by this node and should not be retried
         """
         task = taskresult['task']
         self.log.info("Starting task {id} - {name}".format(**task))
 
-        # notify that we are processing this task
-        self.server_io.set_task_start_time(taskresult["id"])
-
-        token = self.server_io.request_token_for_container(
-            task["id"],
-            task["image"]
-        )
-        token = token["container_token"]
+        if not self.__docker.is_docker_image_allowed(task['image']):
+            self.log.critical(f"Docker image {task['image']} is not allowed "
+                              "on this Node!")
+            self.__rejected_result_ids.add(taskresult['id'])
+            return None
+
+        if self.__docker.is_running(taskresult['id']):
+            self.log.warn(f"Result id={taskresult['id']} is already being "
+                          "executed, discarding task")
+            return None
+
+        # keep what is needed to upload the result, so that we do not need
+        # to retrieve the result and task again once it is finished
+        self.__task_metadata[taskresult["id"]] = {
+            "task_id": task["id"],
+            "initiator_id": task.get("initiator")
+        }
+
+        with TaskMetrics().phase(taskresult["id"], 'start'):
+            # notify that we are processing this task
+            self.server_io.set_task_start_time(taskresult["id"])
+
+            token = self.server_io.request_token_for_container(
+                task["id"],
+                task["image"]
+            )
+            token = token["container_token"]
 
         # create a temporary volume for each run_id
         # FIXME: why is docker_temporary_volume_name() in ctx???
         vol_name = self.ctx.docker_temporary_volume_name(task["run_id"])
-        self.__docker.create_volume(vol_name)
+        with TaskMetrics().phase(taskresult["id"], 'volume'):
+            self.__docker.create_volume(vol_name)
 
         # For some reason, if the key 'input' consists of JSON, it is
         # automatically marshalled? This causes trouble, so we'll serialize it
         # again.
         # FIXME: should probably find & fix the root cause?
-        if type(taskresult['input']) == dict:
-            taskresult['input'] = json.dumps(taskresult['input'])
+        if type(taskresult.get('input')) == dict:
+            docker_input = json.dumps(taskresult['input'])
+        else:
+            # decrypt the input straight into the input file of the task
+            docker_input = functools.partial(
+                self.server_io.write_input, taskresult
+            )
 
-        # Run the container. This adds the created container/task to the list
+        # Run the container. This adds the created container/task to
         # __docker.active_tasks
         vpn_ports = self.__docker.run(
             result_id=taskresult["id"],
             image=task["image"],
-            docker_input=taskresult['input'],
+            docker_input=docker_input,
             tmp_vol_name=vol_name,
             token=token,
             database=task.get('database', 'default')
         )
+        if vpn_ports is None:
+            return False
+        self.queue.set_state(taskresult['id'], 'running')
 
         if vpn_ports:
             # Save port of VPN client container at which it redirects traffic
@@ -364,6 +506,8 @@ class Node(object):
                 f"node/{node_id}", json={"ip": node_ip}, method="PATCH"
             )
 
+        return True
+
     def __listening_worker(self):
         """ Listen for incoming (websocket) messages from the server.
 
@@ -387,17 +531,21 @@ class Node(object):
     def __speaking_worker(self):
         """ Sending messages to central server.
 
-            Routine that is in a seperate thread sending results
-            to the server when they come available.
-
-            TODO change to a single request, might need to reconsider
-                the flow
+            Routine that is in a seperate thread. It waits for results to
+            come available and hands them to the upload workers, which send
+            them to the server.
         """
+        self.log.debug("Start threads for uploading results")
+        for _ in range(MAX_CONCURRENT_UPLOADS):
+            t = Thread(target=self.__upload_worker, daemon=True)
+            t.start()
+
         self.log.debug("Waiting for results to send to the server")
 
         while True:
             try:
                 results = self.__docker.get_result()
+                self.queue.set_state(results.result_id, 'uploading')
 
                 # notify all of a crashed container
                 if results.status_code:
@@ -412,43 +560,117 @@ class Node(object):
                         namespace='/tasks'
                     )
 
-                self.log.info(
-                    f"Sending result (id={results.result_id}) to the server!")
+                self.__upload_queue.put(
+                    (results, datetime.datetime.now().isoformat())
+                )
+            except Exception as e:
+                self.log.error('Speaking thread had an exception')
+                self.log.debug(e)
 
-                # FIXME: why are we retrieving the result *again*? Shouldn't we
-                # just store the task_id when retrieving the task the first time?
-                response = self.server_io.request(f"result/{results.result_id}")
-                task_id = response.get("task").get("id")
+    def __upload_worker(self):
+        """ Upload finished results to the central server.
 
-                if not task_id:
-                    self.log.error(
-                        f"task_id of result (id={results.result_id}) "
-                        f"could not be retrieved"
-                    )
-                    return
+            Several upload workers run in parallel. A failed upload is
+            retried with an exponential backoff.
+        """
+        while True:
+            results, finished_at = self.__upload_queue.get()
+            self.log.info(
+                f"Sending result (id={results.result_id}) to the server!")
 
-                response = self.server_io.request(f"task/{task_id}")
-                initiator_id = response.get("initiator")
+            try:
+                initiator_id = self.__get_initiator_id(results.result_id)
+            except Exception as e:
+                self.log.error('Could not retrieve the initiator of result '
+                               f'(id={results.result_id})')
+                self.log.debug(e)
+                TaskMetrics().finish(results.result_id)
+                self.queue.remove(results.result_id)
+                continue
 
-                if not initiator_id:
-                    self.log.error(
-                        f"Initiator id from task (id={task_id})could not be "
-                        f"retrieved"
+            try:
+                with TaskMetrics().phase(results.result_id, 'encrypt'):
+                    result_file = self.server_io.encrypt_result_file(
+                        results.output_file, initiator_id
                     )
+            except Exception as e:
+                self.log.error('Could not encrypt result '
+                               f'(id={results.result_id})')
+                self.log.debug(e)
+                TaskMetrics().finish(results.result_id)
+                self.queue.remove(results.result_id)
+                continue
 
-                self.server_io.patch_results(
-                    id=results.result_id,
-                    initiator_id=initiator_id,
-                    result={
-                        'result': results.data,
-                        'log': results.logs,
-                        'finished_at': datetime.datetime.now().isoformat(),
-                    }
-                )
+            for attempt in range(UPLOAD_ATTEMPTS):
+                try:
+                    with TaskMetrics().phase(results.result_id, 'upload'):
+                        response = self.server_io.patch_results(
+                            id=results.result_id,
+                            initiator_id=initiator_id,
+                            result={
+                                'log': results.logs,
+                                'finished_at': finished_at,
+                                'exit_code': results.status_code,
+                            },
+                            result_file=result_file
+                        )
+                    if response.get('id'):
+                        break
+                    self.log.debug(response)
+                except Exception as e:
+                    self.log.debug(e)
+
+                self.log.warn(f'Sending result (id={results.result_id}) '
+                              f'failed, attempt {attempt + 1} of '
+                              f'{UPLOAD_ATTEMPTS}')
+                if attempt + 1 < UPLOAD_ATTEMPTS:
+                    time.sleep(2 ** attempt)
+            else:
+                self.log.error(f'Could not send result '
+                               f'(id={results.result_id}) to the server')
+
+            TaskMetrics().finish(results.result_id)
+            self.queue.remove(results.result_id)
+
+    def __metrics_worker(self, interval: float):
+        """ Log a summary of the task metrics every `interval` seconds."""
+        while True:
+            time.sleep(interval)
+            TaskMetrics().log_summary()
+
+    def __sync_worker(self, interval: float):
+        """ Fully sync the task queue with the server every `interval`
+            seconds."""
+        while True:
+            time.sleep(interval)
+            try:
+                self.sync_task_queue_with_server(full=True)
             except Exception as e:
-                self.log.error('Speaking thread had an exception')
+                self.log.warn("Could not sync the tasks with the server")
                 self.log.debug(e)
 
+    def __get_initiator_id(self, result_id: int) -> int:
+        """ Organization id of the initiator of the task of a result.
+
+            This is stored when the task is started. Only if it is missing,
+            the result and its task are retrieved from the server.
+        """
+        metadata = self.__task_metadata.pop(result_id, {})
+        initiator_id = metadata.get("initiator_id")
+        if initiator_id:
+            return initiator_id
+
+        response = self.server_io.request(f"result/{result_id}")
+        task_id = response.get("task").get("id")
+        response = self.server_io.request(f"task/{task_id}")
+        initiator_id = response.get("initiator")
+        if not initiator_id:
+            self.log.error(
+                f"Initiator id from task (id={task_id}) could not be "
+                f"retrieved"
+            )
+        return initiator_id
+
     def authenticate(self):
         """ Authenticate to the central server
 
@@ -724,44 +946,105 @@ class Node(object):
         # in the current setup, only a single result for a single node
         # in a task exists.
         for task in tasks:
-            self.queue.put(task)
+            self.__add_to_queue(task)
+
+    def get_result_and_add_to_queue(self, result_id) -> bool:
+        """Fetches the result with result_id from the server, and queues it
+            if it is still open.
+
+            The `result_id` is delivered by the websocket-connection, or by
+            a sync with the server. Results that are queued or running
+            already are not retrieved again.
+
+            :returns: whether the result has been queued
+        """
+        if result_id in self.queue:
+            self.log.debug(f"Result id={result_id} is already queued or "
+                           "running")
+            return False
 
-    def run_forever(self):
-        """Forever check self.queue for incoming tasks (and execute them)."""
-        kill_listener = ContainerKillListener()
         try:
-            while True:
-                # blocking untill a task comes available
-                # timeout specified, else Keyboard interupts are ignored
-                self.log.info("Waiting for new tasks....")
-
-                while not kill_listener.kill_now:
-                    try:
-                        task = self.queue.get(timeout=1)
-                        # if no item is returned, the Empty exception is
-                        # triggered, thus break statement is not reached
-                        break
+            task = self.server_io.get_results(id=result_id,
+                                              include_task=True)
+        except Exception as e:
+            self.log.debug(e)
+            task = None
+        if not task or 'task' not in task:
+            self.log.warn(f"Could not retrieve result id={result_id}, it is "
+                          "retried by the next sync")
+            self.__retry_result_ids.add(result_id)
+            return False
 
-                    except queue.Empty:
-                        pass
+        self.__retry_result_ids.discard(result_id)
+        if task.get('finished_at'):
+            self.log.debug(f"Result id={result_id} is not open, not queued")
+            return False
 
-                    except Exception as e:
-                        self.log.debug(e)
+        return self.__add_to_queue(task)
 
-                if kill_listener.kill_now:
-                    raise InterruptedError
+    def __add_to_queue(self, task: dict) -> bool:
+        """Queue a task, unless it is queued or running already."""
+        if not self.queue.put(task):
+            return False
+        # only marked once queued, a task that is rejected as duplicate
+        # would otherwise leave the mark behind
+        TaskMetrics().mark(task['id'], 'queued')
+        return True
 
-                # if task comes available, attempt to execute it
-                try:
-                    self.__start_task(task)
-                except Exception as e:
-                    self.log.exception(e)
+    def run_forever(self):
+        """Start the task workers and keep running until interrupted."""
+        kill_listener = ContainerKillListener()
+
+        max_concurrent_tasks = self.config.get('max_concurrent_tasks',
+                                               DEFAULT_MAX_CONCURRENT_TASKS)
+        self.log.debug(f"Starting {max_concurrent_tasks} task worker(s)")
+        for _ in range(max_concurrent_tasks):
+            t = Thread(target=self.__task_worker, daemon=True)
+            t.start()
+
+        try:
+            self.log.info("Waiting for new tasks....")
+            while not kill_listener.kill_now:
+                time.sleep(1)
+
+            raise InterruptedError
 
         except (KeyboardInterrupt, InterruptedError):
             self.log.info("Vnode is interrupted, shutting down...")
             self.cleanup()
             sys.exit()
 
+    def __task_worker(self):
+        """Forever check self.queue for incoming tasks (and execute them).
+
+            Several task workers run in parallel, so that a task that is
+            (for example) pulling its image does not block other tasks.
+        """
+        while True:
+            # blocking untill a task comes available. The queue does not
+            # accept a task that is queued or running already, so a task is
+            # never started twice at once
+            task = self.queue.get()
+            TaskMetrics().record_since(task['id'], 'queued', 'queue')
+
+            # if task comes available, attempt to execute it
+            try:
+                started = self.__start_task(task)
+            except Exception as e:
+                self.log.exception(e)
+                started = False
+
+            # a task of which the container has been started stays known
+            # until its result has been uploaded. The others are retried by
+            # the next sync, as long as they are open, unless this node does
+            # not run them at all.
+            if not started:
+                self.queue.remove(task['id'], state='starting')
+                self.__task_metadata.pop(task['id'], None)
+                TaskMetrics().discard(task['id'])
+                if started is not None:
+                    self.__retry_result_ids.add(task['id'])
+
     def cleanup(self):
         if hasattr(self, 'socketIO') and self.socketIO:
             self.socketIO.disconnect()
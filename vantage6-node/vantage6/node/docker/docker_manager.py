@@ -9,16 +9,19 @@ import os
 import time
 import logging
 import docker
+import queue
 import re
 import shutil
 
-from typing import Dict, List, NamedTuple, Union
+from typing import BinaryIO, Callable, Dict, List, NamedTuple, Union
 from pathlib import Path
+from threading import RLock, Thread
 
 from vantage6.common.docker.addons import get_container, running_in_docker
 from vantage6.common.globals import APPNAME
 from vantage6.node.docker.docker_base import DockerBaseManager
 from vantage6.node.docker.vpn_manager import VPNManager
+from vantage6.node.metrics import TaskMetrics
 from vantage6.node.util import logger_name
 from vantage6.common.docker.network_manager import NetworkManager
 from vantage6.node.docker.task_manager import DockerTaskManager
@@ -30,7 +33,7 @@ class Result(NamedTuple):
     """ Data class to store the result of the docker image."""
     result_id: int
     logs: str
-    data: str
+    output_file: str
     status_code: int
 
 
@@ -71,8 +74,23 @@ class DockerManager(DockerBaseManager):
         self.__tasks_dir = tasks_dir
         self.alpine_image = config.get('alpine')
 
-        # keep track of the running containers
-        self.active_tasks: List[DockerTaskManager] = []
+        # keep track of the running containers, by result id
+        self.active_tasks: Dict[int, DockerTaskManager] = {}
+
+        # result_ids of algorithm containers that exited, these are put on
+        # the queue by the docker event watcher. Ids for which the task is
+        # not (yet) in `active_tasks`, or of which the container does not
+        # have the exited status yet, are kept in the pending set.
+        self.finished_result_ids = queue.Queue()
+        self._pending_result_ids = set()
+
+        # result ids of the tasks of which the containers are being started
+        self._starting_result_ids = set()
+
+        # `run` is called by multiple task workers, while `get_result` and
+        # the event watcher run in threads of their own. The lock guards the
+        # active, pending and starting tasks and the linked services.
+        self._lock = RLock()
 
         # before a task is executed it gets exposed to these regex
         self._allowed_images = config.get("allowed_images")
@@ -85,6 +103,11 @@ class DockerManager(DockerBaseManager):
         # time.
         self.node_name = ctx.name
 
+        # watch the docker events for algorithm containers that exit
+        self._events = None
+        self._watch_events = True
+        Thread(target=self.__watch_container_events, daemon=True).start()
+
         # login to the registries
         docker_registries = ctx.config.get("docker_registries", [])
         self.login_to_registries(docker_registries)
@@ -193,6 +216,9 @@ class DockerManager(DockerBaseManager):
         """
         Check if a container is already running for <result_id>.
 
+        Only the containers that are started by this node are considered,
+        the docker daemon is not queried.
+
         Parameters
         ----------
         result_id: int
@@ -203,14 +229,9 @@ class DockerManager(DockerBaseManager):
         bool
             Whether or not algorithm container is running already
         """
-        running_containers = self.docker.containers.list(filters={
-            "label": [
-                f"{APPNAME}-type=algorithm",
-                f"node={self.node_name}",
-                f"result_id={result_id}"
-            ]
-        })
-        return bool(running_containers)
+        with self._lock:
+            return result_id in self.active_tasks or \
+                result_id in self._starting_result_ids
 
     def cleanup(self) -> None:
         """
@@ -219,16 +240,24 @@ class DockerManager(DockerBaseManager):
         Note: the temporary docker volumes are kept as they may still be used
         by a master container
         """
-        if self.active_tasks:
-            self.log.debug(f'Killing {len(self.active_tasks)} active task(s)')
-        while self.active_tasks:
-            task = self.active_tasks.pop()
+        self._watch_events = False
+        if self._events:
+            self._events.close()
+        with self._lock:
+            tasks = list(self.active_tasks.values())
+            self.active_tasks.clear()
+            services = list(self.linked_services)
+        if tasks:
+            self.log.debug(f'Killing {len(tasks)} active task(s)')
+        for task in tasks:
             task.cleanup()
-        for service in self.linked_services:
+            TaskMetrics().discard(task.result_id)
+        for service in services:
             self.isolated_network_mgr.disconnect(service)
         self.isolated_network_mgr.delete()
 
-    def run(self, result_id: int,  image: str, docker_input: bytes,
+    def run(self, result_id: int,  image: str,
+            docker_input: Union[bytes, Callable[[BinaryIO], None]],
             tmp_vol_name: str, token: str, database: str
             ) -> Union[List[Dict], None]:
         """
@@ -241,8 +270,9 @@ class DockerManager(DockerBaseManager):
             Server result identifier
         image: str
             Docker image name
-        docker_input: bytes
-            Input that can be read by docker container
+        docker_input: bytes or Callable[[BinaryIO], None]
+            Input that can be read by docker container, or a function that
+            writes the input to the (opened) input file
         tmp_vol_name: str
             Name of temporary docker volume assigned to the algorithm
         token: str
@@ -254,7 +284,8 @@ class DockerManager(DockerBaseManager):
         -------
         List[Dict] or None
             Description of each port on the VPN client that forwards traffic to
-            the algo container. None if VPN is not set up.
+            the algo container, empty if VPN is not set up. None if the
+            container has not been started.
         """
         # Verify that an allowed image is used
         if not self.is_docker_image_allowed(image):
@@ -262,11 +293,17 @@ class DockerManager(DockerBaseManager):
             self.log.critical(msg)
             return None
 
-        # Check that this task is not already running
-        if self.is_running(result_id):
-            self.log.warn("Task is already being executed, discarding task")
-            self.log.debug(f"result_id={result_id} is discarded")
-            return None
+        # Check that this task is not already running, and claim it so that
+        # it is not started by another task worker in the meantime
+        with self._lock:
+            if self.is_running(result_id):
+                self.log.warn("Task is already being executed, discarding "
+                              "task")
+                self.log.debug(f"result_id={result_id} is discarded")
+                return None
+            self._starting_result_ids.add(result_id)
+            # a previous container for this result may have exited before
+            self._pending_result_ids.discard(result_id)
 
         task = DockerTaskManager(
             image=image,
@@ -280,23 +317,33 @@ class DockerManager(DockerBaseManager):
             alpine_image=self.alpine_image
         )
         database = database if (database and len(database)) else 'default'
-        vpn_ports = task.run(
-            docker_input=docker_input, tmp_vol_name=tmp_vol_name, token=token,
-            algorithm_env=self.algorithm_env, database=database
-        )
 
-        # keep track of the active container
-        self.active_tasks.append(task)
+        try:
+            vpn_ports = task.run(
+                docker_input=docker_input, tmp_vol_name=tmp_vol_name,
+                token=token, algorithm_env=self.algorithm_env,
+                database=database
+            )
+        finally:
+            with self._lock:
+                self._starting_result_ids.discard(result_id)
+                # keep track of the active container
+                if task.container:
+                    self.active_tasks[result_id] = task
+        if not task.container:
+            return None
 
-        return vpn_ports
+        return vpn_ports or []
 
     def get_result(self) -> Result:
         """
-        Returns the oldest (FIFO) finished docker container.
+        Returns a finished docker container.
 
+        The containers are returned in the order in which docker reported
+        that they exited, which is not the order in which they were started.
         This is a blocking method until a finished container shows up. Once the
-        container is obtained and the results are read, the container is
-        removed from the docker environment.
+        container is obtained, the container is removed from the docker
+        environment. The results are left in the output file of the task.
 
         Returns
         -------
@@ -304,36 +351,116 @@ class DockerManager(DockerBaseManager):
             result of the docker image
         """
 
-        # get finished results and get the first one, if no result is available
-        # this is blocking
-        finished_tasks = []
-        while not finished_tasks:
-            finished_tasks = [t for t in self.active_tasks if t.is_finished()]
-            time.sleep(1)
+        # wait for the event watcher to report a finished container. The
+        # timeout makes sure that containers that exited before their task
+        # was added to `active_tasks` are picked up as well.
+        finished_task = None
+        while not finished_task:
+            try:
+                result_id = self.finished_result_ids.get(timeout=1)
+                with self._lock:
+                    self._pending_result_ids.add(result_id)
+            except queue.Empty:
+                pass
+            finished_task = self._pop_finished_task()
 
-        # at least one task is finished
-        finished_task = finished_tasks.pop()
         self.log.debug(f"Result id={finished_task.result_id} is finished")
+        TaskMetrics().record_since(finished_task.result_id,
+                                   'container_started', 'run')
 
-        # Check exit status and report
-        logs = finished_task.report_status()
-
-        # Cleanup containers
-        finished_task.cleanup()
+        with TaskMetrics().phase(finished_task.result_id, 'result'):
+            # Check exit status and report
+            logs = finished_task.report_status()
 
-        # Retrieve results from file
-        results = finished_task.get_results()
+            # Cleanup containers
+            finished_task.cleanup()
 
         # remove finished tasks from active task list
-        self.active_tasks.remove(finished_task)
+        with self._lock:
+            self.active_tasks.pop(finished_task.result_id, None)
 
         return Result(
             result_id=finished_task.result_id,
             logs=logs,
-            data=results,
+            output_file=finished_task.output_file,
             status_code=finished_task.status_code
         )
 
+    def _pop_finished_task(self) -> Union[DockerTaskManager, None]:
+        """
+        Get an active task for which the container has exited.
+
+        Only the tasks for which the event watcher reported an exited
+        container are checked at the docker daemon.
+
+        Returns
+        -------
+        DockerTaskManager or None
+            Task of which the container has exited, None if there is none
+        """
+        with self._lock:
+            tasks = [self.active_tasks[result_id] for result_id
+                     in self._pending_result_ids
+                     if result_id in self.active_tasks]
+            self._pending_result_ids.difference_update(
+                task.result_id for task in tasks)
+
+        # the docker daemon is not called while holding the lock
+        finished_task = None
+        for task in tasks:
+            if task.is_finished():
+                finished_task = task
+                break
+
+        # the other tasks are checked again the next time, including those of
+        # which the exit has been reported before the status of the container
+        # was updated
+        with self._lock:
+            self._pending_result_ids.update(
+                task.result_id for task in tasks if task is not finished_task
+            )
+        return finished_task
+
+    def __watch_container_events(self) -> None:
+        """
+        Put the result_ids of exited algorithm containers on the queue.
+
+        Listens to the `die` events of the algorithm containers of this node
+        in the docker event stream. When the stream is interrupted, it is
+        reopened and the active tasks are checked once so that containers
+        that exited in the meantime are not missed.
+        """
+        filters = {
+            "type": "container",
+            "event": "die",
+            "label": [
+                f"{APPNAME}-type=algorithm",
+                f"node={self.node_name}"
+            ]
+        }
+        reconnected = False
+        while self._watch_events:
+            try:
+                self._events = self.docker.events(decode=True,
+                                                  filters=filters)
+                if reconnected:
+                    with self._lock:
+                        tasks = list(self.active_tasks.values())
+                    for task in tasks:
+                        if task.is_finished():
+                            self.finished_result_ids.put(task.result_id)
+
+                for event in self._events:
+                    labels = event["Actor"]["Attributes"]
+                    self.finished_result_ids.put(int(labels["result_id"]))
+
+            except Exception as e:
+                if self._watch_events:
+                    self.log.warn("Docker event stream interrupted")
+                    self.log.debug(e)
+                    time.sleep(1)
+            reconnected = True
+
     def login_to_registries(self, registries: list = []) -> None:
         """
         Login to the docker registries
@@ -376,8 +503,9 @@ class DockerManager(DockerBaseManager):
                            "the isolated docker network.")
             self.log.error("Container not found!")
             return
-        self.isolated_network_mgr.connect(
-            container_name=container_name,
-            aliases=[config_alias]
-        )
-        self.linked_services.append(container_name)
+        with self._lock:
+            self.isolated_network_mgr.connect(
+                container_name=container_name,
+                aliases=[config_alias]
+            )
+            self.linked_services.append(container_name)
@@ -3,8 +3,9 @@ to be cleaned at some point. """
 import logging
 import os
 
-from typing import Dict, List, Union
+from typing import BinaryIO, Callable, Dict, List, Union
 from pathlib import Path
+from threading import Event, Lock
 
 from vantage6.common.globals import APPNAME
 from vantage6.common.docker.addons import (
@@ -15,6 +16,7 @@ from vantage6.node.globals import ALPINE_IMAGE
 from vantage6.node.docker.vpn_manager import VPNManager
 from vantage6.common.docker.network_manager import NetworkManager
 from vantage6.node.docker.docker_base import DockerBaseManager
+from vantage6.node.metrics import TaskMetrics
 from vantage6.common.docker.addons import pull_if_newer, running_in_docker
 
 
@@ -29,6 +31,12 @@ class DockerTaskManager(DockerBaseManager):
     """
     log = logging.getLogger(logger_name(__name__))
 
+    # images that are being pulled. These are shared by all tasks, so that
+    # tasks that are started at the same time for the same image wait for a
+    # single pull instead of each pulling the image themselves.
+    _pulls: Dict[str, Event] = {}
+    _pulls_lock = Lock()
+
     def __init__(self, image: str, vpn_manager: VPNManager, node_name: str,
                  result_id: int, tasks_dir: Path,
                  isolated_network_mgr: NetworkManager,
@@ -77,7 +85,7 @@ class DockerTaskManager(DockerBaseManager):
             "node": node_name,
             "result_id": str(result_id)
         }
-        self.helper_labels = self.labels
+        self.helper_labels = dict(self.labels)
         self.helper_labels[f"{APPNAME}-type"] = "algorithm-helper"
 
         # FIXME: these values should be retrieved from DockerNodeContext
@@ -107,6 +115,7 @@ class DockerTaskManager(DockerBaseManager):
         logs: str
             Log messages of the algorithm container
         """
+        self.container.reload()
         logs = self.container.logs().decode('utf8')
 
         # report if the container has a different status than 0
@@ -117,21 +126,27 @@ class DockerTaskManager(DockerBaseManager):
             self.log.info(logs)
         return logs
 
-    def get_results(self) -> bytes:
+    def pull(self):
         """
-        Read results output file of the algorithm container
+        Pull the latest docker image.
 
-        Returns
-        -------
-        bytes:
-            Results of the algorithm container
+        If another task is already pulling the same image, wait for that pull
+        to finish instead.
         """
-        with open(self.output_file, "rb") as fp:
-            results = fp.read()
-        return results
+        with self._pulls_lock:
+            pulled = self._pulls.get(self.image)
+            if not pulled:
+                pulled = self._pulls[self.image] = Event()
+                is_puller = True
+            else:
+                is_puller = False
+
+        if not is_puller:
+            self.log.debug(f"Waiting for pull of image '{self.image}' by "
+                           "another task")
+            pulled.wait()
+            return
 
-    def pull(self):
-        """ Pull the latest docker image. """
         try:
             self.log.info(f"Retrieving latest image: '{self.image}'")
             pull_if_newer(self.docker, self.image, self.log)
@@ -140,8 +155,14 @@ class DockerTaskManager(DockerBaseManager):
             self.log.debug('Failed to pull image')
             self.log.error(e)
 
-    def run(self, docker_input: bytes, tmp_vol_name: str, token: str,
-            algorithm_env: Dict, database: str) -> List[Dict]:
+        finally:
+            with self._pulls_lock:
+                del self._pulls[self.image]
+            pulled.set()
+
+    def run(self, docker_input: Union[bytes, Callable[[BinaryIO], None]],
+            tmp_vol_name: str, token: str, algorithm_env: Dict,
+            database: str) -> List[Dict]:
         """
         Runs the docker-image in detached mode.
 
@@ -150,8 +171,9 @@ class DockerTaskManager(DockerBaseManager):
 
         Parameters
         ----------
-        docker_input: bytes
-            Input that can be read by docker container
+        docker_input: bytes or Callable[[BinaryIO], None]
+            Input that can be read by docker container, or a function that
+            writes the input to the (opened) input file
         tmp_vol_name: str
             Name of temporary docker volume assigned to the algorithm
         token: str
@@ -169,9 +191,10 @@ class DockerTaskManager(DockerBaseManager):
         self._make_task_folders()
 
         # prepare volumes
-        self.volumes = self._prepare_volumes(
-            docker_input, tmp_vol_name, token
-        )
+        with TaskMetrics().phase(self.result_id, 'input'):
+            self.volumes = self._prepare_volumes(
+                docker_input, tmp_vol_name, token
+            )
         self.log.debug(f"volumes: {self.volumes}")
 
         # setup environment variables
@@ -206,7 +229,8 @@ class DockerTaskManager(DockerBaseManager):
         helper_container_name = container_name + '-helper'
 
         # Try to pull the latest image
-        self.pull()
+        with TaskMetrics().phase(self.result_id, 'pull'):
+            self.pull()
 
         # remove algorithm containers if they were already running
         remove_container_if_exists(
@@ -248,6 +272,7 @@ class DockerTaskManager(DockerBaseManager):
                 name=container_name,
                 labels=self.labels
             )
+            TaskMetrics().mark(self.result_id, 'container_started')
         except Exception as e:
             self.log.error('Could not run docker image!?')
             self.log.error(e)
@@ -276,15 +301,17 @@ class DockerTaskManager(DockerBaseManager):
         os.makedirs(self.task_folder_path, exist_ok=True)
         self.output_file = os.path.join(self.task_folder_path, "output")
 
-    def _prepare_volumes(self, docker_input: bytes, tmp_vol_name: str,
-                         token: str) -> Dict:
+    def _prepare_volumes(
+            self, docker_input: Union[bytes, Callable[[BinaryIO], None]],
+            tmp_vol_name: str, token: str) -> Dict:
         """
         Generate docker volumes required to run the algorithm
 
         Parameters
         ----------
-        docker_input: bytes
-            Input that can be read by docker container
+        docker_input: bytes or Callable[[BinaryIO], None]
+            Input that can be read by docker container, or a function that
+            writes the input to the (opened) input file
         tmp_vol_name: str
             Name of temporary docker volume assigned to the algorithm
         token: str
@@ -310,7 +337,10 @@ class DockerTaskManager(DockerBaseManager):
             filepath = os.path.join(self.task_folder_path, filename)
 
             with open(filepath, 'wb') as fp:
-                fp.write(data)
+                if callable(data):
+                    data(fp)
+                else:
+                    fp.write(data)
 
         volumes = {
             tmp_vol_name: {"bind": self.tmp_folder, "mode": "rw"},
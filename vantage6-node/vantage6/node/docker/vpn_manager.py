@@ -4,6 +4,7 @@ import json
 import time
 
 from json.decoder import JSONDecodeError
+from threading import Lock
 from typing import List, Union, Dict
 from docker.models.containers import Container
 
@@ -56,6 +57,10 @@ class VPNManager(DockerBaseManager):
 
         self.has_vpn = False
 
+        # the free ports of the VPN client are allocated by one task at a
+        # time, so that two algorithms are not assigned the same port
+        self._port_lock = Lock()
+
     def connect_vpn(self) -> None:
         """
         Start VPN client container and configure network to allow
@@ -211,8 +216,9 @@ class VPNManager(DockerBaseManager):
             Description of each port on the VPN client that forwards traffic to
             the algo container. None if VPN is not set up.
         """
-        ports = self._forward_traffic_to_algorithm(
-            helper_container, algo_image_name)
+        with self._port_lock:
+            ports = self._forward_traffic_to_algorithm(
+                helper_container, algo_image_name)
         self._forward_traffic_from_algorithm(helper_container)
         return ports
 
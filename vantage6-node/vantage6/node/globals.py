@@ -8,6 +8,26 @@ DEFAULT_NODE_SYSTEM_FOLDERS = False
 
 DEFAULT_NODE_ENVIRONMENT = "application"
 
+# number of tasks that are started in parallel, can be overridden by the
+# `max_concurrent_tasks` setting in the node configuration file
+DEFAULT_MAX_CONCURRENT_TASKS = 4
+
+# number of results that are uploaded to the server in parallel, and the
+# number of attempts for a single upload (with 1, 2, 4, ... seconds between)
+MAX_CONCURRENT_UPLOADS = 4
+UPLOAD_ATTEMPTS = 5
+
+# number of seconds between two log lines that summarize how long tasks spend
+# in each phase, can be overridden by the `metrics_log_interval` setting (0
+# turns the summary off)
+DEFAULT_METRICS_LOG_INTERVAL = 300
+
+# number of seconds between two full syncs of the task queue with the server,
+# which pick up the open results that could not be retrieved or started
+# before. Can be overridden by the `task_sync_interval` setting (0 turns the
+# periodic sync off)
+DEFAULT_TASK_SYNC_INTERVAL = 300
+
 
 #
 #   INSTALLATION SETTINGS
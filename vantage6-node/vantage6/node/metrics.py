@@ -0,0 +1,163 @@
+""" Metrics of the tasks that are run by the node
+
+Records how long each task spends in the phases of its lifecycle:
+
+- queue: waiting in the task queue of the node
+- start: notifying the server and obtaining the container token
+- volume: creating the temporary volume of the run
+- pull: pulling the docker image (or waiting for another task to pull it)
+- input: writing the (decrypted) input and preparing the volumes
+- run: running the algorithm container, until the node picks it up
+- result: reading the logs of the container and removing it
+- encrypt: encrypting the result for the initiator
+- upload: sending the result to the server
+
+The metrics are available at `/metrics` of the proxy server and are
+summarized in the log periodically.
+"""
+import logging
+import time
+
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+
+from vantage6.node.util import logger_name, Singleton
+
+PHASES = ('queue', 'start', 'volume', 'pull', 'input', 'run', 'result',
+          'encrypt', 'upload')
+
+
+class TaskMetrics(metaclass=Singleton):
+    """Duration of the phases of the tasks that are run by this node."""
+
+    def __init__(self, history: int = 100, max_active: int = 1000):
+        """
+        Parameters
+        ----------
+        history : int, optional
+            Number of finished tasks of which the phases are kept
+        max_active : int, optional
+            Maximum number of active tasks that are kept. Tasks are finished
+            or discarded when they are done, this limit only guards against
+            tasks that are never done
+        """
+        self.log = logging.getLogger(logger_name(__name__))
+        self.__lock = Lock()
+
+        # result id -> {'marks': {mark: time}, 'phases': {phase: seconds}},
+        # in the order in which the tasks have been seen
+        self.__active = {}
+        self.__max_active = max_active
+        self.__finished = deque(maxlen=history)
+
+        # phase -> [count, total seconds, max seconds]
+        self.__totals = {}
+
+    def _task(self, result_id: int) -> dict:
+        task = self.__active.get(result_id)
+        if task is None:
+            if len(self.__active) >= self.__max_active:
+                oldest = next(iter(self.__active))
+                self.log.debug(f'Too many active tasks, forgetting the '
+                               f'metrics of result id={oldest}')
+                del self.__active[oldest]
+            task = self.__active[result_id] = {'marks': {}, 'phases': {}}
+        return task
+
+    def mark(self, result_id: int, mark: str) -> None:
+        """Remember the current time, e.g. when a task is queued
+
+        Parameters
+        ----------
+        result_id : int
+            Id of the result of the task
+        mark : str
+            Name of the moment
+        """
+        with self.__lock:
+            self._task(result_id)['marks'][mark] = time.monotonic()
+
+    def record(self, result_id: int, phase: str, seconds: float) -> None:
+        """Record the duration of a phase of a task
+
+        Parameters
+        ----------
+        result_id : int
+            Id of the result of the task
+        phase : str
+            Name of the phase, see `PHASES`
+        seconds : float
+            Duration of the phase. When a phase occurs several times (e.g.
+            upload attempts), the durations are added
+        """
+        with self.__lock:
+            phases = self._task(result_id)['phases']
+            phases[phase] = phases.get(phase, 0.0) + seconds
+
+            totals = self.__totals.setdefault(phase, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+
+    def record_since(self, result_id: int, mark: str, phase: str) -> None:
+        """Record the time since a `mark` as the duration of a `phase`."""
+        with self.__lock:
+            start = self.__active.get(result_id, {}).get('marks', {})\
+                .pop(mark, None)
+        if start is not None:
+            self.record(result_id, phase, time.monotonic() - start)
+
+    @contextmanager
+    def phase(self, result_id: int, phase: str):
+        """Record the duration of the enclosed block as a `phase`."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(result_id, phase, time.monotonic() - start)
+
+    def finish(self, result_id: int) -> None:
+        """Move a task to the finished tasks."""
+        with self.__lock:
+            task = self.__active.pop(result_id, None)
+            if task:
+                self.__finished.append({
+                    'result_id': result_id,
+                    'phases': task['phases'],
+                })
+
+    def discard(self, result_id: int) -> None:
+        """Forget a task that is not run after all."""
+        with self.__lock:
+            self.__active.pop(result_id, None)
+
+    def summary(self) -> dict:
+        """Statistics of each phase, and the phases of each task."""
+        with self.__lock:
+            phases = {
+                phase: {
+                    'count': count,
+                    'total': total,
+                    'mean': total / count,
+                    'max': max_,
+                }
+                for phase, (count, total, max_) in self.__totals.items()
+            }
+            active = [
+                {'result_id': result_id, 'phases': dict(task['phases'])}
+                for result_id, task in self.__active.items()
+            ]
+            finished = list(self.__finished)
+        return {'phases': phases, 'active': active, 'finished': finished}
+
+    def log_summary(self) -> None:
+        """Log the mean and maximum duration of each phase."""
+        phases = self.summary()['phases']
+        if not phases:
+            return
+        self.log.info('Task phases (mean/max): ' + ', '.join(
+            f"{phase} {phases[phase]['mean']:.1f}s/"
+            f"{phases[phase]['max']:.1f}s"
+            for phase in PHASES if phase in phases
+        ))
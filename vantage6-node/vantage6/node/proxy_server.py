@@ -17,6 +17,8 @@ import traceback
 
 from flask import Flask, request, jsonify
 
+from vantage6.common.globals import FEATURE_SHARED_INPUT
+from vantage6.node.metrics import TaskMetrics
 from vantage6.node.util import (
     logger_name,
     base64s_to_bytes,
@@ -27,6 +29,7 @@ from vantage6.node.util import (
 app = Flask(__name__)
 log = logging.getLogger(logger_name(__name__))
 app.config["SERVER_IO"] = None
+app.config["TASK_QUEUE"] = None
 
 
 def server_info():
@@ -39,6 +42,21 @@ def server_info():
     return f"{url}:{port}{path}"
 
 
+@app.route("/metrics", methods=["GET"])
+def task_metrics():
+    """ Durations of the phases of the tasks run by this node, and the
+        number of tasks that are queued and in each state.
+
+        See `vantage6.node.metrics` for the phases and
+        `vantage6.node.task_queue` for the states. This endpoint is handled
+        by the proxy itself and is not forwarded to the central server.
+    """
+    metrics = TaskMetrics().summary()
+    if app.config["TASK_QUEUE"]:
+        metrics["queue"] = app.config["TASK_QUEUE"].status()
+    return jsonify(metrics)
+
+
 @app.route("/task", methods=["POST"])
 def proxy_task():
     """ Create new task at the server instance
@@ -48,14 +66,12 @@ def proxy_task():
         public key. The method expects that the setting SERVER_IO is
         set at the FLASK APP.
 
-        TODO public_key retrieval should happen at node start-up however
-            we might need to verify it at a later stage.
         TODO we might want to allow entire collaborations instead of
             only the `organizations`. Thus if the field `organizations`
             is unspecified, we send the message to all participating
             organizations.
         TODO we might not want to use the SERVER_IO, as we only use the
-            encryption property of it
+            encryption and public key cache of it
         TODO if no public key is present, we should have some sort of
             fallback
     """
@@ -84,45 +100,59 @@ def proxy_task():
     log.debug(f"{n_organizations} organizations, attemping to encrypt")
     encrypted_organizations = []
 
-    for organization in organizations:
-        input_ = organization.get("input", {})
-        if not input_:
-            log.error("No input for organization?!")
-            return
-
-        organization_id = organization.get("id", None)
-        log.debug(f"retreiving public key of org={organization_id}")
-
-        # retrieve public key of the organization
-        response = requests.get(
-            f"{url}/organization/{organization_id}",
-            headers={'Authorization': auth}
-        )
-
-        public_key = response.json().get("public_key")
-
-        # Simple JSON (only for unencrypted collaborations)
-        # if isinstance(input_, dict):
-        #     input_ = bytes_to_base64s(
-        #         json.dumps(input_).encode(STRING_ENCODING)
-        #     )
-
-        # log.warn('Trying to unpack input:')
-        # log.warn(input_)
-
-        input_unpacked = base64s_to_bytes(input_)
-
-        encrypted_input = server_io.cryptor.encrypt_bytes_to_str(
-            input_unpacked,
-            public_key
-        )
+    # when all organizations receive the same input, it is encrypted only
+    # once and the organizations only receive the (encrypted) key to it
+    inputs = {org.get("input") for org in organizations}
+    if n_organizations > 1 and len(inputs) == 1 and all(inputs) and \
+            server_io.server_supports(FEATURE_SHARED_INPUT):
+        public_keys = {
+            org.get("id"): server_io.get_public_key(org.get("id"))
+            for org in organizations
+        }
+        shared_input, encrypted_keys = \
+            server_io.cryptor.encrypt_bytes_to_str_multi(
+                base64s_to_bytes(inputs.pop()), public_keys
+            )
+        for organization in organizations:
+            organization["input"] = encrypted_keys[organization.get("id")]
+            encrypted_organizations.append(organization)
+        unencrypted["shared_input"] = shared_input
+        log.debug("Shared input succesfully encrypted for "
+                  f"{n_organizations} organizations!")
+    else:
+        for organization in organizations:
+            input_ = organization.get("input", {})
+            if not input_:
+                log.error("No input for organization?!")
+                return
+
+            organization_id = organization.get("id", None)
+            log.debug(f"retreiving public key of org={organization_id}")
+
+            # retrieve public key of the organization (from the cache)
+            public_key = server_io.get_public_key(organization_id)
+
+            # Simple JSON (only for unencrypted collaborations)
+            # if isinstance(input_, dict):
+            #     input_ = bytes_to_base64s(
+            #         json.dumps(input_).encode(STRING_ENCODING)
+            #     )
+
+            # log.warn('Trying to unpack input:')
+            # log.warn(input_)
+
+            input_unpacked = base64s_to_bytes(input_)
+
+            encrypted_input = server_io.cryptor.encrypt_bytes_to_str(
+                input_unpacked,
+                public_key
+            )
 
-        # log.debug(f"should be unreadable={encrypted_input}")
-        organization["input"] = encrypted_input
-        encrypted_organizations.append(organization)
-        log.debug(
-            f"Input succesfully encrypted for organization {organization_id}!"
-        )
+            # log.debug(f"should be unreadable={encrypted_input}")
+            organization["input"] = encrypted_input
+            encrypted_organizations.append(organization)
+            log.debug("Input succesfully encrypted for organization "
+                      f"{organization_id}!")
 
     # attemt to send the task to the central server
     unencrypted["organizations"] = encrypted_organizations
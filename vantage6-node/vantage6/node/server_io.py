@@ -9,11 +9,14 @@ researchers and finally 3) The ContainerClient which provides
 an interface for algorithms to the central server (this is mainly used
 by master containers).
 """
+import io
 import jwt
 import datetime
-from typing import Tuple
+from http import HTTPStatus
+from typing import BinaryIO, Tuple
 
 # from vantage6.node.encryption import Cryptor, NoCryptor
+from vantage6.common.globals import FEATURE_RESULT_PAYLOAD
 from vantage6.client import ClientBase
 from vantage6.client import WhoAmI
 
@@ -21,6 +24,9 @@ from vantage6.client import WhoAmI
 class NodeClient(ClientBase):
     """ Node interface to the central server."""
 
+    # the input is downloaded straight into the input file of the task
+    binary_payload_fields = ['input']
+
     def __init__(self, *args, **kwargs):
         """ A node is always for a single collaboration."""
         super().__init__(*args, **kwargs)
@@ -101,6 +107,26 @@ class NodeClient(ClientBase):
             node_id=self.whoami.id_
         )
 
+    def get_open_result_ids(self, after_id: int = None) -> list:
+        """ Obtain the ids of the open results of this node.
+
+            Only the ids are retrieved, the results themselves can be
+            retrieved with `get_results` when they are needed.
+
+            :param after_id: only the results with a higher id, i.e. that
+                were assigned after this result
+        """
+        params = {"state": "open", "node_id": self.whoami.id_, "fields": "id"}
+        if after_id:
+            params["after_id"] = after_id
+
+        results = self.request("result", params=params)
+        if not isinstance(results, list):
+            self.log.warn("Requesting the open results failed")
+            self.log.debug(f"Results message: {results}")
+            return []
+        return [result["id"] for result in results]
+
     def is_encrypted_collaboration(self):
         """ Boolean whenever the encryption is enabled.
 
@@ -126,7 +152,84 @@ class NodeClient(ClientBase):
             "started_at": datetime.datetime.now().isoformat()
         })
 
-    def patch_results(self, id: int, initiator_id: int, result: dict):
+    def _decrypt_result(self, result):
+        """ Decrypt the input and result of a result, except for the input
+            of an open result.
+
+            The input of an open result is written to the input file of the
+            task when the task is started. The input can be large, therefore
+            it is decrypted straight into that file by `write_input`.
+        """
+        if result.get("finished_at") or "input" not in result:
+            return super()._decrypt_result(result)
+
+        input_ = result.pop("input")
+        try:
+            super()._decrypt_result(result)
+        finally:
+            result["input"] = input_
+
+    def _get_binary_payloads(self, result: dict):
+        """ The input is not downloaded when a result is retrieved.
+
+            It is downloaded straight into the input file of the task by
+            `write_input`, when the task is started.
+        """
+
+    def write_input(self, result: dict, fp: BinaryIO):
+        """ Decrypt the input of a task into a file.
+
+            If the input was left out when the result was retrieved, it is
+            downloaded as binary data.
+
+            :param result: result (of this node) that contains the input
+            :param fp: (binary) file-like object to write the input to
+        """
+        if "input" not in result:
+            if not self.get_result_payload(result["id"], fp, field="input"):
+                self.log.error("Could not retrieve the input of the task")
+            return
+
+        input_ = result["input"]
+        try:
+            self.cryptor.decrypt_stream(io.StringIO(input_), fp)
+        except Exception as e:
+            # pass the input on as is, like it was done before the input was
+            # decrypted in chunks
+            self.log.error("Could not decrypt the input of the task")
+            self.log.debug(e)
+            fp.seek(0)
+            fp.truncate()
+            fp.write(input_.encode("utf8"))
+
+    def encrypt_result_file(self, path: str, initiator_id: int) -> str:
+        """ Encrypt the output file of an algorithm.
+
+            The file is encrypted in chunks into a new file next to it,
+            so that the output never needs to be in memory completely. If
+            the server supports it, the encrypted message is written as
+            binary data, to be uploaded as such by `patch_results`.
+
+            :param path: path to the output file of the algorithm
+            :param initiator_id: organization id of the origin of the
+                task, for which the results are encrypted
+
+            :returns: path to the encrypted file
+        """
+        public_key = self.get_public_key(initiator_id)
+        if public_key is None:
+            self.log.critical('Public key could not be retrieved...')
+            self.log.critical('Does the initiating organization belong to '
+                              'your organization?')
+
+        binary = self.server_supports(FEATURE_RESULT_PAYLOAD)
+        encrypted_path = f"{path}.encrypted"
+        with open(path, "rb") as in_fp, open(encrypted_path, "wb") as out_fp:
+            self.cryptor.encrypt_stream(in_fp, out_fp, public_key, binary)
+        return encrypted_path
+
+    def patch_results(self, id: int, initiator_id: int, result: dict,
+                      result_file: str = None):
         """ Update the results at the central server.
 
             Typically used when to algorithm container is finished or
@@ -136,20 +239,27 @@ class NodeClient(ClientBase):
             :param initiator_id: organization id of the origin of the
                 task. This is required because we want to encrypt the
                 results specifically for him
+            :param result_file: file with the already encrypted results
+                (see `encrypt_result_file`), used instead of the key
+                `result`
 
             TODO: the key `results` is not always present, e.g. when
                 only the timestamps are updated
-            FIXME: public keys should be cached
         """
-        if "result" in result:
-            msg = f"Retrieving public key from organization={initiator_id}"
-            self.log.debug(msg)
-
-            org = self.request(f"organization/{initiator_id}")
-            public_key = None
-            try:
-                public_key = org["public_key"]
-            except KeyError:
+        if result_file and self.server_supports(FEATURE_RESULT_PAYLOAD):
+            self.log.debug("Uploading results to server")
+            with open(result_file, "rb") as fp:
+                response = self._payload_request("put", id, data=fp)
+            if response.status_code != HTTPStatus.OK:
+                return response.json()
+        elif result_file:
+            with open(result_file, "r") as fp:
+                result["result"] = fp.read()
+
+            self.log.debug("Sending results to server")
+        elif "result" in result:
+            public_key = self.get_public_key(initiator_id)
+            if public_key is None:
                 self.log.critical('Public key could not be retrieved...')
                 self.log.critical('Does the initiating organization belong to '
                                   'your organization?')
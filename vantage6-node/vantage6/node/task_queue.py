@@ -0,0 +1,120 @@
+""" Queue of the tasks of the node
+
+Keeps track of each task (by the id of its result) from the moment it is
+received from the server until its result has been sent back:
+
+- queued: waiting for a task worker
+- starting: a task worker is preparing and starting the container
+- running: the algorithm container is running
+- uploading: the container has exited, the result is being sent
+
+A task that is known in any of these states is not queued again, so that a
+task that is received both by a sync with the server and by a `new_task`
+event is run only once.
+"""
+from collections import deque
+from threading import Condition
+
+STATES = ('queued', 'starting', 'running', 'uploading')
+
+
+class TaskQueue:
+    """Queue of tasks that rejects tasks that are queued or active already.
+
+    The tasks are the results (of this node) that are retrieved from the
+    server, which include their task.
+    """
+
+    def __init__(self):
+        self.__condition = Condition()
+
+        # tasks in the order in which they are started
+        self.__queue = deque()
+
+        # result id -> state of all tasks that are queued or active
+        self.__states = {}
+
+    def put(self, task: dict) -> bool:
+        """Add a task to the end of the queue
+
+        Parameters
+        ----------
+        task : dict
+            Result that contains the task
+
+        Returns
+        -------
+        bool
+            Whether the task has been queued, False if it is queued or
+            active already
+        """
+        with self.__condition:
+            if task['id'] in self.__states:
+                return False
+            self.__states[task['id']] = 'queued'
+            self.__queue.append(task)
+            self.__condition.notify()
+        return True
+
+    def get(self) -> dict:
+        """Wait for the next task, which is then in the `starting` state."""
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__queue)
+            task = self.__queue.popleft()
+            self.__states[task['id']] = 'starting'
+        return task
+
+    def set_state(self, result_id: int, state: str) -> None:
+        """Set the state of an active task
+
+        A task only moves forward through the `STATES`, a task that is
+        uploading already (e.g. because its container exited immediately)
+        is not set back to running.
+
+        Parameters
+        ----------
+        result_id : int
+            Id of the result of the task
+        state : str
+            New state of the task, see `STATES`
+        """
+        with self.__condition:
+            current = self.__states.get(result_id)
+            if current and STATES.index(state) > STATES.index(current):
+                self.__states[result_id] = state
+
+    def remove(self, result_id: int, state: str = None) -> None:
+        """Forget a task that is done, or that is not run after all
+
+        Parameters
+        ----------
+        result_id : int
+            Id of the result of the task
+        state : str, optional
+            Only remove the task when it is in this state
+        """
+        with self.__condition:
+            current = self.__states.get(result_id)
+            if current is None or (state and current != state):
+                return
+            del self.__states[result_id]
+            if current == 'queued':
+                self.__queue = deque(task for task in self.__queue
+                                     if task['id'] != result_id)
+
+    def __contains__(self, result_id: int) -> bool:
+        with self.__condition:
+            return result_id in self.__states
+
+    def qsize(self) -> int:
+        """Number of tasks that wait for a task worker."""
+        with self.__condition:
+            return len(self.__queue)
+
+    def status(self) -> dict:
+        """Number of queued tasks and number of tasks in each state."""
+        with self.__condition:
+            counts = dict.fromkeys(STATES, 0)
+            for state in self.__states.values():
+                counts[state] += 1
+            return {'queue_depth': len(self.__queue), 'states': counts}
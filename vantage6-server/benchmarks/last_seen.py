@@ -0,0 +1,58 @@
+""" Benchmark of read requests with and without buffering of `last_seen`
+
+Sends authenticated GET requests to the API, storing the time the user was
+last seen on every request (a flush interval of 0) or buffering it. Run with:
+
+    python benchmarks/last_seen.py [--requests 1000] [--database sqlite://]
+"""
+import argparse
+import time
+
+from vantage6.server import ServerApp, context
+from vantage6.server.last_seen import LastSeenBuffer
+from vantage6.server.model import Organization, Role, Rule, User
+from vantage6.server.model.base import Database
+from vantage6.server.model.rule import Operation, Scope
+
+
+def create_user() -> User:
+    """User that is allowed to view all organizations."""
+    rule = Rule.get_by_('organization', Scope.GLOBAL, Operation.VIEW)
+    user = User(username='benchmark', password='benchmark',
+                organization=Organization(name='benchmark'),
+                roles=[Role(name='benchmark', rules=[rule])])
+    user.save()
+    return user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=1000,
+                        help='number of requests for each interval')
+    parser.add_argument('--database', default='sqlite://',
+                        help='database URI, by default an in-memory SQLite')
+    args = parser.parse_args()
+
+    Database().connect(args.database, allow_drop_all=True)
+    server = ServerApp(context.TestContext.from_external_config_file(None))
+    create_user()
+
+    client = server.app.test_client()
+    tokens = client.post('/api/token/user', json={
+        'username': 'benchmark', 'password': 'benchmark'
+    }).json
+    headers = {'Authorization': f'Bearer {tokens["access_token"]}'}
+
+    for interval in [0, 1, 10]:
+        LastSeenBuffer().interval = interval
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            client.get('/api/organization', headers=headers)
+        duration = time.perf_counter() - start
+        LastSeenBuffer().flush()
+        print(f'flush interval {interval:>2}s: {args.requests} requests in '
+              f'{duration:.2f}s ({args.requests / duration:.0f} requests/s)')
+
+
+if __name__ == '__main__':
+    main()
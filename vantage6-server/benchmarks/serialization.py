@@ -0,0 +1,84 @@
+""" Benchmark of the serialization of API output
+
+Serializes lists of tasks, results and organizations with the schemas of the
+API, with and without the precomputed links to related resources. Run with:
+
+    python benchmarks/serialization.py [--size 1000] [--repeat 5]
+"""
+import argparse
+import timeit
+
+from vantage6.server import ServerApp, context
+from vantage6.server.model import (
+    Organization,
+    Collaboration,
+    Node,
+    Task,
+    Result
+)
+from vantage6.server.model.base import Database, DatabaseSessionManager
+from vantage6.server.resource._schema import (
+    HATEOASModelSchema,
+    OrganizationSchema,
+    ResultSchema,
+    TaskSchema
+)
+
+
+def create_data(size: int):
+    """Collaboration of `size` organizations with a task for each."""
+    orgs = [Organization(name=f'organization {i}') for i in range(size)]
+    col = Collaboration(name='benchmark', organizations=orgs)
+    session = DatabaseSessionManager.get_session()
+    session.add_all([Node(organization=org, collaboration=col)
+                     for org in orgs])
+    for org in orgs:
+        task = Task(collaboration=col, initiator=org, name='benchmark')
+        session.add_all([Result(task=task, organization=org_)
+                         for org_ in orgs[:10]])
+    session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=1000,
+                        help='number of objects to serialize')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of times to serialize them')
+    args = parser.parse_args()
+
+    Database().connect('sqlite://', allow_drop_all=True)
+    server = ServerApp(context.TestContext.from_external_config_file(None))
+    create_data(args.size)
+
+    session = DatabaseSessionManager.get_session()
+    benchmarks = [
+        ('task', TaskSchema(), session.query(Task).all()),
+        ('result', ResultSchema(exclude=['node']),
+         session.query(Result).limit(args.size).all()),
+        ('organization', OrganizationSchema(),
+         session.query(Organization).all()),
+    ]
+    link_templates = HATEOASModelSchema.link_templates
+
+    with server.app.test_request_context():
+        for name, schema, objects in benchmarks:
+            # the first dump loads the related objects from the database
+            schema.dump(objects, many=True)
+
+            times = {}
+            for label, templates in [('url_for', {}),
+                                     ('templates', link_templates)]:
+                HATEOASModelSchema.link_templates = templates
+                times[label] = min(timeit.repeat(
+                    lambda: schema.dump(objects, many=True),
+                    number=1, repeat=args.repeat
+                ))
+            print(f'{name:>12}: {len(objects)} objects, '
+                  f'url_for {times["url_for"]:.3f}s, '
+                  f'templates {times["templates"]:.3f}s '
+                  f'({times["url_for"] / times["templates"]:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+""" Benchmark of the creation of tasks in large collaborations
+
+Creates tasks for all organizations of a collaboration through the API, for
+collaborations of several sizes. Run with:
+
+    python benchmarks/task_creation.py [--sizes 10 100 300] [--repeat 5]
+        [--database sqlite://]
+"""
+import argparse
+import time
+
+from vantage6.server import ServerApp, context
+from vantage6.server.model import (
+    Collaboration,
+    Node,
+    Organization,
+    Role,
+    Rule,
+    User
+)
+from vantage6.server.model.base import Database, DatabaseSessionManager
+from vantage6.server.model.rule import Operation, Scope
+
+
+def create_collaboration(size: int, initiator: Organization) -> Collaboration:
+    """Collaboration of `size` organizations that each have a node."""
+    orgs = [initiator] + [Organization(name=f'organization {i}')
+                          for i in range(size - 1)]
+    col = Collaboration(name=f'benchmark {size}', organizations=orgs)
+    session = DatabaseSessionManager.get_session()
+    session.add_all([Node(organization=org, collaboration=col)
+                     for org in orgs])
+    session.commit()
+    return col
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10, 100, 300],
+                        help='numbers of organizations in the collaboration')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of tasks to create for each size')
+    parser.add_argument('--database', default='sqlite://',
+                        help='database URI, by default an in-memory SQLite')
+    args = parser.parse_args()
+
+    Database().connect(args.database, allow_drop_all=True)
+    server = ServerApp(context.TestContext.from_external_config_file(None))
+
+    rule = Rule.get_by_('task', Scope.GLOBAL, Operation.CREATE)
+    initiator = Organization(name='initiator')
+    User(username='benchmark', password='benchmark', organization=initiator,
+         roles=[Role(name='benchmark', rules=[rule])]).save()
+
+    client = server.app.test_client()
+    tokens = client.post('/api/token/user', json={
+        'username': 'benchmark', 'password': 'benchmark'
+    }).json
+    headers = {'Authorization': f'Bearer {tokens["access_token"]}'}
+
+    for size in args.sizes:
+        col = create_collaboration(size, initiator)
+        data = {
+            'collaboration_id': col.id,
+            'image': 'benchmark',
+            'organizations': [{'id': org.id, 'input': 'x' * 1000}
+                              for org in col.organizations],
+        }
+
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            rv = client.post('/api/task', headers=headers, json=data)
+            times.append(time.perf_counter() - start)
+            assert rv.status_code == 201, rv.json
+
+        print(f'{size:>5} organizations: {min(times) * 1000:.0f} ms '
+              f'(min of {args.repeat})')
+
+
+if __name__ == '__main__':
+    main()
@@ -65,7 +65,11 @@ setup(
     extras_require={
         'dev': [
             'termcolor==1.1.0',
-            'coverage==4.5.4'
+            'coverage==4.5.4',
+            'moto[s3]==4.2.14'
+        ],
+        's3': [
+            'boto3'
         ]
     },
     package_data={
@@ -0,0 +1,43 @@
+import unittest
+
+from vantage6.server.metrics import Counter, Histogram, Registry
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_render(self):
+        registry = Registry()
+        counter = registry.register(Counter('requests', 'Requests',
+                                            ('path', )))
+        histogram = registry.register(Histogram('duration', 'Duration',
+                                                buckets=(1, 5)))
+        counter.inc(path='/a "b"')
+        counter.inc(2, path='/a "b"')
+        for value in [0.5, 3, 10]:
+            histogram.observe(value)
+
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP requests Requests',
+            '# TYPE requests counter',
+            'requests{path="/a \\"b\\""} 3.0',
+            '# HELP duration Duration',
+            '# TYPE duration histogram',
+            'duration_bucket{le="1.0"} 1.0',
+            'duration_bucket{le="5.0"} 2.0',
+            'duration_bucket{le="+Inf"} 3.0',
+            'duration_sum 13.5',
+            'duration_count 3.0',
+        ])
+
+    def test_labels(self):
+        counter = Counter('requests', 'Requests', ('path', ))
+        with self.assertRaises(ValueError):
+            counter.inc(method='GET')
+
+    def test_collector(self):
+        registry = Registry()
+        calls = []
+        registry.set_collector('test', lambda: calls.append(1))
+        registry.set_collector('test', lambda: calls.append(2))
+        registry.render()
+        self.assertEqual(calls, [2])
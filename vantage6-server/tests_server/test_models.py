@@ -2,12 +2,23 @@ import logging
 import unittest
 import yaml
 import datetime
+import bcrypt
+import tempfile
 
-from sqlalchemy.exc import IntegrityError
+from pathlib import Path
+from unittest.mock import patch
+from sqlalchemy import MetaData, Table, create_engine, inspect
+from sqlalchemy.exc import IntegrityError, TimeoutError
 from sqlalchemy.orm.exc import NoResultFound
 
 from vantage6.server.controller.fixture import load
-from vantage6.server.model.base import Database, DatabaseSessionManager
+from vantage6.server.model.base import (
+    Base,
+    Database,
+    DatabaseSessionManager,
+    MeasuredQueuePool
+)
+from vantage6.server.model.migrations import MIGRATIONS
 from vantage6.server.globals import PACAKAGE_FOLDER, APPNAME
 
 from vantage6.server import db
@@ -19,7 +30,8 @@ from vantage6.server.model import (
     Result,
     Node,
     Rule,
-    Role
+    Role,
+    Counter
 )
 from vantage6.server.model.rule import Scope, Operation
 
@@ -169,6 +181,69 @@ class TestNodeModel(TestBaseModel):
         node.save()
         self.assertIsInstance(Node.get_by_api_key("some-secret-monkeys"), Node)
 
+    def test_api_key_fingerprint(self):
+        node = Node(name="fingerprinted", api_key="fingerprinted-key")
+        node.save()
+        self.assertEqual(node.api_key_fingerprint,
+                         Node.fingerprint("fingerprinted-key"))
+        self.assertNotIn("fingerprinted-key", node.api_key_fingerprint)
+        self.assertIsNone(Node.get_by_api_key("not-the-fingerprinted-key"))
+
+    def test_api_key_fingerprint_migration(self):
+        # nodes created before fingerprints were introduced have none
+        node = Node(name="legacy", api_key="legacy-key")
+        node.save()
+        node.api_key_fingerprint = None
+        node.save()
+
+        self.assertEqual(Node.get_by_api_key("legacy-key"), node)
+        self.assertEqual(node.api_key_fingerprint,
+                         Node.fingerprint("legacy-key"))
+
+    def test_api_key_fingerprint_end_date(self):
+        node = Node(name="expired", api_key="expired-key")
+        node.save()
+        node.api_key_fingerprint = None
+        node.save()
+        self.assertIn(node, Node.legacy_nodes())
+
+        # after the end date the node needs a new API key
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        with patch.object(Node, "legacy_api_keys_until", yesterday):
+            self.assertIsNone(Node.get_by_api_key("expired-key"))
+            api_key = node.rekey()
+            self.assertEqual(Node.get_by_api_key(api_key), node)
+        self.assertNotIn(node, Node.legacy_nodes())
+
+    def test_invalid_legacy_api_key_is_remembered(self):
+        node = Node(name="legacy-invalid", api_key="legacy-valid-key")
+        node.save()
+        node.api_key_fingerprint = None
+        node.save()
+
+        with patch("bcrypt.checkpw", wraps=bcrypt.checkpw) as checkpw:
+            self.assertIsNone(Node.get_by_api_key("legacy-invalid-key"))
+            self.assertGreaterEqual(checkpw.call_count, 1)
+            checkpw.reset_mock()
+
+            # the keys of the legacy nodes are not checked again
+            self.assertIsNone(Node.get_by_api_key("legacy-invalid-key"))
+            self.assertEqual(checkpw.call_count, 0)
+
+        self.assertEqual(Node.get_by_api_key("legacy-valid-key"), node)
+
+    def test_get_by_api_key_checks_single_hash(self):
+        # cheap hashes, we are only interested in the number of checks
+        gensalt = bcrypt.gensalt
+        with patch("bcrypt.gensalt", lambda: gensalt(4)):
+            for i in range(100):
+                Node(name=f"many-{i}", api_key=f"many-key-{i}").save()
+
+        with patch("bcrypt.checkpw", wraps=bcrypt.checkpw) as checkpw:
+            node = Node.get_by_api_key("many-key-42")
+        self.assertEqual(node.name, "many-42")
+        self.assertEqual(checkpw.call_count, 1)
+
     def test_relations(self):
         node = Node.get()[0]
         self.assertIsNotNone(node)
@@ -299,6 +374,28 @@ class TestTaskModel(TestBaseModel):
             if task.id > highest_id:
                 highest_id = task.id
 
+    def test_next_run_id(self):
+        # continues after the run ids of the existing tasks
+        highest = max(task.run_id or 0 for task in Task.get())
+        first = Task.next_run_id()
+        self.assertGreater(first, highest)
+        self.assertEqual(Task.next_run_id(), first + 1)
+        DatabaseSessionManager.get_session().commit()
+        self.assertEqual(Task.next_run_id(), first + 2)
+
+    def test_counter_created_concurrently(self):
+        session = DatabaseSessionManager.get_session()
+
+        def start():
+            # another request creates the counter in the meantime
+            session.execute(Counter.__table__.insert().values(
+                name='concurrent', value=10))
+            return 1
+
+        self.assertEqual(Counter.next_value('concurrent', start), 11)
+        self.assertEqual(Counter.next_value('concurrent', start), 12)
+        session.commit()
+
     def test_relations(self):
         db_task = Task.get()
         for task in db_task:
@@ -353,3 +450,92 @@ class TestRuleModel(TestBaseModel):
 
             for user in rule.users:
                 self.assertIsInstance(user, User)
+
+
+class TestDatabase(unittest.TestCase):
+
+    def test_sqlite_pragmas(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            Database().connect(f"sqlite:///{Path(tmp) / 'test.sqlite'}",
+                               allow_drop_all=True, sqlite_wal=True,
+                               sqlite_busy_timeout=1234)
+            engine = Database().engine
+            try:
+                self.assertEqual(
+                    engine.execute("PRAGMA journal_mode").scalar(), "wal"
+                )
+                self.assertEqual(
+                    engine.execute("PRAGMA busy_timeout").scalar(), 1234
+                )
+            finally:
+                engine.dispose()
+                Database().close()
+
+    def test_migrations(self):
+        # columns that have been added to existing tables by the migrations
+        migrated = {
+            'node': {'api_key_fingerprint'},
+            'task': {'shared_input', 'shared_input_ref', 'result_count',
+                     'finished_count', 'failed_count'},
+            'result': {'input_ref', 'result_ref', 'result_binary',
+                       'exit_code'},
+        }
+
+        with tempfile.TemporaryDirectory() as tmp:
+            uri = f"sqlite:///{Path(tmp) / 'test.sqlite'}"
+
+            # database that was created before the migrations
+            engine = create_engine(uri)
+            old = MetaData()
+            for table in Base.metadata.sorted_tables:
+                if table.name != 'schema_migration':
+                    Table(table.name, old, *[
+                        column.copy() for column in table.columns
+                        if column.name not in migrated.get(table.name, ())
+                    ])
+            old.create_all(bind=engine)
+            engine.execute("INSERT INTO task (id, run_id) VALUES (1, 1)")
+            engine.execute("INSERT INTO result (task_id, finished_at) "
+                           "VALUES (1, '2022-01-01 00:00:00'), (1, NULL)")
+            engine.dispose()
+
+            Database().connect(uri, allow_drop_all=True)
+            engine = Database().engine
+            try:
+                inspector = inspect(engine)
+                for table, columns in migrated.items():
+                    existing = {column['name'] for column
+                                in inspector.get_columns(table)}
+                    self.assertLessEqual(columns, existing)
+                self.assertIn('ix_node_api_key_fingerprint',
+                              [index['name'] for index
+                               in inspector.get_indexes('node')])
+                self.assertEqual(
+                    list(engine.execute("SELECT result_count, finished_count, "
+                                        "failed_count FROM task")),
+                    [(2, 1, 0)]
+                )
+                self.assertEqual(
+                    {row.name for row in engine.execute(
+                        "SELECT name FROM schema_migration")},
+                    {name for name, _ in MIGRATIONS}
+                )
+            finally:
+                engine.dispose()
+                Database().close()
+
+    def test_measured_pool(self):
+        engine = create_engine("sqlite://", poolclass=MeasuredQueuePool,
+                               pool_size=1, max_overflow=0, pool_timeout=0.1)
+        pool = engine.pool
+
+        connection = engine.connect()
+        with self.assertRaises(TimeoutError):
+            engine.connect()
+        connection.close()
+        engine.connect().close()
+
+        self.assertEqual(pool.checkouts, 3)
+        self.assertEqual(pool.timeouts, 1)
+        self.assertGreaterEqual(pool.max_wait_time, 0.1)
+        self.assertGreaterEqual(pool.wait_time, pool.max_wait_time)
@@ -1,15 +1,18 @@
 # -*- coding: utf-8 -*-
 import datetime
+import time
 from uuid import uuid1
 import yaml
 import unittest
 import logging
 import json
 import uuid
+import base64
 
 from http import HTTPStatus
-from unittest.mock import patch
-from flask import Response as BaseResponse
+from unittest.mock import MagicMock, call, patch
+from flask import Response as BaseResponse, url_for
+from sqlalchemy import event
 from flask.testing import FlaskClient
 from werkzeug.utils import cached_property
 
@@ -24,6 +27,9 @@ from vantage6.server import context
 from vantage6.server._version import __version__
 from vantage6.server.model.base import Database, DatabaseSessionManager
 from vantage6.server.controller.fixture import load
+from vantage6.server.resource._schema import HATEOASModelSchema
+from vantage6.server.permission import PermissionCache
+from vantage6.server.last_seen import LastSeenBuffer
 
 
 logger = logger_name(__name__)
@@ -218,6 +224,43 @@ class TestResources(unittest.TestCase):
         r = json.loads(rv.data)
         self.assertIn('version', r)
         self.assertEqual(r['version'], __version__)
+        self.assertIn('shared_input', r['features'])
+
+    def test_stats_permission(self):
+        rv = self.app.get('/api/stats')
+        self.assertEqual(rv.status_code, HTTPStatus.UNAUTHORIZED)
+
+        # the statistics are only for users with the permission
+        headers = self.create_user_and_login()
+        rv = self.app.get('/api/stats', headers=headers)
+        self.assertEqual(rv.status_code, HTTPStatus.UNAUTHORIZED)
+
+        rule = Rule.get_by_('stats', Scope.GLOBAL, Operation.VIEW)
+        headers = self.create_user_and_login(rules=[rule])
+        rv = self.app.get('/api/stats', headers=headers)
+        self.assertEqual(rv.status_code, HTTPStatus.OK)
+
+        headers = self.login('root')
+        rv = self.app.get('/api/stats', headers=headers)
+        self.assertEqual(rv.status_code, HTTPStatus.OK)
+        # the in-memory SQLite database of the tests uses a single connection
+        self.assertEqual(rv.json['database']['pool']['type'],
+                         'SingletonThreadPool')
+
+    def test_metrics(self):
+        self.app.get('/api/version')
+        rv = self.app.get('/metrics')
+        self.assertEqual(rv.status_code, HTTPStatus.OK)
+        self.assertTrue(rv.content_type.startswith('text/plain'))
+
+        lines = rv.data.decode().splitlines()
+        for prefix in ['vantage6_http_requests_total{method="GET",'
+                       'endpoint="/api/version",status="200"}',
+                       'vantage6_db_queries_per_request_count{',
+                       'vantage6_tasks{status="open"}',
+                       'vantage6_results{status="open"}']:
+            self.assertTrue(any(line.startswith(prefix) for line in lines),
+                            prefix)
 
     def test_token_different_users(self):
         for type_ in ["root", "admin", "user"]:
@@ -1350,6 +1393,30 @@ class TestResources(unittest.TestCase):
                                  })
         self.assertEqual(results.status_code, HTTPStatus.UNAUTHORIZED)
 
+    def test_patch_organization_public_key_notifies(self):
+        col = Collaboration()
+        org = Organization(name="new-key", collaborations=[col])
+        org.save()
+
+        rule = Rule.get_by_("organization", Scope.GLOBAL, Operation.EDIT)
+        headers = self.create_user_and_login(rules=[rule])
+        with patch.object(self.server.socketio, "emit") as emit:
+            results = self.app.patch(f'/api/organization/{org.id}',
+                                     headers=headers, json={
+                                         "public_key": "a2V5"
+                                     })
+        self.assertEqual(results.status_code, HTTPStatus.OK)
+        rooms = [call[1]['room'] for call in emit.call_args_list
+                 if call[0][0] == 'public_key_updated']
+        self.assertIn(f'collaboration_{col.id}', rooms)
+        self.assertIn('all_users', rooms)
+
+        # other fields do not invalidate the public key
+        with patch.object(self.server.socketio, "emit") as emit:
+            self.app.patch(f'/api/organization/{org.id}', headers=headers,
+                           json={"name": "still-the-same-key"})
+        emit.assert_not_called()
+
     def test_organization_view_nodes(self):
 
         # create organization, collaboration and node
@@ -2245,6 +2312,457 @@ class TestResources(unittest.TestCase):
         # cleanup
         node.delete()
 
+    def test_create_task_shared_input(self):
+        org = Organization()
+        org2 = Organization()
+        col = Collaboration(organizations=[org, org2])
+        col.save()
+        node = Node(organization=org, collaboration=col)
+        node2 = Node(organization=org2, collaboration=col)
+        node.save()
+        node2.save()
+
+        rule = Rule.get_by_("task", Scope.ORGANIZATION, Operation.CREATE)
+        headers = self.create_user_and_login(org, rules=[rule])
+        results = self.app.post('/api/task', headers=headers, json={
+            "organizations": [
+                {'id': org.id, 'input': 'key-1$'},
+                {'id': org2.id, 'input': 'key-2$'}
+            ],
+            'collaboration_id': col.id,
+            'shared_input': 'iv$message'
+        })
+        self.assertEqual(results.status_code, HTTPStatus.CREATED)
+        task_id = results.json['id']
+        self.assertNotIn('shared_input', results.json)
+
+        # the shared input is appended to the input of each organization
+        rule = Rule.get_by_("result", Scope.GLOBAL, Operation.VIEW)
+        headers = self.create_user_and_login(rules=[rule])
+        results = self.app.get(f'/api/task/{task_id}/result', headers=headers)
+        self.assertEqual(results.status_code, HTTPStatus.OK)
+        inputs = {res['organization']: res['input']
+                  for res in results.json}
+        self.assertEqual(inputs, {
+            org.id: 'key-1$iv$message',
+            org2.id: 'key-2$iv$message'
+        })
+
+        result_id = Task.get(task_id).results[0].id
+        results = self.app.get(f'/api/result/{result_id}', headers=headers)
+        self.assertTrue(results.json['input'].endswith('$iv$message'))
+
+        # cleanup
+        node.delete()
+        node2.delete()
+
+    def test_result_payload(self):
+        org = Organization()
+        col = Collaboration(organizations=[org], encrypted=True)
+        task = Task(collaboration=col, image="some-image",
+                    shared_input='aXY=$aW5wdXQ=')
+        res = Result(task=task, organization=org, input='a2V5$')
+        res.save()
+        headers = self.create_node_and_login(org, col)
+
+        # the encrypted message is binary, the key and iv are left as is
+        message = bytes(range(256)) * 1000
+        rv = self.app.put(f'/api/result/{res.id}/payload', headers=headers,
+                          data=b'a2V5$aXY=$' + message,
+                          content_type='application/octet-stream')
+        self.assertEqual(rv.status_code, HTTPStatus.OK)
+
+        # the result is stored as it would have been send in JSON
+        rv = self.app.patch(f'/api/result/{res.id}', headers=headers, json={
+            'finished_at': datetime.datetime.now().isoformat(),
+            'log': 'log'
+        })
+        self.assertEqual(rv.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            rv.json['result'],
+            'a2V5$aXY=$' + base64.b64encode(message).decode()
+        )
+        rv = self.app.get(f'/api/result/{res.id}?exclude=result',
+                          headers=headers)
+        self.assertNotIn('result', rv.json)
+
+        rv = self.app.get(f'/api/result/{res.id}/payload', headers=headers)
+        self.assertEqual(rv.status_code, HTTPStatus.OK)
+        self.assertEqual(rv.data, b'a2V5$aXY=$' + message)
+
+        rv = self.app.get(f'/api/result/{res.id}/payload?field=input',
+                          headers=headers)
+        self.assertEqual(rv.data, b'a2V5$aXY=$input')
+
+        # a finished result can not be changed
+        rv = self.app.put(f'/api/result/{res.id}/payload', headers=headers,
+                          data=b'a2V5$aXY=$' + message,
+                          content_type='application/octet-stream')
+        self.assertEqual(rv.status_code, HTTPStatus.BAD_REQUEST)
+
+        # unencrypted collaborations only contain the message
+        col2 = Collaboration(organizations=[org], encrypted=False)
+        res2 = Result(task=Task(collaboration=col2), organization=org)
+        res2.save()
+        headers = self.create_node_and_login(org, col2)
+        rv = self.app.get(f'/api/result/{res2.id}/payload', headers=headers)
+        self.assertEqual(rv.status_code, HTTPStatus.NO_CONTENT)
+        rv = self.app.put(f'/api/result/{res2.id}/payload', headers=headers,
+                          data=message,
+                          content_type='application/octet-stream')
+        self.assertEqual(rv.status_code, HTTPStatus.OK)
+        rv = self.app.get(f'/api/result/{res2.id}', headers=headers)
+        self.assertEqual(rv.json['result'], base64.b64encode(message).decode())
+
+    def test_result_sparse_fieldsets(self):
+        org = Organization()
+        col = Collaboration(organizations=[org])
+        task = Task(collaboration=col, image="some-image")
+        res = Result(task=task, organization=org, input='input',
+                     result='result', log='log')
+        res.save()
+        node = Node(organization=org, collaboration=col)
+        node.save()
+        headers = self.login("root")
+
+        rv = self.app.get(f'/api/result?task_id={task.id}'
+                          '&fields=started_at,finished_at', headers=headers)
+        self.assertEqual(rv.status_code, HTTPStatus.OK)
+        self.assertEqual(rv.json, [
+            {'id': res.id, 'started_at': None, 'finished_at': None}
+        ])
+
+        rv = self.app.get(f'/api/result/{res.id}?fields=result&fields=log',
+                          headers=headers)
+        self.assertEqual(rv.json, {'id': res.id, 'result': 'result',
+                                   'log': 'log'})
+
+        rv = self.app.get(f'/api/task?collaboration_id={col.id}'
+                          '&include=result&fields=name,results.input',
+                          headers=headers)
+        self.assertEqual(rv.status_code, HTTPStatus.OK)
+        self.assertEqual(rv.json, [{
+            'id': task.id, 'name': None,
+            'results': [{'id': res.id, 'input': 'input'}]
+        }])
+
+        for url in ['/api/result?fields=secret',
+                    f'/api/result/{res.id}?fields=id,secret',
+                    '/api/task?fields=results.secret']:
+            rv = self.app.get(url, headers=headers)
+            self.assertEqual(rv.status_code, HTTPStatus.BAD_REQUEST)
+
+        # cleanup
+        node.delete()
+
+    def test_result_ids_after_id(self):
+        org = Organization()
+        col = Collaboration(organizations=[org])
+        node, api_key = self.create_node(org, col)
+        headers = self.login_node(api_key)
+        results = [Result(organization=org) for _ in range(3)]
+        Task(collaboration=col, results=results).save()
+        results[2].finished_at = datetime.datetime.now()
+        results[2].save()
+
+        # the open results of the node that were assigned after the first
+        url = f'/api/result?state=open&node_id={node.id}&fields=id'
+        rv = self.app.get(f'{url}&after_id={results[0].id}', headers=headers)
+        self.assertEqual(rv.status_code, HTTPStatus.OK)
+        self.assertEqual(rv.json, [{'id': results[1].id}])
+
+        rv = self.app.get(url, headers=headers)
+        self.assertEqual([result['id'] for result in rv.json],
+                         [results[1].id, results[0].id])
+
+        # cleanup
+        node.delete()
+
+    def test_cursor_pagination(self):
+        col = Collaboration()
+        tasks = [Task(collaboration=col) for _ in range(5)]
+        col.save()
+        task_ids = sorted([task.id for task in tasks], reverse=True)
+        headers = self.login("root")
+
+        # follow the next links until the last page
+        ids, pages = [], 0
+        url = f'/api/task?collaboration_id={col.id}&per_page=2&cursor='
+        while url:
+            rv = self.app.get(url, headers=headers)
+            self.assertEqual(rv.status_code, HTTPStatus.OK)
+            self.assertNotIn('total-count', rv.headers)
+            ids += [task['id'] for task in rv.json]
+            pages += 1
+            links = [link.split('; rel=')
+                     for link in rv.headers['Link'].split(',')]
+            links = {rel: url[1:-1] for url, rel in links}
+            url = links.get('next')
+        self.assertEqual(ids, task_ids)
+        self.assertEqual(pages, 3)
+
+        rv = self.app.get(f'/api/task?collaboration_id={col.id}&per_page=2'
+                          '&cursor=&include=total&include=metadata',
+                          headers=headers)
+        self.assertEqual(rv.headers['total-count'], '5')
+        self.assertEqual([task['id'] for task in rv.json['data']],
+                         task_ids[:2])
+        self.assertEqual(set(rv.json['links']), {'first', 'self', 'next'})
+
+    def count_queries(self, url, headers):
+        """Number of SQL statements that are executed for a GET request."""
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        # the permissions of the identity are cached by the first request
+        self.app.get(url, headers=headers)
+
+        engine = Database().engine
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            rv = self.app.get(url, headers=headers)
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+        self.assertEqual(rv.status_code, HTTPStatus.OK)
+        return len(statements)
+
+    def test_list_query_count(self):
+        headers = self.login("root")
+
+        def create_task(n_organizations):
+            orgs = [Organization() for _ in range(n_organizations)]
+            col = Collaboration(organizations=orgs)
+            nodes = [Node(organization=org, collaboration=col)
+                     for org in orgs]
+            parent = Task(collaboration=col, initiator=orgs[0])
+            task = Task(collaboration=col, initiator=orgs[0], parent=parent)
+            for org in orgs:
+                Result(task=task, organization=org, input='input')
+            for node in nodes:
+                node.save()
+            return task.id, col.id
+
+        # the number of queries does not depend on the number of results
+        small_task, small_col = create_task(2)
+        large_task, large_col = create_task(20)
+        for url in ['/api/result?include=task&task_id={task}',
+                    '/api/result?task_id={task}',
+                    '/api/task?include=result&collaboration_id={col}']:
+            self.assertEqual(
+                self.count_queries(
+                    url.format(task=small_task, col=small_col), headers),
+                self.count_queries(
+                    url.format(task=large_task, col=large_col), headers),
+                url
+            )
+
+    def test_create_task_query_count(self):
+        headers = self.login("root")
+        root_org = User.get_by_username("root").organization
+
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        def create_task(n_organizations):
+            orgs = [root_org] + [Organization()
+                                 for _ in range(n_organizations - 1)]
+            col = Collaboration(organizations=orgs)
+            for org in orgs:
+                Node(organization=org, collaboration=col).save()
+            col_id, org_ids = col.id, [org.id for org in orgs]
+
+            statements.clear()
+            engine = Database().engine
+            event.listen(engine, 'before_cursor_execute', count)
+            try:
+                rv = self.app.post('/api/task', headers=headers, json={
+                    "collaboration_id": col_id,
+                    "organizations": [{"id": id_, "input": "input"}
+                                      for id_ in org_ids],
+                    "image": "some-image"
+                })
+            finally:
+                event.remove(engine, 'before_cursor_execute', count)
+            self.assertEqual(rv.status_code, HTTPStatus.CREATED)
+
+            task = Task.get(rv.json["id"])
+            self.assertEqual(len(task.results), n_organizations)
+            self.assertTrue(all(r.input == "input" for r in task.results))
+            return len(statements)
+
+        # the results of all organizations are inserted at once (the first
+        # task caches the permissions of the user)
+        create_task(2)
+        self.assertEqual(create_task(2), create_task(10))
+
+    def test_create_task_notifies_assigned_nodes(self):
+        headers = self.login("root")
+        root_org = User.get_by_username("root").organization
+        orgs = [root_org, Organization(), Organization()]
+        col = Collaboration(organizations=orgs)
+        nodes = [Node(organization=org, collaboration=col) for org in orgs]
+        for node in nodes:
+            node.save()
+
+        with patch.object(self.server.socketio, "emit") as emit:
+            rv = self.app.post('/api/task', headers=headers, json={
+                "collaboration_id": col.id,
+                "organizations": [{"id": orgs[1].id, "input": "input"}],
+                "image": "some-image"
+            })
+        self.assertEqual(rv.status_code, HTTPStatus.CREATED)
+
+        # the collaboration receives the task id, as before. Only the node of
+        # the assigned organization is sent its result
+        result = Task.get(rv.json["id"]).results[0]
+        self.assertEqual(emit.call_args_list, [
+            call('new_task', rv.json["id"], namespace='/tasks',
+                 room=f'collaboration_{col.id}'),
+            call('task_assigned',
+                 {'task_id': rv.json["id"], 'result_id': result.id},
+                 namespace='/tasks', room=f'node_{nodes[1].id}'),
+        ])
+
+    def test_task_completion_counters(self):
+        headers = self.login("root")
+        org = Organization()
+        col = Collaboration(organizations=[org])
+        task = Task(collaboration=col, results=[
+            Result(organization=org),
+            Result(organization=org, finished_at=datetime.datetime.now()),
+        ])
+        task.save()
+        open_result = task.results[0]
+        self.assertEqual((task.result_count, task.finished_count), (2, 1))
+        self.assertFalse(task.complete)
+
+        def filtered(status):
+            rv = self.app.get(f'/api/task?status={status}',
+                              headers=headers)
+            self.assertEqual(rv.status_code, HTTPStatus.OK)
+            return {task_['id'] for task_ in rv.json}
+
+        self.assertIn(task.id, filtered('open'))
+        self.assertNotIn(task.id, filtered('complete'))
+
+        open_result.finished_at = datetime.datetime.now()
+        open_result.save()
+        task = Task.get(task.id)
+        self.assertEqual(task.finished_count, 2)
+        self.assertTrue(task.complete)
+        self.assertIn(task.id, filtered('complete'))
+        self.assertNotIn(task.id, filtered('open'))
+        self.assertNotIn(task.id, filtered('failed'))
+
+        # a result fails when it finishes with a non-zero exit code
+        failed_result = Result(task=task, organization=org)
+        failed_result.save()
+        failed_result.finished_at = datetime.datetime.now()
+        failed_result.exit_code = 1
+        failed_result.save()
+        failed_result.exit_code = 2
+        failed_result.save()
+        task = Task.get(task.id)
+        self.assertEqual((task.result_count, task.finished_count,
+                          task.failed_count), (3, 3, 1))
+        self.assertIn(task.id, filtered('failed'))
+
+        failed_result.delete()
+        task = Task.get(task.id)
+        self.assertEqual((task.result_count, task.finished_count,
+                          task.failed_count), (2, 2, 0))
+        self.assertNotIn(task.id, filtered('failed'))
+
+        rv = self.app.get('/api/task?status=unknown', headers=headers)
+        self.assertEqual(rv.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_link_templates(self):
+        templates = HATEOASModelSchema.link_templates
+        self.assertIn('result_with_id', templates)
+
+        app = self.server.app
+        with app.test_request_context():
+            for endpoint, (template, methods) in templates.items():
+                self.assertEqual(template.format(id=7),
+                                 url_for(endpoint, id=7))
+                rule = app.url_map._rules_by_endpoint[endpoint][0]
+                self.assertEqual(set(methods),
+                                 rule.methods - {'HEAD', 'OPTIONS'})
+
+    def test_permission_cache(self):
+        user = self.create_user()
+        headers = self.login(user.username)
+        rv = self.app.get('/api/result', headers=headers)
+        self.assertEqual(rv.status_code, HTTPStatus.UNAUTHORIZED)
+
+        # the cached permissions are dropped when the user gets a role
+        rule = Rule.get_by_("result", Scope.GLOBAL, Operation.VIEW)
+        role = Role(name="result viewer", rules=[rule])
+        user.roles.append(role)
+        user.save()
+        rv = self.app.get('/api/result', headers=headers)
+        self.assertEqual(rv.status_code, HTTPStatus.OK)
+
+        # ... or when the rules of the role change
+        role.rules.remove(rule)
+        role.save()
+        rv = self.app.get('/api/result', headers=headers)
+        self.assertEqual(rv.status_code, HTTPStatus.UNAUTHORIZED)
+
+        # other changes leave the cache intact
+        version = PermissionCache().version
+        user.firstname = "new name"
+        user.save()
+        self.app.get('/api/result', headers=headers)
+        self.assertEqual(PermissionCache().version, version)
+
+    def test_last_seen(self):
+        user = self.create_user()
+        headers = self.login(user.username)
+
+        # the time the user was seen is only stored when the buffer is flushed
+        LastSeenBuffer().flush()
+        last_seen = User.get(user.id).last_seen
+        self.app.get('/api/user', headers=headers)
+        self.assertEqual(User.get(user.id).last_seen, last_seen)
+
+        LastSeenBuffer().flush()
+        self.assertGreater(User.get(user.id).last_seen, last_seen or
+                           datetime.datetime.min)
+
+        # an older time does not overwrite a newer one
+        last_seen = User.get(user.id).last_seen
+        LastSeenBuffer().seen(user.id, datetime.datetime(2000, 1, 1))
+        LastSeenBuffer().flush()
+        self.assertEqual(User.get(user.id).last_seen, last_seen)
+
+    def test_last_seen_periodic_flush(self):
+        user = self.create_user()
+        buffer = LastSeenBuffer()
+        buffer.flush()
+        buffer.seen(user.id, datetime.datetime(2100, 1, 1))
+
+        # the background task flushes once the interval has passed
+        socketio = MagicMock()
+        socketio.sleep.side_effect = [None, StopIteration]
+        with patch.object(buffer, '_LastSeenBuffer__flushing', False):
+            buffer.start_periodic_flush(socketio)
+        flush_periodically, sleep = \
+            socketio.start_background_task.call_args[0]
+        self.assertEqual(len(buffer), 1)
+        with patch('vantage6.server.last_seen.time.monotonic',
+                   return_value=time.monotonic() + buffer.interval), \
+                self.assertRaises(StopIteration):
+            flush_periodically(sleep)
+
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(User.get(user.id).last_seen,
+                         datetime.datetime(2100, 1, 1))
+
     def test_create_task_permissions_as_container(self):
         org = Organization()
         col = Collaboration(organizations=[org])
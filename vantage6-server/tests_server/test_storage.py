@@ -0,0 +1,159 @@
+import base64
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from vantage6.server.model.base import Database, DatabaseSessionManager
+from vantage6.server.model import Organization, Collaboration, Task, Result
+from vantage6.server.storage import (
+    Storage, FileSystemStorage, S3Storage, checked_payload
+)
+
+# imported after vantage6.server, which monkeypatches the standard library
+# (gevent). `mock_aws` replaced `mock_s3` in moto 5, which requires a newer
+# Python than the one we support.
+try:
+    from moto import mock_aws
+except ImportError:
+    try:
+        from moto import mock_s3 as mock_aws
+    except ImportError:
+        mock_aws = None
+
+PAYLOAD = 'a2V5$aXY=$' + 'bWVzc2FnZQ==' * 1000
+
+
+class TestFileSystemStorage(unittest.TestCase):
+
+    def test_put_get(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = FileSystemStorage(Path(tmp) / 'payloads')
+
+            reference = storage.put(b'some payload')
+            self.assertEqual(storage.get(reference), b'some payload')
+
+            # payloads are stored by their content
+            self.assertEqual(storage.put(b'some payload'), reference)
+            self.assertNotEqual(storage.put(b'other payload'), reference)
+            self.assertEqual(len(list(Path(tmp).glob('payloads/*/*'))), 2)
+
+    def test_put_get_stream(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = FileSystemStorage(Path(tmp))
+
+            reference, size = storage.put_stream([b'some ', b'payload'])
+            self.assertEqual(size, 12)
+            self.assertEqual(reference, storage.reference(b'some payload'))
+            self.assertEqual(b''.join(storage.get_stream(reference)),
+                             b'some payload')
+
+            # a payload that can not be read completely is not stored
+            with self.assertRaises(ValueError):
+                storage.put_stream(checked_payload([b'no key'], 2))
+            files = [file_ for file_ in Path(tmp).rglob('*')
+                     if file_.is_file()]
+            self.assertEqual(files, [storage._file(reference)])
+
+
+@unittest.skipIf(mock_aws is None, "requires moto")
+class TestS3Storage(unittest.TestCase):
+
+    def test_put_get(self):
+        with mock_aws():
+            storage = S3Storage('vantage6', region='us-east-1',
+                                access_key_id='key', secret_access_key='secret',
+                                prefix='payloads/')
+            storage.client.create_bucket(Bucket='vantage6')
+
+            reference = storage.put(b'some payload')
+            self.assertEqual(storage.get(reference), b'some payload')
+
+            keys = [obj['Key'] for obj in storage.client.list_objects(
+                Bucket='vantage6')['Contents']]
+            self.assertEqual(keys, [f'payloads/{reference}'])
+
+            self.assertEqual(storage.put_stream([b'some ', b'payload']),
+                             (reference, 12))
+            self.assertEqual(b''.join(storage.get_stream(reference)),
+                             b'some payload')
+
+
+class TestStorage(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        Database().connect("sqlite://", allow_drop_all=True)
+        cls.tmp = tempfile.TemporaryDirectory()
+        Storage().configure({'type': 'local', 'inline_threshold': 100},
+                            Path(cls.tmp.name))
+
+    @classmethod
+    def tearDownClass(cls):
+        Storage().configure({})
+        cls.tmp.cleanup()
+        Database().clear_data()
+
+    def setUp(self):
+        DatabaseSessionManager.get_session()
+
+    def tearDown(self):
+        DatabaseSessionManager.clear_session()
+
+    def test_store(self):
+        storage = Storage()
+        self.assertEqual(storage.store('small'), ('small', None))
+        self.assertEqual(storage.store(None), (None, None))
+
+        payload, reference = storage.store(PAYLOAD)
+        self.assertIsNone(payload)
+        self.assertEqual(storage.load(None, reference), PAYLOAD)
+
+    def test_large_payloads_are_not_in_database(self):
+        col = Collaboration(organizations=[Organization()])
+        task = Task(collaboration=col, shared_input=PAYLOAD)
+        result = Result(task=task, organization=col.organizations[0],
+                        input='a2V5$', result=PAYLOAD)
+        result.save()
+        id_ = result.id
+        DatabaseSessionManager.clear_session()
+
+        session = DatabaseSessionManager.get_session()
+        row = session.execute(
+            'SELECT input, result, result_ref FROM result WHERE id = :id',
+            {'id': id_}
+        ).fetchone()
+        self.assertEqual(row[0], 'a2V5$')
+        self.assertIsNone(row[1])
+        self.assertEqual(len(row[2]), 64)
+
+        # payloads are only loaded when they are used
+        result = session.query(Result).filter(Result.id == id_).one()
+        self.assertNotIn('_result', result.__dict__)
+        self.assertEqual(result.result, PAYLOAD)
+        self.assertEqual(result.full_input, 'a2V5$' + PAYLOAD)
+
+    def test_binary_result_is_streamed(self):
+        col = Collaboration(organizations=[Organization()], encrypted=True)
+        result = Result(task=Task(collaboration=col),
+                        organization=col.organizations[0])
+        message = bytes(range(256)) * 10
+        result.store_result_payload([b'a2V5$aXY', b'=$' + message])
+        result.save()
+
+        # the payload is stored as is, and only converted when needed
+        self.assertTrue(result.result_binary)
+        self.assertIsNone(result._result)
+        self.assertEqual(b''.join(result.result_payload()),
+                         b'a2V5$aXY=$' + message)
+        self.assertEqual(result.result,
+                         'a2V5$aXY=$' + base64.b64encode(message).decode())
+
+        # small payloads are kept in the database
+        result.store_result_payload([b'a2V5$aXY=$small'], size=15)
+        self.assertFalse(result.result_binary)
+        self.assertEqual(result._result, 'a2V5$aXY=$' + base64.b64encode(
+            b'small').decode())
+
+        with self.assertRaises(ValueError):
+            result.store_result_payload([b'a2V5', b'no iv'])
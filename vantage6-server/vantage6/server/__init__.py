@@ -4,7 +4,9 @@ from gevent import monkey
 # flake8: noqa: E402 (ignore import error)
 monkey.patch_all()
 
+import datetime
 import importlib
+import itertools
 import logging
 import os
 import uuid
@@ -13,7 +15,7 @@ import traceback
 
 from werkzeug.exceptions import HTTPException
 from flasgger import Swagger
-from flask import Flask, make_response, current_app
+from flask import Flask, Response, make_response, current_app
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_marshmallow import Marshmallow
@@ -21,25 +23,35 @@ from flask_restful import Api
 from flask_mail import Mail
 from flask_principal import Principal, Identity, identity_changed
 from flask_socketio import SocketIO
+from sqlalchemy import case, func
 
-from vantage6.server import db
+from vantage6.server import db, metrics
 from vantage6.cli.context import ServerContext
 from vantage6.cli.rabbitmq.queue_manager import split_rabbitmq_uri
 from vantage6.server.model.base import DatabaseSessionManager, Database
 from vantage6.server.resource._schema import HATEOASModelSchema
 from vantage6.common import logger_name
-from vantage6.server.permission import RuleNeed, PermissionManager
+from vantage6.server.permission import (
+    PermissionCache,
+    PermissionManager,
+    rule_needs
+)
 from vantage6.server.globals import (
     APPNAME,
     JWT_ACCESS_TOKEN_EXPIRES,
     JWT_TEST_ACCESS_TOKEN_EXPIRES,
+    DEFAULT_LAST_SEEN_FLUSH_INTERVAL,
+    DEFAULT_LEGACY_API_KEYS_UNTIL,
+    DEFAULT_PERMISSION_CACHE_TTL,
     RESOURCES,
     SUPER_USER_INFO,
     REFRESH_TOKENS_EXPIRE
 )
 from vantage6.server.resource.swagger import swagger_template
 from vantage6.server._version import __version__
+from vantage6.server.last_seen import LastSeenBuffer
 from vantage6.server.mail_service import MailService
+from vantage6.server.storage import Storage
 from vantage6.server.websockets import DefaultSocketNamespace
 
 
@@ -78,9 +90,32 @@ class ServerApp:
         # Setup the Flask-Mail client
         self.mail = MailService(self.app, Mail(self.app))
 
+        # Setup the storage of (large) payloads
+        Storage().configure(self.ctx.config.get('storage', {}),
+                            self.ctx.data_dir)
+
+        # Nodes without API-key fingerprint can log in until this date, if
+        # it is set
+        legacy_api_keys_until = self.ctx.config.get(
+            'legacy_api_keys_until', DEFAULT_LEGACY_API_KEYS_UNTIL
+        )
+        if legacy_api_keys_until is not None:
+            legacy_api_keys_until = datetime.date.fromisoformat(
+                str(legacy_api_keys_until)
+            )
+        db.Node.legacy_api_keys_until = legacy_api_keys_until
+
+        # Buffer the times users and nodes were last seen
+        LastSeenBuffer().interval = self.ctx.config.get(
+            'last_seen_flush_interval', DEFAULT_LAST_SEEN_FLUSH_INTERVAL
+        )
+
         # Setup websocket channel
         self.socketio = self.setup_socket_connection()
 
+        # Prometheus metrics at /metrics
+        self.configure_metrics()
+
         # setup the permission manager for the API endpoints
         self.permissions = PermissionManager()
 
@@ -129,6 +164,50 @@ class ServerApp:
 
         return socketio
 
+    def configure_metrics(self):
+        """Expose the metrics of the server at /metrics."""
+        metrics.instrument_queries()
+        metrics.REGISTRY.set_collector('socketio',
+                                       self.collect_socketio_metrics)
+        metrics.REGISTRY.set_collector('task', self.collect_task_metrics)
+
+        @self.app.route('/metrics')
+        def prometheus_metrics():
+            return Response(metrics.REGISTRY.render(),
+                            mimetype='text/plain; version=0.0.4')
+
+    def collect_socketio_metrics(self):
+        """Count the clients in each room of the websocket channel."""
+        metrics.SOCKETIO_CLIENTS.clear()
+        rooms = self.socketio.server.manager.rooms
+        for namespace, namespace_rooms in rooms.items():
+            for room, clients in namespace_rooms.items():
+                # skip the rooms that each client is in on its own
+                if room is None or room in clients:
+                    continue
+                metrics.SOCKETIO_CLIENTS.set(len(clients),
+                                             namespace=namespace, room=room)
+
+    @staticmethod
+    def collect_task_metrics():
+        """Count the tasks and results by their status."""
+        session = DatabaseSessionManager.get_session()
+
+        status = case([
+            (db.Result.finished_at != None, 'finished'),  # noqa: E711
+            (db.Result.started_at != None, 'started'),  # noqa: E711
+        ], else_='open')
+        metrics.RESULTS.clear()
+        for status_, count in session.query(status, func.count(db.Result.id))\
+                .group_by(status):
+            metrics.RESULTS.set(count, status=status_)
+
+        n_tasks = session.query(func.count(db.Task.id)).scalar()
+        n_complete = session.query(func.count(db.Task.id))\
+            .filter(db.Task.complete).scalar()
+        metrics.TASKS.set(n_tasks - n_complete, status='open')
+        metrics.TASKS.set(n_complete, status='complete')
+
     @staticmethod
     def configure_logging():
         """Turn 3rd party loggers off."""
@@ -206,6 +285,7 @@ class ServerApp:
             that the session is removed (and uncommited changes are rolled
             back) at the end of every request.
             """
+            metrics.start_request()
             DatabaseSessionManager.new_session()
 
         @self.app.after_request
@@ -216,6 +296,7 @@ class ServerApp:
             `before_request`.
             """
             DatabaseSessionManager.clear_session()
+            metrics.end_request(response)
             return response
 
         @self.app.errorhandler(HTTPException)
@@ -265,6 +346,10 @@ class ServerApp:
     def configure_jwt(self):
         """Load user and its claims."""
 
+        PermissionCache().ttl = self.ctx.config.get(
+            'permission_cache_ttl', DEFAULT_PERMISSION_CACHE_TTL
+        )
+
         @self.jwt.user_claims_loader
         def user_claims_loader(identity):
             roles = []
@@ -301,46 +386,28 @@ class ServerApp:
         @self.jwt.user_loader_callback_loader
         def user_loader_callback(identity):
             auth_identity = Identity(identity)
+            cache = PermissionCache()
             # in case of a user or node an auth id is shared as identity
             if isinstance(identity, int):
 
-                # auth_identity = Identity(identity)
-
                 auth = db.Authenticatable.get(identity)
 
+                # all nodes share the permissions of the node role
                 if isinstance(auth, db.Node):
+                    auth_identity.provides.update(cache.get(
+                        'node',
+                        lambda: rule_needs(db.Role.get_by_name("node").rules)
+                    ))
 
-                    for rule in db.Role.get_by_name("node").rules:
-                        auth_identity.provides.add(
-                                RuleNeed(
-                                    name=rule.name,
-                                    scope=rule.scope,
-                                    operation=rule.operation
-                                )
-                            )
-
+                # users have the permissions of their roles plus 'extra'
+                # permissions
                 if isinstance(auth, db.User):
-
-                    # add role permissions
-                    for role in auth.roles:
-                        for rule in role.rules:
-                            auth_identity.provides.add(
-                                RuleNeed(
-                                    name=rule.name,
-                                    scope=rule.scope,
-                                    operation=rule.operation
-                                )
-                            )
-
-                    # add 'extra' permissions
-                    for rule in auth.rules:
-                        auth_identity.provides.add(
-                            RuleNeed(
-                                name=rule.name,
-                                scope=rule.scope,
-                                operation=rule.operation
-                            )
-                        )
+                    auth_identity.provides.update(cache.get(
+                        ('user', auth.id),
+                        lambda: rule_needs(itertools.chain(
+                            *[role.rules for role in auth.roles], auth.rules
+                        ))
+                    ))
 
                 identity_changed.send(current_app._get_current_object(),
                                       identity=auth_identity)
@@ -348,14 +415,10 @@ class ServerApp:
                 return auth
             else:
 
-                for rule in db.Role.get_by_name("container").rules:
-                    auth_identity.provides.add(
-                        RuleNeed(
-                            name=rule.name,
-                            scope=rule.scope,
-                            operation=rule.operation
-                        )
-                    )
+                auth_identity.provides.update(cache.get(
+                    'container',
+                    lambda: rule_needs(db.Role.get_by_name("container").rules)
+                ))
                 identity_changed.send(current_app._get_current_object(),
                                       identity=auth_identity)
                 log.debug(identity)
@@ -378,6 +441,10 @@ class ServerApp:
             module = importlib.import_module('vantage6.server.resource.' + res)
             module.setup(self.api, self.ctx.config['api_path'], services)
 
+        # links to related resources in the output of the API, only possible
+        # once all resources are known
+        HATEOASModelSchema.build_link_templates(self.api)
+
     def start(self):
         """Start the server.
         """
@@ -415,6 +482,10 @@ class ServerApp:
             node.save()
         # session.commit()
 
+        # store the times users and nodes were last seen, also when there
+        # are no requests
+        LastSeenBuffer().start_periodic_flush(self.socketio)
+
         return self
 
 
@@ -427,7 +498,8 @@ def run_server(config: str, environment: str = 'prod',
     )
     allow_drop_all = ctx.config["allow_drop_all"]
     Database().connect(uri=ctx.get_database_uri(),
-                       allow_drop_all=allow_drop_all)
+                       allow_drop_all=allow_drop_all,
+                       **ctx.config.get('database', {}))
     return ServerApp(ctx).start()
 
 
@@ -90,7 +90,8 @@ def click_insert_context(func):
         # initialize database (singleton)
         allow_drop_all = ctx.config["allow_drop_all"]
         Database().connect(uri=ctx.get_database_uri(),
-                           allow_drop_all=allow_drop_all)
+                           allow_drop_all=allow_drop_all,
+                           **ctx.config.get('database', {}))
 
         return func(ctx, *args, **kwargs)
 
@@ -241,6 +242,34 @@ def cli_server_import(ctx, file_, drop_all):
     fixture.load(entities, drop_all=drop_all)
 
 
+#
+#   rekey-nodes
+#
+@cli_server.command(name='rekey-nodes')
+@click_insert_context
+def cli_server_rekey_nodes(ctx):
+    """ Generate new API keys for nodes without API-key fingerprint.
+
+        Nodes that were created before fingerprints were introduced can only
+        log in until the date set by `legacy_api_keys_until`, if it is set.
+        The new API keys are printed once, and must be put in the
+        configuration of the nodes.
+    """
+    from vantage6.server.model import Node
+
+    nodes = Node.legacy_nodes()
+    if not nodes:
+        info("All nodes have an API-key fingerprint.")
+        return
+
+    warning(f"{len(nodes)} node(s) get a new API key, their current API key "
+            "will no longer work!")
+    if not q.confirm("Continue?").ask():
+        return
+    for node in nodes:
+        info(f"Node id={node.id} ({node.name}): {node.rekey()}")
+
+
 #
 #   shell
 #
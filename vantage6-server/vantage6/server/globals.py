@@ -2,7 +2,12 @@ import datetime
 
 from pathlib import Path
 
-from vantage6.common.globals import APPNAME
+from vantage6.common.globals import (
+    APPNAME,
+    FEATURE_SHARED_INPUT,
+    FEATURE_RESULT_PAYLOAD,
+    FEATURE_TASK_ASSIGNED
+)
 
 #
 #   INSTALLATION SETTINGS
@@ -25,7 +30,7 @@ JWT_TEST_ACCESS_TOKEN_EXPIRES = datetime.timedelta(days=1)
 # file-names in the resource directory
 RESOURCES = ['node', 'collaboration', 'organization', 'task', 'result',
              'token', 'user', 'version', 'recover', 'role',
-             'rule', 'health', 'vpn', 'port']
+             'rule', 'health', 'vpn', 'port', 'stats']
 
 # Super user information. This user is only created if it is not in the
 # database yet at startup time.
@@ -34,6 +39,30 @@ SUPER_USER_INFO = {
     "password": "root"
 }
 
+# Optional API features that this server supports
+SERVER_FEATURES = [FEATURE_SHARED_INPUT, FEATURE_RESULT_PAYLOAD,
+                   FEATURE_TASK_ASSIGNED]
+
+# Payloads (inputs and results) smaller than this number of bytes are kept in
+# the database, even if a storage backend is configured
+DEFAULT_STORAGE_INLINE_THRESHOLD = 4096
+
+# Number of seconds the permissions of a user/node/container are cached
+DEFAULT_PERMISSION_CACHE_TTL = 60
+
+# Number of seconds between two writes of the times users/nodes were last seen
+DEFAULT_LAST_SEEN_FLUSH_INTERVAL = 10
+
+# Last day on which nodes without an API-key fingerprint (created before
+# fingerprints were introduced) can log in, by default there is no such day.
+# Afterwards they need a new API key, see `vserver-local rekey-nodes`
+DEFAULT_LEGACY_API_KEYS_UNTIL = None
+
+# Number of invalid API keys that are remembered, so that a node that keeps
+# trying the same invalid key does not check the keys of all nodes without
+# fingerprint on each attempt
+INVALID_API_KEYS_KEPT = 1000
+
 # Whenever the refresh tokens should expire. Note that setting this to true
 # would mean that nodes will disconnect after some time
 REFRESH_TOKENS_EXPIRE = False
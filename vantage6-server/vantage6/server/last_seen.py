@@ -0,0 +1,123 @@
+""" Write-behind of the last time users and nodes were seen
+
+Every authenticated request updates the `last_seen` of the user or node that
+makes it. Rather than a write transaction for each request, these updates are
+collected here and written in a single statement once in a while. Only the
+most recent time of each user or node is kept, so the number of rows that is
+written is limited by the number of active users and nodes.
+
+The updates are written by the first request after the flush interval has
+passed, by a background task of the server when there are no requests, and
+when the server stops. The `last_seen` in the database can therefore lag
+behind by (about) the flush interval.
+"""
+import atexit
+import datetime
+import logging
+import time
+
+from threading import Lock
+
+from sqlalchemy import bindparam, or_
+
+from vantage6.common import logger_name, Singleton
+from vantage6.server.globals import DEFAULT_LAST_SEEN_FLUSH_INTERVAL
+from vantage6.server.model import Authenticatable
+from vantage6.server.model.base import DatabaseSessionManager
+
+module_name = logger_name(__name__)
+log = logging.getLogger(module_name)
+
+
+class LastSeenBuffer(metaclass=Singleton):
+    """Last time each user and node was seen, that is not stored yet."""
+
+    def __init__(self, interval: float = DEFAULT_LAST_SEEN_FLUSH_INTERVAL):
+        """
+        Parameters
+        ----------
+        interval : float, optional
+            Number of seconds between two writes to the database. With 0,
+            every update is written right away
+        """
+        self.interval = interval
+
+        # authenticatable id -> last seen
+        self.__pending = {}
+        self.__lock = Lock()
+        self.__last_flush = time.monotonic()
+        self.__flushing = False
+
+        atexit.register(self.flush)
+
+    def __len__(self) -> int:
+        return len(self.__pending)
+
+    def seen(self, auth_id: int, at: datetime.datetime = None) -> None:
+        """Register that a user or node was seen
+
+        Parameters
+        ----------
+        auth_id : int
+            Id of the user or node
+        at : datetime.datetime, optional
+            Time it was seen, by default now
+        """
+        with self.__lock:
+            self.__pending[auth_id] = at or datetime.datetime.utcnow()
+            due = time.monotonic() - self.__last_flush >= self.interval
+
+        if due:
+            self.flush()
+
+    def start_periodic_flush(self, socketio) -> None:
+        """Also flush the pending updates when there are no requests
+
+        Parameters
+        ----------
+        socketio : flask_socketio.SocketIO
+            Socket of the server, in which a background task is started
+            that flushes the updates once the flush interval has passed
+        """
+        if self.__flushing or not self.interval:
+            return
+        self.__flushing = True
+        socketio.start_background_task(self.__flush_periodically,
+                                       socketio.sleep)
+
+    def __flush_periodically(self, sleep) -> None:
+        while True:
+            sleep(self.interval)
+            with self.__lock:
+                due = time.monotonic() - self.__last_flush >= self.interval
+            if due:
+                self.flush()
+
+    def flush(self) -> None:
+        """Write the pending updates to the database."""
+        with self.__lock:
+            pending, self.__pending = self.__pending, {}
+            self.__last_flush = time.monotonic()
+
+        if not pending:
+            return
+
+        table = Authenticatable.__table__
+        statement = table.update()\
+            .where(table.c.id == bindparam('auth_id'))\
+            .where(or_(table.c.last_seen == None,  # noqa: E711
+                       table.c.last_seen < bindparam('seen_at')))\
+            .values(last_seen=bindparam('seen_at'))
+
+        session = DatabaseSessionManager.get_session()
+        try:
+            session.execute(statement, [
+                {'auth_id': auth_id, 'seen_at': seen_at}
+                for auth_id, seen_at in pending.items()
+            ])
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            log.warning(f'Could not store when {len(pending)} users/nodes '
+                        'were last seen')
+            log.debug(e)
@@ -0,0 +1,266 @@
+""" Metrics of the server in the Prometheus text format
+
+The metrics are collected in the process that serves the requests and are
+exposed at `/metrics`, where they can be scraped by Prometheus. When the
+server runs with several worker processes, each worker keeps its own
+metrics.
+
+Counters and histograms are updated as requests are handled. Gauges that
+describe the current state (e.g. the number of open tasks) are set by
+collectors, which are called each time the metrics are rendered.
+"""
+import logging
+import math
+import time
+
+from threading import Lock
+from typing import Callable
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from vantage6.common import logger_name
+
+module_name = logger_name(__name__)
+log = logging.getLogger(module_name)
+
+# Upper bounds of the buckets of a histogram, the last bucket is unbounded
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        str(value).replace('\\', r'\\').replace('"', r'\"')
+        .replace('\n', r'\n')
+        for value in labels.values()
+    )
+    pairs = (f'{name}="{value}"' for name, value in zip(labels, escaped))
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class Metric:
+    """Base class of the metrics, keeps a value for each set of labels."""
+
+    type_ = 'untyped'
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'Metric {self.name} requires the labels '
+                             f'{self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self) -> None:
+        """Remove the values of all labels."""
+        with self._lock:
+            self._values = {}
+
+    def samples(self):
+        """Yield (name, labels, value) of each sample of this metric."""
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.type_}']
+        lines += [f'{name}{_format_labels(labels)} {_format_value(value)}'
+                  for name, labels, value in self.samples()]
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """Value that only increases, e.g. the number of requests."""
+
+    type_ = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Value that can go up and down, e.g. the number of open tasks."""
+
+    type_ = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Distribution of observed values, e.g. the duration of requests."""
+
+    type_ = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf, )
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(
+                key, ([0] * len(self.buckets), 0.0)
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total)
+                      for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, counts):
+                yield f'{self.name}_bucket', \
+                    {**labels, 'le': _format_value(bound)}, count
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, counts[-1]
+
+
+class Registry:
+    """Collection of metrics that are rendered together."""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def set_collector(self, name: str, collector: Callable[[], None]) -> None:
+        """Set a function that updates gauges before they are rendered.
+
+        A collector that was set before under the same `name` is replaced.
+        """
+        self.collectors[name] = collector
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format."""
+        for name, collector in self.collectors.items():
+            try:
+                collector()
+            except Exception as e:
+                log.warning(f'Could not collect the {name} metrics')
+                log.debug(e)
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    'vantage6_http_requests_total',
+    'Number of handled HTTP requests',
+    ('method', 'endpoint', 'status')
+))
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    'vantage6_http_request_duration_seconds',
+    'Time spent handling HTTP requests',
+    ('method', 'endpoint')
+))
+DB_QUERIES = REGISTRY.register(Histogram(
+    'vantage6_db_queries_per_request',
+    'Number of database queries of an HTTP request',
+    ('endpoint', ),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+))
+DB_QUERY_DURATION = REGISTRY.register(Histogram(
+    'vantage6_db_query_duration_seconds',
+    'Time spent on database queries during an HTTP request',
+    ('endpoint', )
+))
+SOCKETIO_CLIENTS = REGISTRY.register(Gauge(
+    'vantage6_socketio_clients',
+    'Number of clients connected to a socketio room',
+    ('namespace', 'room')
+))
+TASKS = REGISTRY.register(Gauge(
+    'vantage6_tasks',
+    'Number of tasks by status',
+    ('status', )
+))
+RESULTS = REGISTRY.register(Gauge(
+    'vantage6_results',
+    'Number of results by status',
+    ('status', )
+))
+PAYLOAD_BYTES = REGISTRY.register(Histogram(
+    'vantage6_payload_bytes',
+    'Size of the stored inputs and results',
+    ('kind', ),
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+             16777216, 67108864)
+))
+
+
+# ------------------------------------------------------------------------------
+# Instrumentation of requests and database queries
+# ------------------------------------------------------------------------------
+def start_request() -> None:
+    """Start measuring the current request."""
+    g.request_start = time.perf_counter()
+    g.db_queries = 0
+    g.db_query_time = 0.0
+
+
+def end_request(response) -> None:
+    """Record the measurements of the current request."""
+    if 'request_start' not in g:
+        return
+    duration = time.perf_counter() - g.request_start
+
+    # the rule (e.g. /api/task/<int:id>) rather than the path, so that the
+    # number of label values is limited
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUESTS.inc(method=request.method, endpoint=endpoint,
+                 status=response.status_code)
+    REQUEST_DURATION.observe(duration, method=request.method,
+                             endpoint=endpoint)
+    DB_QUERIES.observe(g.db_queries, endpoint=endpoint)
+    DB_QUERY_DURATION.observe(g.db_query_time, endpoint=endpoint)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info['query_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    start = conn.info.pop('query_start', None)
+    if start is not None and has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_query_time += time.perf_counter() - start
+
+
+def instrument_queries() -> None:
+    """Count and time the database queries of each request."""
+    if not event.contains(Engine, 'before_cursor_execute',
+                          _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
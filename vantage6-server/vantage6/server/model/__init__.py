@@ -12,3 +12,4 @@ from .role import Role
 from .rule import Rule
 from .role_rule_association import role_rule_association
 from .algorithm_port import AlgorithmPort
+from .counter import Counter
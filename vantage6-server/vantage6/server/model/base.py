@@ -1,15 +1,17 @@
 import logging
 import os
+import time
 import inspect as class_inspect
 from flask.globals import g
 
-from sqlalchemy import Column, Integer, inspect
+from sqlalchemy import Column, Integer, event, exc, inspect
 from sqlalchemy.orm.session import Session
 from sqlalchemy.ext.declarative import declarative_base, declared_attr
 from sqlalchemy import create_engine
 from sqlalchemy.engine.url import make_url
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.pool import QueuePool
 
 from vantage6.common import logger_name, Singleton
 from vantage6.server import db
@@ -19,6 +21,34 @@ module_name = logger_name(__name__)
 log = logging.getLogger(module_name)
 
 
+class MeasuredQueuePool(QueuePool):
+    """Connection pool that keeps track of the time spent waiting on it.
+
+        The wait time includes opening a new connection when the pool
+        overflows.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _do_get(self):
+        start = time.monotonic()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            wait_time = time.monotonic() - start
+            self.checkouts += 1
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+
 class Database(metaclass=Singleton):
     """A singleton we can destroy, a module we cannot.
 
@@ -56,7 +86,39 @@ class Database(metaclass=Singleton):
         self.allow_drop_all = False
         self.URI = None
 
-    def connect(self, uri='sqlite:////tmp/test.db', allow_drop_all=False):
+    def connect(self, uri='sqlite:////tmp/test.db', allow_drop_all=False,
+                pool_size=None, max_overflow=None, pool_recycle=None,
+                pool_timeout=None, sqlite_wal=False,
+                sqlite_busy_timeout=None):
+        """Connect to the database.
+
+            The pool options apply to databases that use a connection pool,
+            i.e. all except SQLite. Options that are not set use the
+            defaults of SQLAlchemy.
+
+            Parameters
+            ----------
+            uri : str
+                Database URI
+            allow_drop_all : bool
+                Whether the tables may be dropped
+            pool_size : int, optional
+                Number of connections that are kept open
+            max_overflow : int, optional
+                Number of connections that can be opened on top of the
+                `pool_size`
+            pool_recycle : int, optional
+                Number of seconds after which a connection is replaced
+            pool_timeout : float, optional
+                Number of seconds to wait for a connection to become
+                available before an error is raised
+            sqlite_wal : bool, optional
+                Use the write-ahead log of SQLite, so that reads do not
+                wait for writes
+            sqlite_busy_timeout : int, optional
+                Number of milliseconds SQLite waits for a lock to be
+                released
+        """
 
         self.allow_drop_all = allow_drop_all
         self.URI = uri
@@ -73,8 +135,22 @@ class Database(metaclass=Singleton):
         if URL.host is None and URL.database:
             os.makedirs(os.path.dirname(URL.database), exist_ok=True)
 
-        self.engine = create_engine(uri, convert_unicode=True,
-                                    pool_pre_ping=True)
+        if URL.get_backend_name() == 'sqlite':
+            self.engine = create_engine(uri, convert_unicode=True,
+                                        pool_pre_ping=True)
+            self._configure_sqlite(sqlite_wal, sqlite_busy_timeout)
+        else:
+            pool_options = {
+                'pool_size': pool_size,
+                'max_overflow': max_overflow,
+                'pool_recycle': pool_recycle,
+                'pool_timeout': pool_timeout,
+            }
+            self.engine = create_engine(
+                uri, convert_unicode=True, pool_pre_ping=True,
+                poolclass=MeasuredQueuePool,
+                **{k: v for k, v in pool_options.items() if v is not None}
+            )
 
         # we can call Session() to create a session, if a session already
         # exists it will return the same session (!). implicit access to the
@@ -97,9 +173,49 @@ class Database(metaclass=Singleton):
         # short hand to obtain a object-session.
         self.object_session = Session.object_session
 
+        # the migrations change the tables that existed before
+        from vantage6.server.model.migrations import migrate
+        new_database = not inspect(self.engine).get_table_names()
         Base.metadata.create_all(bind=self.engine)
+        migrate(self.engine, new_database)
         log.info("Database initialized!")
 
+    def _configure_sqlite(self, wal, busy_timeout):
+        """Set the pragmas of each new SQLite connection."""
+        in_memory = self.engine.url.database in (None, '', ':memory:')
+
+        @event.listens_for(self.engine, 'connect')
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            if wal and not in_memory:
+                cursor.execute('PRAGMA journal_mode=WAL')
+            if busy_timeout is not None:
+                cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+            cursor.close()
+
+    def pool_status(self):
+        """Usage of the connection pool of the database engine."""
+        pool = self.engine.pool
+        status = {'type': type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            status.update({
+                'size': pool.size(),
+                'checked_in': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                # negative while not all connections of the pool are opened
+                'overflow': max(pool.overflow(), 0),
+                'max_overflow': pool._max_overflow,
+                'timeout': pool.timeout(),
+            })
+        if isinstance(pool, MeasuredQueuePool):
+            status.update({
+                'checkouts': pool.checkouts,
+                'timeouts': pool.timeouts,
+                'wait_time': pool.wait_time,
+                'max_wait_time': pool.max_wait_time,
+            })
+        return status
+
 
 class DatabaseSessionManager:
     """Class to manage DB sessions from.
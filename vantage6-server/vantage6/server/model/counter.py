@@ -0,0 +1,86 @@
+from typing import Callable
+
+from sqlalchemy import Column, String, Integer
+from sqlalchemy.exc import IntegrityError
+
+from .base import Base, DatabaseSessionManager
+
+
+class Counter(Base):
+    """Table of named counters that hand out increasing numbers
+
+    The counters are used for numbers that must be unique, such as run ids,
+    and that can not be taken from the primary key. The number is
+    incremented by the database, so that concurrent requests never get the
+    same number. On PostgreSQL a sequence is used for each counter instead
+    of a row in this table, which does not lock anything.
+    """
+
+    # fields
+    name = Column(String(64), unique=True, nullable=False)
+    value = Column(Integer, nullable=False)
+
+    # sequences that exist in the PostgreSQL database of this process
+    _sequences = set()
+
+    @classmethod
+    def next_value(cls, name: str, start: Callable[[], int]) -> int:
+        """Increment the counter `name` and return the new value.
+
+        Parameters
+        ----------
+        name : str
+            Name of the counter
+        start : Callable[[], int]
+            Returns the first value of the counter, is only called when the
+            counter does not exist yet. This allows a counter to continue
+            from numbers that were handed out before it was introduced.
+
+        Returns
+        -------
+        int
+            Value that has not been returned before
+
+        Notes
+        -----
+        On other databases than PostgreSQL, the row of the counter stays
+        locked until the session is committed or rolled back, which ensures
+        that the value is not handed out twice. When two requests create
+        the same counter at the same time, one of them fails to insert the
+        row and increments the row of the other instead.
+        """
+        session = DatabaseSessionManager.get_session()
+        engine = session.get_bind()
+
+        if engine.dialect.name == 'postgresql':
+            sequence = f'{name}_seq'
+            if sequence not in cls._sequences:
+                # outside of the session, so that the sequence is created
+                # even if the session is rolled back
+                engine.execute(f'CREATE SEQUENCE IF NOT EXISTS "{sequence}" '
+                               f'START {int(start())}')
+                cls._sequences.add(sequence)
+            return session.execute(f"SELECT nextval('\"{sequence}\"')")\
+                .scalar()
+
+        table = cls.__table__
+        updated = session.execute(
+            table.update()
+            .where(table.c.name == name)
+            .values(value=table.c.value + 1)
+        )
+        if updated.rowcount:
+            return session.execute(
+                table.select().with_only_columns([table.c.value])
+                .where(table.c.name == name)
+            ).scalar()
+
+        value = int(start())
+        try:
+            # in a savepoint, so that only the insert is rolled back if the
+            # counter has been created by a concurrent request
+            with session.begin_nested():
+                session.execute(table.insert().values(name=name, value=value))
+        except IntegrityError:
+            return cls.next_value(name, start)
+        return value
@@ -0,0 +1,141 @@
+""" Migrations of the database schema
+
+`create_all` creates the tables that do not exist yet, but does not change
+existing tables. The changes to existing tables are listed in `MIGRATIONS`,
+in the order in which they have been introduced. Each migration is applied
+once to a database that was created before it, and is then recorded in the
+`schema_migration` table. A new database gets the complete schema from
+`create_all`, so all migrations are recorded without applying them.
+"""
+import datetime
+import logging
+
+from typing import Callable
+
+from sqlalchemy import (
+    Column, DateTime, String, Table, func, inspect, select
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn
+
+from vantage6.common import logger_name
+from vantage6.server.model.base import Base
+
+module_name = logger_name(__name__)
+log = logging.getLogger(module_name)
+
+applied_migrations = Table(
+    'schema_migration',
+    Base.metadata,
+    Column('name', String(64), primary_key=True),
+    Column('applied_at', DateTime, default=datetime.datetime.utcnow)
+)
+
+
+def add_columns(table_name: str, *column_names: str
+                ) -> Callable[[Connection], None]:
+    """Migration that adds columns of a model to an existing table.
+
+    The columns are added as they are defined in the model (type, server
+    default, nullability), together with their indexes. Columns that exist
+    already are skipped.
+    """
+    def migrate(connection: Connection) -> None:
+        table = Base.metadata.tables[table_name]
+        existing = {column['name'] for column
+                    in inspect(connection).get_columns(table_name)}
+        added = [name for name in column_names if name not in existing]
+
+        quoted_table = connection.dialect.identifier_preparer\
+            .format_table(table)
+        for name in added:
+            column = CreateColumn(table.c[name])\
+                .compile(dialect=connection.dialect)
+            connection.execute(
+                f'ALTER TABLE {quoted_table} ADD COLUMN {column}'
+            )
+
+        for index in table.indexes:
+            if any(column.name in added for column in index.columns):
+                index.create(bind=connection)
+
+    return migrate
+
+
+def fill_result_counters(connection: Connection) -> None:
+    """Count the results of the existing tasks."""
+    task = Base.metadata.tables['task']
+    result = Base.metadata.tables['result']
+    results = select([func.count(result.c.id)])\
+        .where(result.c.task_id == task.c.id)
+    connection.execute(task.update().values(
+        result_count=results.as_scalar(),
+        finished_count=results
+        .where(result.c.finished_at != None).as_scalar(),  # noqa: E711
+        failed_count=0
+    ))
+
+
+def fill_failed_counters(connection: Connection) -> None:
+    """Count the failed results of the existing tasks."""
+    task = Base.metadata.tables['task']
+    result = Base.metadata.tables['result']
+    connection.execute(task.update().values(
+        failed_count=select([func.count(result.c.id)])
+        .where(result.c.task_id == task.c.id)
+        .where(result.c.finished_at != None)  # noqa: E711
+        .where(result.c.exit_code != 0)
+        .as_scalar()
+    ))
+
+
+def add_payload_references(connection: Connection) -> None:
+    add_columns('result', 'input_ref', 'result_ref')(connection)
+    add_columns('task', 'shared_input_ref')(connection)
+
+
+def add_result_counters(connection: Connection) -> None:
+    add_columns('task', 'result_count', 'finished_count',
+                'failed_count')(connection)
+    fill_result_counters(connection)
+
+
+def add_result_exit_code(connection: Connection) -> None:
+    add_columns('result', 'exit_code')(connection)
+    fill_failed_counters(connection)
+
+
+# (name, migration) in the order in which they have been introduced
+MIGRATIONS = [
+    ('node_api_key_fingerprint', add_columns('node', 'api_key_fingerprint')),
+    ('task_shared_input', add_columns('task', 'shared_input')),
+    ('payload_references', add_payload_references),
+    ('task_result_counters', add_result_counters),
+    ('result_binary_payload', add_columns('result', 'result_binary')),
+    ('result_exit_code', add_result_exit_code),
+]
+
+
+def migrate(engine: Engine, new_database: bool) -> None:
+    """Apply the migrations that have not been applied to the database yet.
+
+    Parameters
+    ----------
+    engine : Engine
+        Engine of the database, of which all tables exist
+    new_database : bool
+        Whether the tables have just been created, in which case the
+        migrations are only recorded
+    """
+    with engine.connect() as connection:
+        applied = {row.name for row
+                   in connection.execute(select([applied_migrations.c.name]))}
+
+    for name, migration in MIGRATIONS:
+        if name in applied:
+            continue
+        with engine.begin() as connection:
+            if not new_database:
+                log.warning(f"Migrating the database: {name}")
+                migration(connection)
+            connection.execute(applied_migrations.insert().values(name=name))
@@ -1,21 +1,49 @@
 import bcrypt
+import datetime
+import hashlib
+import logging
+import uuid
 
+from collections import OrderedDict
+
+from vantage6.common import logger_name
+from vantage6.server.globals import (
+    DEFAULT_LEGACY_API_KEYS_UNTIL,
+    INVALID_API_KEYS_KEPT
+)
 from vantage6.server.model.base import DatabaseSessionManager
 from sqlalchemy.orm import relationship, validates
 from sqlalchemy import Column, Integer, String, ForeignKey
 
 from vantage6.server.model.authenticable import Authenticatable
 
+log = logging.getLogger(logger_name(__name__))
+
 
 class Node(Authenticatable):
     """Application that executes Tasks."""
-    _hidden_attributes = ['api_key']
+    _hidden_attributes = ['api_key', 'api_key_fingerprint']
+
+    # number of (hex) characters of the SHA-256 digest of the API key that
+    # are stored as fingerprint. This is enough to narrow the lookup down to
+    # (almost always) a single node, while revealing too little of the
+    # digest to be useful for guessing the key.
+    FINGERPRINT_LENGTH = 6
+
+    # last day on which nodes without fingerprint can log in (None if there
+    # is no such day), see `get_by_api_key`
+    legacy_api_keys_until = DEFAULT_LEGACY_API_KEYS_UNTIL
+
+    # SHA-256 digests of the API keys that did not match any node without
+    # fingerprint. These nodes only get fewer, so the keys stay invalid.
+    _invalid_legacy_keys = OrderedDict()
 
     id = Column(Integer, ForeignKey('authenticatable.id'), primary_key=True)
 
     # fields
     name = Column(String)
     api_key = Column(String)
+    api_key_fingerprint = Column(String(FINGERPRINT_LENGTH), index=True)
     collaboration_id = Column(Integer, ForeignKey("collaboration.id"))
     organization_id = Column(Integer, ForeignKey("organization.id"))
 
@@ -30,8 +58,20 @@ class Node(Authenticatable):
 
     @validates("api_key")
     def _validate_api_key(self, key, api_key):
+        self.api_key_fingerprint = self.fingerprint(api_key)
         return self.hash(api_key)
 
+    @classmethod
+    def fingerprint(cls, api_key: str) -> str:
+        """Non-secret identifier of an API key.
+
+        The fingerprint is stored in an indexed column so that the node
+        belonging to an API key can be found without checking the (bcrypt)
+        hash of every node.
+        """
+        digest = hashlib.sha256(api_key.encode('utf8')).hexdigest()
+        return digest[:cls.FINGERPRINT_LENGTH]
+
     def check_key(self, key):
         if self.api_key is not None:
             expected_hash = self.api_key.encode('utf8')
@@ -43,17 +83,76 @@ class Node(Authenticatable):
         """returns Node based on the provided API key.
 
         Returns None if no Node is associated with api_key.
+
+        Only the nodes that share the fingerprint of the API key are checked.
+        Nodes that have been created before fingerprints were introduced do
+        not have one. These are checked as a fallback, and their fingerprint
+        is stored on their first succesful login. Note that the fallback
+        checks the key of each of these nodes when no node matches, so an
+        invalid API key costs a bcrypt check per legacy node. The most
+        recent invalid keys are remembered, so that a node that retries the
+        same invalid key only costs these checks once.
+
+        The fallback is deprecated. When `legacy_api_keys_until` is set,
+        it is only used until that day. Nodes that have not logged in by
+        then need a new API key, which can be generated with
+        `vserver-local rekey-nodes`.
         """
         session = DatabaseSessionManager.get_session()
+        fingerprint = cls.fingerprint(api_key)
+
+        candidates = session.query(cls)\
+            .filter(cls.api_key_fingerprint == fingerprint)\
+            .all()
+        for node in candidates:
+            if node.check_key(api_key):
+                return node
+
+        digest = hashlib.sha256(api_key.encode('utf8')).hexdigest()
+        if digest in cls._invalid_legacy_keys:
+            return None
+
+        legacy_nodes = cls.legacy_nodes()
+        if not legacy_nodes:
+            return None
+        until = cls.legacy_api_keys_until
+        if until is not None and datetime.date.today() > until:
+            log.warning(f"{len(legacy_nodes)} node(s) without API-key "
+                        "fingerprint can no longer log in, generate new API "
+                        "keys with `vserver-local rekey-nodes`")
+            return None
 
-        nodes = session.query(cls).all()
-        for node in nodes:
-            is_correct_key = node.check_key(api_key)
-            if is_correct_key:
+        log.warning(f"Checking the API keys of {len(legacy_nodes)} node(s) "
+                    "without fingerprint. This is deprecated, generate new "
+                    "API keys with `vserver-local rekey-nodes`")
+        for node in legacy_nodes:
+            if node.check_key(api_key):
+                node.api_key_fingerprint = fingerprint
+                node.save()
                 return node
+
         # no node found with matching API key
+        cls._invalid_legacy_keys[digest] = True
+        while len(cls._invalid_legacy_keys) > INVALID_API_KEYS_KEPT:
+            cls._invalid_legacy_keys.popitem(last=False)
         return None
 
+    @classmethod
+    def legacy_nodes(cls):
+        """Nodes without API-key fingerprint."""
+        session = DatabaseSessionManager.get_session()
+        return session.query(cls)\
+            .filter(cls.api_key_fingerprint.is_(None))\
+            .filter(cls.api_key.isnot(None))\
+            .all()
+
+    def rekey(self) -> str:
+        """Give the node a new API key, which is returned."""
+        api_key = str(uuid.uuid1())
+        self.api_key = api_key
+        self.save()
+        return api_key
+
     @classmethod
     def exists(cls, organization_id, collaboration_id):
         session = DatabaseSessionManager.get_session()
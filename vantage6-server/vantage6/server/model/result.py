@@ -1,9 +1,13 @@
 import datetime
 import logging
 
-from sqlalchemy import Column, Text, DateTime, Integer, ForeignKey
-from sqlalchemy.orm import relationship
-from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
+from typing import Iterable, Iterator, Optional
+from sqlalchemy import (
+    Column, String, Text, DateTime, Integer, Boolean, ForeignKey, event,
+    inspect
+)
+from sqlalchemy.orm import relationship, deferred, column_property
+from sqlalchemy.orm.exc import MultipleResultsFound
 from sqlalchemy.ext.hybrid import hybrid_property
 
 from vantage6.common import logger_name
@@ -15,6 +19,10 @@ from vantage6.server.model import (
     Organization
 )
 from vantage6.server.model.base import DatabaseSessionManager
+from vantage6.server.metrics import PAYLOAD_BYTES
+from vantage6.server.storage import (
+    Storage, checked_payload, payload_to_text, text_to_payload
+)
 
 log_ = logging.getLogger(logger_name(__name__))
 
@@ -23,17 +31,27 @@ class Result(Base):
     """Result of a Task as executed by a Node.
 
     The result (and the input) is encrypted and can be only read by the
-    intended receiver of the message.
+    intended receiver of the message. Large inputs and results are kept in
+    the payload storage (see `vantage6.server.storage`), they are only loaded
+    when they are used. A result that is uploaded as binary data is kept in
+    the storage in its binary representation (`result_binary`). A finished
+    result with a non-zero `exit_code` of its algorithm container has failed.
     """
 
     # fields
-    input = Column(Text)
+    _input = deferred(Column('input', Text))
+    input_ref = Column(String(64))
     task_id = Column(Integer, ForeignKey("task.id"))
     organization_id = Column(Integer, ForeignKey("organization.id"))
-    result = Column(Text)
+    _result = deferred(Column('result', Text))
+    result_ref = Column(String(64))
+    result_binary = Column(Boolean, default=False)
     assigned_at = Column(DateTime, default=datetime.datetime.utcnow)
     started_at = Column(DateTime)
-    finished_at = Column(DateTime)
+    # the previous values are loaded when these change, they are needed to
+    # update the counters of the task
+    finished_at = column_property(Column(DateTime), active_history=True)
+    exit_code = column_property(Column(Integer), active_history=True)
     log = Column(Text)
 
     # relationships
@@ -43,9 +61,11 @@ class Result(Base):
 
     @property
     def node(self):
-        session = DatabaseSessionManager.get_session()
-        try:
-            node = session.query(Node)\
+        # the nodes may have been retrieved already by `load_nodes`
+        nodes = self.__dict__.get('_nodes')
+        if nodes is None:
+            session = DatabaseSessionManager.get_session()
+            nodes = session.query(Node)\
                 .join(Collaboration)\
                 .join(Organization)\
                 .join(Result)\
@@ -53,19 +73,125 @@ class Result(Base):
                 .filter(Result.id == self.id)\
                 .filter(self.organization_id == Node.organization_id)\
                 .filter(Task.collaboration_id == Node.collaboration_id)\
-                .one()
+                .all()
+
         # FIXME 2022-03-03 BvB: the following errors are not currently
         # forwarded to the user as request response. Make that happen.
-        except NoResultFound:
+        if not nodes:
             log_.warn("No node exists for organization_id "
                       f"{self.organization_id} in the current collaboration!")
             return None
-        except MultipleResultsFound:
+        if len(nodes) > 1:
             log_.error("Multiple nodes are registered for organization_id "
                        f"{self.organization_id} in the current collaboration. "
                        "Please delete all nodes but one.")
-            raise
-        return node
+            raise MultipleResultsFound("Multiple rows were found for one()")
+        return nodes[0]
+
+    @classmethod
+    def load_nodes(cls, results: list) -> None:
+        """Retrieve the nodes of several results at once.
+
+        The `node` of each result otherwise takes a query per result. Here
+        the nodes of all `results` are obtained in a single query.
+        """
+        if not results:
+            return
+        session = DatabaseSessionManager.get_session()
+        nodes = session.query(Node)\
+            .join(Task, Task.collaboration_id == Node.collaboration_id)\
+            .filter(Task.id.in_({result.task_id for result in results}))\
+            .filter(Node.organization_id.in_(
+                {result.organization_id for result in results}))\
+            .all()
+
+        by_key = {}
+        for node in nodes:
+            key = (node.organization_id, node.collaboration_id)
+            by_key.setdefault(key, []).append(node)
+        for result in results:
+            key = (result.organization_id, result.task.collaboration_id)
+            result._nodes = by_key.get(key, [])
+
+    @property
+    def input(self):
+        return Storage().load(self._input, self.input_ref)
+
+    @input.setter
+    def input(self, value):
+        PAYLOAD_BYTES.observe(len(value or ''), kind='input')
+        self._input, self.input_ref = Storage().store(value)
+
+    @property
+    def result(self):
+        # converted to text if it is stored as binary data
+        if self.result_binary:
+            return payload_to_text(Storage().load_stream(self.result_ref),
+                                   self.payload_header_fields)
+        return Storage().load(self._result, self.result_ref)
+
+    @result.setter
+    def result(self, value):
+        PAYLOAD_BYTES.observe(len(value or ''), kind='result')
+        self._result, self.result_ref = Storage().store(value)
+        self.result_binary = False
+
+    @property
+    def payload_header_fields(self) -> int:
+        """Number of base64 fields (the encrypted key and iv) that precede
+        the message in the payloads of this result."""
+        return 2 if self.task.collaboration.encrypted else 0
+
+    def store_result_payload(self, chunks: Iterable[bytes],
+                             size: int = None) -> None:
+        """Store the binary representation of the result
+
+        With a storage backend, the payload is streamed to the backend as
+        is. Otherwise (or if it is small) it is converted to text and kept
+        in the database.
+
+        Parameters
+        ----------
+        chunks : Iterable[bytes]
+            The binary representation of the result, in chunks
+        size : int, optional
+            Number of bytes of the payload, if known
+
+        Raises
+        ------
+        ValueError
+            If the payload does not contain the encrypted key and iv
+        """
+        storage = Storage()
+        if not storage.streams(size):
+            self.result = payload_to_text(chunks, self.payload_header_fields)
+            return
+
+        reference, size = storage.store_stream(
+            checked_payload(chunks, self.payload_header_fields)
+        )
+        PAYLOAD_BYTES.observe(size, kind='result')
+        self._result, self.result_ref = None, reference
+        self.result_binary = True
+
+    def result_payload(self) -> Optional[Iterator[bytes]]:
+        """The binary representation of the result in chunks, None if there
+        is no result."""
+        if self.result_binary:
+            return Storage().load_stream(self.result_ref)
+        text = Storage().load(self._result, self.result_ref)
+        if not text:
+            return None
+        return text_to_payload(text, self.payload_header_fields)
+
+    @property
+    def full_input(self):
+        """Input for the node, including the input shared by all results of
+        the task (if any)."""
+        shared_input = self.task.shared_input if self.task else None
+        if shared_input:
+            return (self.input or '') + shared_input
+        return self.input
 
     @hybrid_property
     def complete(self):
@@ -80,3 +206,48 @@ class Result(Base):
             f"is_complete: {self.complete}"
             ">"
         )
+
+
+def _has_failed(finished_at, exit_code) -> bool:
+    return finished_at is not None and exit_code not in (None, 0)
+
+
+def _previous_value(target, attribute: str):
+    """Value of an attribute before the changes that are being flushed."""
+    history = getattr(inspect(target).attrs, attribute).history
+    if not history.has_changes():
+        return getattr(target, attribute)
+    return history.deleted[0] if history.deleted else None
+
+
+@event.listens_for(Result, 'after_insert')
+def count_inserted_result(mapper, connection, target):
+    Task.count_result(
+        connection, target.task_id, added=1,
+        finished=int(target.finished_at is not None),
+        failed=int(_has_failed(target.finished_at, target.exit_code))
+    )
+
+
+@event.listens_for(Result, 'after_update')
+def count_finished_result(mapper, connection, target):
+    was_finished_at = _previous_value(target, 'finished_at')
+    was_failed = _has_failed(was_finished_at,
+                             _previous_value(target, 'exit_code'))
+    is_failed = _has_failed(target.finished_at, target.exit_code)
+
+    finished = int(target.finished_at is not None) \
+        - int(was_finished_at is not None)
+    failed = int(is_failed) - int(was_failed)
+    if finished or failed:
+        Task.count_result(connection, target.task_id, finished=finished,
+                          failed=failed)
+
+
+@event.listens_for(Result, 'after_delete')
+def count_deleted_result(mapper, connection, target):
+    Task.count_result(
+        connection, target.task_id, added=-1,
+        finished=-int(target.finished_at is not None),
+        failed=-int(_has_failed(target.finished_at, target.exit_code))
+    )
@@ -1,9 +1,13 @@
-from sqlalchemy import Column, String, ForeignKey, Integer, sql
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Text, ForeignKey, Integer
+from sqlalchemy import func
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.ext.hybrid import hybrid_property
 
 from vantage6.server.model.node import Node
 from vantage6.server.model.base import Base, DatabaseSessionManager
+from vantage6.server.model.counter import Counter
+from vantage6.server.metrics import PAYLOAD_BYTES
+from vantage6.server.storage import Storage
 
 
 class Task(Base):
@@ -14,6 +18,16 @@ class Task(Base):
     Therefore the input for the task is encrypted for each organization
     seperately. The task originates from an organization to which the results
     need to be encrypted, therefore the originating organization is also logged
+
+    Alternatively, the input is encrypted once and stored in the task as
+    `shared_input`. The results then only contain the (encrypted) key to it
+    for their organization. Large shared inputs are kept in the payload
+    storage (see `vantage6.server.storage`).
+
+    The number of results of the task, and how many of those are finished or
+    have failed, are kept on the task itself. They are updated by the events
+    of `Result`, so that the completion of a task is known (and can be used
+    in a query) without loading its results.
     """
 
     # fields
@@ -25,6 +39,11 @@ class Task(Base):
     parent_id = Column(Integer, ForeignKey("task.id"))
     database = Column(String)
     initiator_id = Column(Integer, ForeignKey("organization.id"))
+    _shared_input = deferred(Column('shared_input', Text))
+    shared_input_ref = Column(String(64))
+    result_count = Column(Integer, default=0)
+    finished_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
 
     # relationships
     collaboration = relationship("Collaboration", back_populates="tasks")
@@ -32,9 +51,40 @@ class Task(Base):
     results = relationship("Result", back_populates="task")
     initiator = relationship("Organization", back_populates="created_tasks")
 
+    @property
+    def shared_input(self):
+        return Storage().load(self._shared_input, self.shared_input_ref)
+
+    @shared_input.setter
+    def shared_input(self, value):
+        PAYLOAD_BYTES.observe(len(value or ''), kind='shared_input')
+        self._shared_input, self.shared_input_ref = Storage().store(value)
+
     @hybrid_property
     def complete(self):
-        return all([r.complete for r in self.results])
+        return (self.finished_count or 0) >= (self.result_count or 0)
+
+    @complete.expression
+    def complete(cls):
+        return cls.finished_count >= cls.result_count
+
+    @classmethod
+    def count_result(cls, connection, task_id, added=0, finished=0,
+                     failed=0):
+        """Update the result counters of a task in the database.
+
+        The counters are incremented by the database, so that concurrent
+        updates are not lost. The `connection` can also be a session, which
+        is not committed.
+        """
+        table = cls.__table__
+        connection.execute(
+            table.update()
+            .where(table.c.id == task_id)
+            .values(result_count=table.c.result_count + added,
+                    finished_count=table.c.finished_count + finished,
+                    failed_count=table.c.failed_count + failed)
+        )
 
     def results_for_node(self, node):
         assert isinstance(node, Node), "Should be a node..."
@@ -44,12 +94,15 @@ class Task(Base):
 
     @classmethod
     def next_run_id(cls):
+        """Run id for a new top-level task.
+
+        The run ids are handed out by a `Counter`, which continues after the
+        highest run id of the existing tasks.
+        """
         session = DatabaseSessionManager.get_session()
-        max_run_id = session.query(sql.func.max(cls.run_id)).scalar()
-        if max_run_id:
-            return max_run_id + 1
-        else:
-            return 1
+        return Counter.next_value('run_id', start=lambda: (
+            session.query(func.max(cls.run_id)).scalar() or 0
+        ) + 1)
 
     def __repr__(self):
         return (
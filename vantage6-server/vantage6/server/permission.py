@@ -1,15 +1,23 @@
 import collections
+import itertools
 import logging
 import importlib
+import time
 
 from collections import namedtuple
+from threading import Lock
+from typing import Callable, Hashable, Iterable
 from flask_principal import Permission, PermissionDenied
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
 
-from vantage6.server.globals import RESOURCES
+from vantage6.server.globals import RESOURCES, DEFAULT_PERMISSION_CACHE_TTL
 from vantage6.server.model.role import Role
 from vantage6.server.model.rule import Rule, Operation, Scope
+from vantage6.server.model.user import User
 from vantage6.server.model.base import DatabaseSessionManager
-from vantage6.common import logger_name
+from vantage6.common import logger_name, Singleton
 
 module_name = logger_name(__name__)
 log = logging.getLogger(module_name)
@@ -17,6 +25,94 @@ log = logging.getLogger(module_name)
 RuleNeed = namedtuple("RuleNeed", ["name", "scope", "operation"])
 
 
+def rule_needs(rules: Iterable[Rule]) -> frozenset:
+    """Needs that are provided by having the `rules`."""
+    return frozenset(
+        RuleNeed(name=rule.name, scope=rule.scope, operation=rule.operation)
+        for rule in rules
+    )
+
+
+class PermissionCache(metaclass=Singleton):
+    """Permissions (sets of `RuleNeed`) of the identities of the API.
+
+    Building the permissions of an identity requires several queries, while
+    they hardly ever change. Therefore they are kept in this cache, keyed by
+    the identity and the version of the roles and rules. The version changes
+    whenever a role, a rule or the roles and rules of a user are changed in
+    this server process, which invalidates all cached permissions.
+
+    Changes made by other server processes are not noticed, therefore the
+    cached permissions also expire after `ttl` seconds.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_PERMISSION_CACHE_TTL):
+        self.ttl = ttl
+        self.version = 0
+
+        # key -> (version, expiration time, needs)
+        self.__entries = {}
+        self.__lock = Lock()
+
+    def get(self, key: Hashable, build: Callable[[], frozenset]) -> frozenset:
+        """Get the permissions of an identity
+
+        Parameters
+        ----------
+        key : Hashable
+            Identifies the identity, e.g. `('user', <id>)`
+        build : Callable[[], frozenset]
+            Builds the permissions, only called if they are not in the cache
+
+        Returns
+        -------
+        frozenset
+            The `RuleNeed`s of the identity
+        """
+        with self.__lock:
+            version = self.version
+            entry = self.__entries.get(key)
+            if entry and entry[0] == version and entry[1] > time.monotonic():
+                return entry[2]
+
+        needs = build()
+        with self.__lock:
+            self.__entries[key] = (version, time.monotonic() + self.ttl,
+                                   needs)
+        return needs
+
+    def invalidate(self) -> None:
+        """Invalidate the permissions of all identities."""
+        with self.__lock:
+            self.version += 1
+            self.__entries.clear()
+
+
+@event.listens_for(Session, 'after_flush')
+def _detect_permission_changes(session, flush_context):
+    """Mark the session when roles, rules or users' permissions change."""
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (Role, Rule)) or (isinstance(obj, User) and (
+                obj in session.deleted
+                or get_history(obj, 'roles').has_changes()
+                or get_history(obj, 'rules').has_changes())):
+            session.info['permissions_changed'] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_permissions(session):
+    # only once the changes are committed, otherwise a concurrent request
+    # could cache the old permissions under the new version
+    if session.info.pop('permissions_changed', False):
+        PermissionCache().invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_permission_changes(session):
+    session.info.pop('permissions_changed', None)
+
+
 class RuleCollection:
     """Ordering things in collections helps us in the API endpoints."""
 
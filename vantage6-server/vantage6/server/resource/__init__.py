@@ -13,6 +13,7 @@ from flask_jwt_extended import (
 
 from vantage6.common import logger_name
 from vantage6.server import db
+from vantage6.server.last_seen import LastSeenBuffer
 
 log = logging.getLogger(logger_name(__name__))
 
@@ -36,6 +37,18 @@ class ServicesResources(Resource):
         """Check that a `field` is included in the request argument context."""
         return field in request.args.getlist('include')
 
+    @staticmethod
+    def requested_fields():
+        """Fields that are selected using the `fields` request argument.
+
+        Clients can request only the fields they need (a sparse fieldset),
+        e.g. `fields=id,started_at,finished_at`. The `id` is always included.
+        Returns None when no selection is made, i.e. all fields are requested.
+        """
+        fields = {field.strip() for arg in request.args.getlist('fields')
+                  for field in arg.split(',') if field.strip()}
+        return fields | {'id'} if fields else None
+
     def dump(self, page, schema):
         """Dump based on the request context (to paginate or not)"""
         if self.is_included('metadata'):
@@ -121,10 +134,12 @@ def only_for(types=['user', 'node', 'container']):
 
 
 def get_and_update_authenticatable_info(auth_id):
-    """Get DB entity from ID and update info."""
+    """Get DB entity from ID and update info.
+
+    The `last_seen` update is buffered, see `LastSeenBuffer`.
+    """
     auth = db.Authenticatable.get(auth_id)
-    auth.last_seen = datetime.datetime.utcnow()
-    auth.save()
+    LastSeenBuffer().seen(auth_id)
     return auth
 
 
@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
+import re
 import logging
 import base64
 
 from marshmallow import fields
 from marshmallow_sqlalchemy import ModelSchema
-from flask import url_for
+from flask import url_for, request
 
 from vantage6.server import db
 from vantage6.common import logger_name
@@ -19,6 +20,30 @@ class HATEOASModelSchema(ModelSchema):
 
     api = None
 
+    # endpoint -> (URL template, methods) of the `<name>_with_id` endpoints,
+    # set by `build_link_templates`
+    link_templates = {}
+
+    @classmethod
+    def build_link_templates(cls, api) -> None:
+        """Precompute the links to the endpoints of single resources.
+
+        Links to related objects are then created by formatting a template,
+        rather than looking up the URL rule of the endpoint for every object
+        that is serialized. Must be called after all resources are added to
+        the `api`.
+        """
+        cls.api = api
+        cls.link_templates = {}
+        for rule in api.app.url_map.iter_rules():
+            if not rule.endpoint.endswith('_with_id') or \
+                    rule.arguments != {'id'}:
+                continue
+            template = re.sub(r'<(?:[^<>:]+:)?([^<>]+)>', r'{\1}', rule.rule)
+            methods = [method for method in rule.methods
+                       if method not in ('HEAD', 'OPTIONS')]
+            cls.link_templates.setdefault(rule.endpoint, (template, methods))
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -94,6 +119,10 @@ class HATEOASModelSchema(ModelSchema):
     def _hateos_from_related(self, elem, name):
         _id = elem.id
         endpoint = name+"_with_id"
+        if endpoint in self.link_templates:
+            template, verbs = self.link_templates[endpoint]
+            url = request.script_root + template.format(id=_id)
+            return {"id": _id, "link": url, "methods": list(verbs)}
         if self.api:
             if not self.api.owns_endpoint(endpoint):
                 Exception(f"Make sure {endpoint} exists!")
@@ -121,6 +150,7 @@ class HATEOASModelSchema(ModelSchema):
 class TaskSchema(HATEOASModelSchema):
     class Meta:
         model = db.Task
+        exclude = ('_shared_input', 'shared_input_ref')
 
     complete = fields.Boolean()
     collaboration = fields.Method("collaboration")
@@ -139,29 +169,45 @@ class TaskIncludedSchema(TaskSchema):
 class TaskResultSchema(HATEOASModelSchema):
     class Meta:
         model = db.Result
+        exclude = ('_input', 'input_ref', '_result', 'result_ref',
+                   'result_binary')
 
+    input = fields.Function(lambda obj: obj.full_input)
+    result = fields.Function(lambda obj: obj.result)
     node = fields.Function(
-        func=lambda obj: ResultNodeSchema().dump(obj.node, many=False).data
+        func=lambda obj: result_node_schema.dump(obj.node, many=False).data
     )
     ports = fields.Function(
-        func=lambda obj: ResultPortSchema().dump(obj.ports, many=True).data
+        func=lambda obj: result_port_schema.dump(obj.ports, many=True).data
     )
 
 
 class ResultSchema(HATEOASModelSchema):
     class Meta:
         model = db.Result
+        exclude = ('_input', 'input_ref', '_result', 'result_ref',
+                   'result_binary')
 
+    input = fields.Function(lambda obj: obj.full_input)
+    result = fields.Function(lambda obj: obj.result)
     organization = fields.Method("organization")
     task = fields.Method("task")
     node = fields.Function(
-        func=lambda obj: ResultNodeSchema().dump(obj.node, many=False).data
+        func=lambda obj: result_node_schema.dump(obj.node, many=False).data
     )
     ports = fields.Function(
-        func=lambda obj: ResultPortSchema().dump(obj.ports, many=True).data
+        func=lambda obj: result_port_schema.dump(obj.ports, many=True).data
     )
 
 
+# (large) columns of a result, by the field in which they are serialized
+RESULT_PAYLOAD_COLUMNS = {
+    'input': db.Result._input,
+    'result': db.Result._result,
+    'log': db.Result.log,
+}
+
+
 class ResultTaskIncludedSchema(ResultSchema):
     task = fields.Nested('TaskSchema', many=False, exclude=["results"])
 
@@ -169,8 +215,8 @@ class ResultTaskIncludedSchema(ResultSchema):
 class ResultNodeSchema(HATEOASModelSchema):
     class Meta:
         model = db.Node
-        exclude = ('type', 'api_key', 'collaboration', 'organization',
-                   'last_seen')
+        exclude = ('type', 'api_key', 'api_key_fingerprint', 'collaboration',
+                   'organization', 'last_seen')
 
 
 class PortSchema(HATEOASModelSchema):
@@ -184,6 +230,11 @@ class ResultPortSchema(HATEOASModelSchema):
         exclude = ('result',)
 
 
+# shared by the results, creating a schema for every result is slow
+result_node_schema = ResultNodeSchema()
+result_port_schema = ResultPortSchema()
+
+
 class OrganizationSchema(HATEOASModelSchema):
     class Meta:
         model = db.Organization
@@ -243,7 +294,7 @@ class NodeSchema(HATEOASModelSchema):
 
     class Meta:
         model = db.Node
-        exclude = ('api_key',)
+        exclude = ('api_key', 'api_key_fingerprint')
 
 
 # ------------------------------------------------------------------------------
@@ -282,6 +333,7 @@ class NodeSchemaSimple(HATEOASModelSchema):
             'collaboration',
             'taskresults',
             'api_key',
+            'api_key_fingerprint',
             'type',
         ]
 
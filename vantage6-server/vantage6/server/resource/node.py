@@ -104,6 +104,9 @@ class Nodes(NodeBase):
             Results can be paginated by using the parameter `page`. The
             pagination metadata can be included using `include=metadata`, note
             that this will put the actual data in an envelope.\n\n
+            Large tables are paged faster with the parameter `cursor`
+            (keyset pagination). The total number of items is then only
+            counted when `include=total` is given.\n\n
 
         parameters:
             - in: query
@@ -160,6 +163,13 @@ class Nodes(NodeBase):
               schema:
                 type: integer
               description: number of items per page
+            - in: query
+              name: cursor
+              schema:
+                type: string
+              description: >-
+                cursor for keyset pagination, empty for the first page. The
+                cursor of the next page is given in the `next` link
 
         responses:
             200:
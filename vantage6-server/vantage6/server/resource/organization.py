@@ -121,7 +121,10 @@ class Organizations(OrganizationBase):
 
             Organizations can be paginated by using the parameter `page`. The
             pagination metadata can be included using `include=metadata`, note
-            that this will put the actual data in an envelope.
+            that this will put the actual data in an envelope.\n\n
+            Large tables are paged faster with the parameter `cursor`
+            (keyset pagination). The total number of items is then only
+            counted when `include=total` is given.
 
         parameters:
             - in: query
@@ -158,6 +161,13 @@ class Organizations(OrganizationBase):
               schema:
                 type: integer
               description: number of items per page
+            - in: query
+              name: cursor
+              schema:
+                type: string
+              description: >-
+                cursor for keyset pagination, empty for the first page. The
+                cursor of the next page is given in the `next` link
 
         responses:
             200:
@@ -314,6 +324,18 @@ class Organization(OrganizationBase):
                 setattr(organization, field, data[field])
 
         organization.save()
+
+        # let nodes and users know that their cached public key of this
+        # organization is no longer valid
+        if data.get('public_key') is not None:
+            rooms = ['all_users'] + [
+                f'collaboration_{col.id}'
+                for col in organization.collaborations
+            ]
+            for room in rooms:
+                self.socketio.emit('public_key_updated',
+                                   {'organization_id': id},
+                                   namespace='/tasks', room=room)
         return org_schema.dump(organization, many=False).data, \
             HTTPStatus.OK
 
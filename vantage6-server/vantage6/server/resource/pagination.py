@@ -1,8 +1,11 @@
 import math
+import json
+import base64
 import logging
 
 from urllib.parse import urlencode
 import sqlalchemy
+from sqlalchemy import desc
 
 from vantage6.common import logger_name
 
@@ -70,6 +73,10 @@ class Pagination:
 
     @classmethod
     def from_query(cls, query: sqlalchemy.orm.query, request):
+        # keyset pagination is used when a cursor is given
+        if 'cursor' in request.args:
+            return CursorPagination.from_query(query, request)
+
         # We remove the ordering of the query since it doesn't matter for
         # getting a count and might have performance implications as discussed
         # on this Flask-SqlAlchemy issue
@@ -118,3 +125,91 @@ class Pagination:
         items = items[beginning:ending]
 
         return cls(items, page_id, per_page, total, request)
+
+
+class CursorPage:
+
+    def __init__(self, items, page_size, has_next, total=None):
+        self.items = items
+        self.page_size = page_size
+        self.has_next = has_next
+        self.next_cursor = encode_cursor(items[-1].id) if has_next else None
+        self.total = total
+
+
+class CursorPagination(Pagination):
+    """Keyset pagination on the (descending) id of the items.
+
+    Rather than skipping the items of the previous pages (which gets slower
+    for every next page), the next page is selected by the id of the last
+    item of the previous page. The client obtains this as an opaque cursor
+    from the `next` link, the first page is requested with an empty cursor
+    (`cursor=`). Pages of large tables take constant time, because counting
+    all items is only done on request (`include=total`).
+    """
+
+    def __init__(self, items, page_size, has_next, total, request):
+        self.page = CursorPage(items, page_size, has_next, total)
+        self.request = request
+
+    @property
+    def headers(self):
+        headers = {'Link': self.link_header}
+        if self.page.total is not None:
+            headers['total-count'] = self.page.total
+        return headers
+
+    @property
+    def metadata_links(self) -> dict:
+        url = self.request.path
+        args = self.request.args.copy()
+
+        navs = [
+            {'rel': 'first', 'cursor': ''},
+            {'rel': 'self', 'cursor': args['cursor']},
+            {'rel': 'next', 'cursor': self.page.next_cursor},
+        ]
+
+        links = {}
+        for nav in navs:
+            if nav['cursor'] is not None:
+                args['cursor'] = nav['cursor']
+                links[nav['rel']] = f'{url}?{urlencode(args)}'
+
+        return links
+
+    @classmethod
+    def from_query(cls, query: sqlalchemy.orm.query, request):
+        per_page = int(request.args.get('per_page', 10))
+        if per_page <= 0:
+            raise AttributeError('per_page needs to be >= 1')
+
+        total = None
+        if 'total' in request.args.getlist('include'):
+            total = query.distinct().order_by(None).count()
+
+        key = query.column_descriptions[0]['entity'].id
+        query = query.order_by(None).order_by(desc(key))
+        cursor = request.args['cursor']
+        if cursor:
+            query = query.filter(key < decode_cursor(cursor))
+
+        # retrieve one more item to find out if there is a next page
+        items = query.distinct().limit(per_page + 1).all()
+
+        return cls(items[:per_page], per_page, len(items) > per_page, total,
+                   request)
+
+
+def encode_cursor(id_: int) -> str:
+    """Cursor that points to the items after the item with `id_`."""
+    data = json.dumps({'id': id_}).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    """Id of the last item of the previous page from a `cursor`."""
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor))['id'])
+    except (ValueError, KeyError, TypeError):
+        raise AttributeError(f'Invalid cursor: {cursor}')
@@ -1,13 +1,14 @@
 # -*- coding: utf-8 -*-
 import logging
 
-from flask import g, request
+from flask import g, request, Response
 from http import HTTPStatus
 from flasgger import swag_from
 from pathlib import Path
 from sqlalchemy import desc
+from sqlalchemy.orm import defer, undefer, selectinload
 
-from vantage6.common import logger_name
+from vantage6.common import logger_name, read_chunks
 from vantage6.server import db
 from vantage6.server.permission import (
     PermissionManager,
@@ -23,7 +24,8 @@ from vantage6.server.resource import (
 from vantage6.server.resource.pagination import Pagination
 from vantage6.server.resource._schema import (
     ResultSchema,
-    ResultTaskIncludedSchema
+    ResultTaskIncludedSchema,
+    RESULT_PAYLOAD_COLUMNS
 )
 from vantage6.server.model import (
     Result as db_Result,
@@ -33,6 +35,7 @@ from vantage6.server.model import (
     Organization
 )
 from vantage6.server.model.base import DatabaseSessionManager
+from vantage6.server.storage import PAYLOAD_CHUNK_SIZE, text_to_payload
 
 
 module_name = logger_name(__name__)
@@ -58,6 +61,13 @@ def setup(api, api_base, services):
         methods=('GET', 'PATCH'),
         resource_class_kwargs=services
     )
+    api.add_resource(
+        ResultPayload,
+        path + '/<int:id>/payload',
+        endpoint='result_payload',
+        methods=('GET', 'PUT'),
+        resource_class_kwargs=services
+    )
 
 
 # Schemas
@@ -87,6 +97,66 @@ class ResultBase(ServicesResources):
         super().__init__(socketio, mail, api, permissions, config)
         self.r = getattr(self.permissions, module_name)
 
+    def fields(self):
+        """Fields of the results to return, based on the request arguments.
+
+        Clients can select fields with `fields=id,started_at,finished_at`.
+        The (large) `input` and `result` fields can also be excluded, e.g.
+        when they are downloaded from /result/<id>/payload instead.
+
+        Returns
+        -------
+        set
+            Names of the fields to serialize
+        """
+        fields = self.requested_fields() or set(result_inc_schema.fields)
+        return fields - set(request.args.getlist('exclude'))
+
+    def schema(self, fields: set):
+        """Schema to serialize results, with only the selected `fields`."""
+        if self.is_included('task'):
+            schema, schema_class = result_inc_schema, ResultTaskIncludedSchema
+        else:
+            schema, schema_class = result_schema, ResultSchema
+        if fields == set(schema.fields):
+            return schema
+        return schema_class(only=fields)
+
+    def validate_fields(self, fields: set):
+        """Returns an error message if unknown fields are selected."""
+        unknown = fields - set(result_inc_schema.fields)
+        if unknown:
+            return {'msg': f'Unknown fields: {", ".join(sorted(unknown))}'}
+
+    def load_options(self, fields: set) -> list:
+        """Query options to load what is needed to serialize `fields`.
+
+        Payload columns of fields that are not requested are not fetched
+        from the database, those of requested fields are loaded in the
+        same query rather than one query per result. Related objects are
+        loaded with one query for all results (per relationship).
+        """
+        options = [
+            undefer(column) if field in fields else defer(column)
+            for field, column in RESULT_PAYLOAD_COLUMNS.items()
+        ]
+
+        # the task is also needed for the input and the node
+        task = selectinload(db_Result.task)
+        options.append(task)
+        if 'input' in fields:
+            options.append(task.undefer(Task._shared_input))
+        if 'task' in fields and self.is_included('task'):
+            options += [task.selectinload(relationship) for relationship in (
+                Task.collaboration, Task.initiator, Task.parent,
+                Task.children, Task.results
+            )]
+        if 'organization' in fields:
+            options.append(selectinload(db_Result.organization))
+        if 'ports' in fields:
+            options.append(selectinload(db_Result.ports))
+        return options
+
 
 class Results(ResultBase):
 
@@ -110,7 +180,10 @@ class Results(ResultBase):
 
             Results can be paginated by using the parameter `page`. The
             pagination metadata can be included using `include=metadata`, note
-            that this will put the actual data in an envelope.
+            that this will put the actual data in an envelope.\n\n
+            Large tables are paged faster with the parameter `cursor`
+            (keyset pagination). The total number of items is then only
+            counted when `include=total` is given.
 
         parameters:
             - in: query
@@ -163,6 +236,14 @@ class Results(ResultBase):
               schema:
                 type: integer
               description: node id
+            - in: query
+              name: after_id
+              schema:
+                type: integer
+              description: >-
+                show only results with a higher id, i.e. that were assigned
+                after this result. Nodes use this to retrieve the results
+                that were assigned since they last synchronized
             - in: query
               name: port
               schema:
@@ -173,6 +254,19 @@ class Results(ResultBase):
               schema:
                 type: string (can be multiple)
               description: what to include ('task', 'metadata')
+            - in: query
+              name: exclude
+              schema:
+                type: string (can be multiple)
+              description: what to exclude ('input', 'result')
+            - in: query
+              name: fields
+              schema:
+                type: string
+              description: >-
+                comma separated fields to return, e.g.
+                'id,started_at,finished_at'. Large fields that are not
+                requested are not loaded
             - in: query
               name: page
               schema:
@@ -183,6 +277,13 @@ class Results(ResultBase):
               schema:
                 type: integer
               description: number of items per page
+            - in: query
+              name: cursor
+              schema:
+                type: string
+              description: >-
+                cursor for keyset pagination, empty for the first page. The
+                cursor of the next page is given in the `next` link
 
         responses:
             200:
@@ -198,7 +299,13 @@ class Results(ResultBase):
         auth_org = self.obtain_auth_organization()
         args = request.args
 
-        q = DatabaseSessionManager.get_session().query(db_Result)
+        fields = self.fields()
+        error = self.validate_fields(fields)
+        if error:
+            return error, HTTPStatus.BAD_REQUEST
+
+        q = DatabaseSessionManager.get_session().query(db_Result)\
+            .options(*self.load_options(fields))
 
         # relation filters
         for param in ['task_id', 'organization_id', 'port']:
@@ -216,6 +323,8 @@ class Results(ResultBase):
         # custom filters
         if args.get('state') == 'open':
             q = q.filter(db_Result.finished_at == None)
+        if 'after_id' in args:
+            q = q.filter(db_Result.id > args['after_id'])
 
         q = q.join(Organization).join(Node).join(Task, db_Result.task)\
             .join(Collaboration)
@@ -236,11 +345,10 @@ class Results(ResultBase):
         # query the DB and paginate
         q = q.order_by(desc(db_Result.id))
         page = Pagination.from_query(query=q, request=request)
+        if 'node' in fields:
+            db_Result.load_nodes(page.page.items)
 
-        # serialization of the models
-        s = result_inc_schema if self.is_included('task') else result_schema
-
-        return self.response(page, s)
+        return self.response(page, self.schema(fields))
 
 
 class Result(ResultBase):
@@ -276,10 +384,22 @@ class Result(ResultBase):
             schema:
               type: string
             description: what to include ('task')
+          - in: query
+            name: exclude
+            schema:
+              type: string (can be multiple)
+            description: what to exclude ('input', 'result')
+          - in: query
+            name: fields
+            schema:
+              type: string
+            description: comma separated fields to return
 
         responses:
           200:
               description: Ok
+          400:
+              description: Unknown field requested
           401:
               description: Unauthorized or missing permission
           404:
@@ -293,6 +413,11 @@ class Result(ResultBase):
 
         auth_org = self.obtain_auth_organization()
 
+        fields = self.fields()
+        error = self.validate_fields(fields)
+        if error:
+            return error, HTTPStatus.BAD_REQUEST
+
         result = db_Result.get(id)
         if not result:
             return {'msg': f'Result id={id} not found!'}, \
@@ -303,10 +428,8 @@ class Result(ResultBase):
                 return {'msg': 'You lack the permission to do that!'}, \
                     HTTPStatus.UNAUTHORIZED
 
-        s = result_inc_schema if request.args.get('include') == 'task' \
-            else result_schema
-
-        return s.dump(result, many=False).data, HTTPStatus.OK
+        return self.schema(fields).dump(result, many=False).data, \
+            HTTPStatus.OK
 
     @with_node
     @swag_from(str(Path(r"swagger/patch_result_with_id.yaml")),
@@ -331,16 +454,176 @@ class Result(ResultBase):
             return {"msg": "Cannot update an already finished result!"}, \
                 HTTPStatus.BAD_REQUEST
 
-        # notify collaboration nodes/users that the task has an update
-        self.socketio.emit("status_update", {'result_id': id},
-                           namespace='/tasks', room='collaboration_' +
-                           str(result.task.collaboration.id))
-
         result.started_at = parse_datetime(data.get("started_at"),
                                            result.started_at)
         result.finished_at = parse_datetime(data.get("finished_at"))
-        result.result = data.get("result")
+        if "exit_code" in data:
+            result.exit_code = data.get("exit_code")
+        # the result may have been uploaded already to /result/<id>/payload
+        if "result" in data:
+            result.result = data.get("result")
         result.log = data.get("log")
         result.save()
 
+        # notify collaboration nodes/users that the task has an update, once
+        # the update is stored so that they can retrieve it
+        self.socketio.emit("status_update", {'result_id': id},
+                           namespace='/tasks', room='collaboration_' +
+                           str(result.task.collaboration.id))
+
         return result_schema.dump(result, many=False).data, HTTPStatus.OK
+
+
+class ResultPayload(ResultBase):
+    """Resource for /api/result/<id>/payload"""
+
+    @only_for(['node', 'user', 'container'])
+    def get(self, id):
+        """ Download the result or input of a result as binary data
+        ---
+
+        description: >-
+            Returns the (encrypted) result or input as
+            `application/octet-stream`. Compared to the JSON representation,
+            the encrypted message is not base64 encoded. \n\n
+
+            ### Permission Table\n
+            |Rule name|Scope|Operation|Node|Container|Description|\n
+            |--|--|--|--|--|--|\n
+            |Result|Global|View|❌|❌|View any result|\n
+            |Result|Organization|View|✅|✅|View the results of your
+            organizations collaborations|\n
+
+            Accessable as: `node`, `user` and `container`.
+
+        parameters:
+          - in: path
+            name: id
+            schema:
+              type: integer
+            minimum: 1
+            description: unique result identifier
+            required: true
+          - in: query
+            name: field
+            schema:
+              type: string
+            description: what to download ('result' (default) or 'input')
+
+        responses:
+          200:
+              description: Ok
+          204:
+              description: There is no result (yet)
+          400:
+              description: Unknown field
+          401:
+              description: Unauthorized or missing permission
+          404:
+              description: result id not found
+
+        security:
+          - bearerAuth: []
+
+        tags: ["Result"]
+        """
+        auth_org = self.obtain_auth_organization()
+
+        result = db_Result.get(id)
+        if not result:
+            return {'msg': f'Result id={id} not found!'}, \
+                HTTPStatus.NOT_FOUND
+        if not self.r.v_glo.can():
+            c_orgs = result.task.collaboration.organizations
+            if not (self.r.v_org.can() and auth_org in c_orgs):
+                return {'msg': 'You lack the permission to do that!'}, \
+                    HTTPStatus.UNAUTHORIZED
+
+        field = request.args.get('field', 'result')
+        if field not in ('result', 'input'):
+            return {'msg': f'Unknown field "{field}"!'}, \
+                HTTPStatus.BAD_REQUEST
+
+        if field == 'result':
+            payload = result.result_payload()
+        else:
+            text = result.full_input
+            payload = text_to_payload(text, result.payload_header_fields) \
+                if text else None
+        if payload is None:
+            return Response(status=HTTPStatus.NO_CONTENT)
+
+        return Response(payload, mimetype='application/octet-stream')
+
+    @with_node
+    def put(self, id):
+        """ Upload the result as binary data
+        ---
+
+        description: >-
+            Store the (encrypted) result of an algorithm, send as
+            `application/octet-stream`. Compared to the JSON representation,
+            the encrypted message is not base64 encoded. The result is
+            finished by a PATCH at `/result/{id}` without a `result`. \n\n
+
+            Only accessable as `node`, for results of its organization.
+
+        parameters:
+          - in: path
+            name: id
+            schema:
+              type: integer
+            minimum: 1
+            description: unique result identifier
+            required: true
+
+        requestBody:
+          content:
+            application/octet-stream:
+              schema:
+                type: string
+                format: binary
+
+        responses:
+          200:
+              description: Ok
+          400:
+              description: Result is already finished or malformed
+          401:
+              description: Unauthorized or not the owner of this result
+          404:
+              description: result id not found
+
+        security:
+          - bearerAuth: []
+
+        tags: ["Result"]
+        """
+        result = db_Result.get(id)
+        if not result:
+            return {'msg': f'Result id={id} not found!'}, HTTPStatus.NOT_FOUND
+
+        if result.organization_id != g.node.organization_id:
+            log.warn(
+                f"{g.node.name} tries to upload a result that does not belong "
+                f"to its organization. ({result.organization_id}/"
+                f"{g.node.organization_id})"
+            )
+            return {"msg": "This is not your result to PUT!"}, \
+                HTTPStatus.UNAUTHORIZED
+
+        if result.finished_at is not None:
+            return {"msg": "Cannot update an already finished result!"}, \
+                HTTPStatus.BAD_REQUEST
+
+        try:
+            result.store_result_payload(
+                read_chunks(request.stream, PAYLOAD_CHUNK_SIZE),
+                size=request.content_length
+            )
+        except ValueError as e:
+            return {"msg": f"Malformed payload: {e}"}, HTTPStatus.BAD_REQUEST
+        result.save()
+
+        return {"msg": f"Payload of result id={id} is stored", "id": id}, \
+            HTTPStatus.OK
@@ -1,43 +1,94 @@
 # -*- coding: utf-8 -*-
-# import logging
+"""
+Resources below '/<api_base>/stats'
+"""
+import logging
 
-# from vantage6.server.resource import only_for
-# from vantage6.server.resource._schema import CollaborationSchemaSimple
-# from http import HTTPStatus
+from http import HTTPStatus
 
-# from vantage6.common import logger_name
-# from vantage6.server import db
-# from vantage6.server.resource import ServicesResources
+from vantage6.common import logger_name
+from vantage6.server.model.base import Database
+from vantage6.server.permission import (
+    PermissionManager,
+    Scope as S,
+    Operation as P
+)
+from vantage6.server.resource import with_user, ServicesResources
 
 
-# module_name = logger_name(__name__)
-# log = logging.getLogger(module_name)
+module_name = logger_name(__name__)
+log = logging.getLogger(module_name)
 
 
-# def setup(api, api_base, services):
-#     path = "/".join([api_base, module_name])
-#     log.info(f'Setting up "{path}" and subdirectories')
+def setup(api, api_base, services):
+    path = "/".join([api_base, module_name])
+    log.info(f'Setting up "{path}" and subdirectories')
 
-#     api.add_resource(
-#         Stats,
-#         path,
-#         endpoint='stats',
-#         methods=('GET', ),
-#         resource_class_kwargs=services
-#     )
+    api.add_resource(
+        Stats,
+        path,
+        endpoint='stats',
+        methods=('GET', ),
+        resource_class_kwargs=services
+    )
+
+
+# -----------------------------------------------------------------------------
+# Permissions
+# -----------------------------------------------------------------------------
+def permissions(permissions: PermissionManager):
+    add = permissions.appender(module_name)
+
+    add(scope=S.GLOBAL, operation=P.VIEW,
+        description="view the usage statistics of the server")
 
 
 # ------------------------------------------------------------------------------
 # Resources / API's
 # ------------------------------------------------------------------------------
-# class Stats(ServicesResources):
-#     """Resource for /api/stats"""
+class Stats(ServicesResources):
+    """Resource for /api/stats"""
+
+    def __init__(self, socketio, mail, api, permissions, config):
+        super().__init__(socketio, mail, api, permissions, config)
+        self.r = getattr(self.permissions, module_name)
+
+    @with_user
+    def get(self):
+        """ Usage statistics of the server
+        ---
+
+        description: >-
+            Returns the usage of the database connection pool, to help size
+            the pool for the number of nodes and users. For pools that do not
+            keep connections open (e.g. for SQLite) only the `type` is
+            returned.\n\n
+
+            The pool statistics are those of the worker process that handles
+            the request.\n\n
+
+            ### Permission Table\n
+            |Rule name|Scope|Operation|Node|Container|Description|\n
+            |--|--|--|--|--|--|\n
+            |Stats|Global|View|❌|❌|View the usage statistics of the
+            server|\n
+
+            Accessible as: `user`.
+
+        responses:
+          200:
+            description: Ok
+          401:
+            description: Unauthorized or missing permission
+
+        security:
+          - bearerAuth: []
 
-#     # stats_schema = StatsSchema()
-#     @only_for(["user", "node"])
-#     def get(self, id=None):
-#         schema = CollaborationSchemaSimple(many=True)
+        tags: ["Database"]
+        """
+        if not self.r.v_glo.can():
+            return {'msg': 'You lack the permission to do that!'}, \
+                HTTPStatus.UNAUTHORIZED
 
-#         return {
-#             'collaborations': schema.dump(db.Collaboration.get()).data
-#         }, HTTPStatus.OK
+        return {'database': {'pool': Database().pool_status()}}, \
+            HTTPStatus.OK
@@ -14,6 +14,7 @@ swagger_template = {
                     "image": {"type": "string"},
                     "description": {"type": "string"},
                     "input": {"type": "string"},
+                    "shared_input": {"type": "string"},
                     "name": {"type": "string"},
                     "collaboration_id": {"type": "integer"},
                     "organization_ids": {
@@ -6,7 +6,8 @@ from flask import g, request, url_for
 from http import HTTPStatus
 from flasgger import swag_from
 from pathlib import Path
-from sqlalchemy import desc
+from sqlalchemy import and_, desc
+from sqlalchemy.orm import selectinload, undefer
 
 from vantage6.common.globals import STRING_ENCODING
 from vantage6.server import db
@@ -20,7 +21,8 @@ from vantage6.server.resource import only_for, ServicesResources, with_user
 from vantage6.server.resource._schema import (
     TaskSchema,
     TaskIncludedSchema,
-    TaskResultSchema
+    TaskResultSchema,
+    RESULT_PAYLOAD_COLUMNS
 )
 from vantage6.server.resource.pagination import Pagination
 
@@ -101,6 +103,93 @@ class TaskBase(ServicesResources):
         super().__init__(socketio, mail, api, permissions, config)
         self.r = getattr(self.permissions, module_name)
 
+    def fields(self):
+        """Fields of the tasks to return, based on the request arguments.
+
+        Fields of the included results are selected as `results.<field>`,
+        e.g. `fields=name,results.finished_at`. When `results` is selected
+        without specifying fields, all fields of the results are returned.
+
+        Returns
+        -------
+        set
+            Names of the fields to serialize
+        """
+        fields = self.requested_fields()
+        if not fields:
+            return set(task_result_schema.fields)
+        if any(field.startswith('results.') for field in fields):
+            fields.add('results.id')
+        return fields
+
+    @staticmethod
+    def validate_fields(fields: set):
+        """Returns an error message if unknown fields are selected."""
+        unknown = set()
+        for field in fields:
+            name, _, result_field = field.partition('.')
+            if name not in task_result_schema.fields or (
+                    result_field and (name != 'results' or result_field
+                                      not in task_result_schema2.fields)):
+                unknown.add(field)
+        if unknown:
+            return {'msg': f'Unknown fields: {", ".join(sorted(unknown))}'}
+
+    def result_fields(self, fields: set) -> set:
+        """Fields of the included results to serialize, None if the results
+        are not included."""
+        if not self.is_included('result'):
+            return None
+        result_fields = {field.split('.', 1)[1] for field in fields
+                         if field.startswith('results.')}
+        if result_fields:
+            return result_fields
+        return set(task_result_schema2.fields) if 'results' in fields \
+            else None
+
+    def load_options(self, fields: set) -> list:
+        """Query options to load what is needed to serialize `fields`.
+
+        Related objects are loaded with one query for all tasks (per
+        relationship), rather than one query per task. Of the included
+        results, only the payload columns that are used are loaded.
+        """
+        relationships = {
+            'collaboration': db.Task.collaboration,
+            'initiator': db.Task.initiator,
+            'parent': db.Task.parent,
+            'children': db.Task.children,
+            'results': db.Task.results,
+        }
+        options = [selectinload(relationship) for field, relationship
+                   in relationships.items() if field in fields]
+
+        result_fields = self.result_fields(fields)
+        if result_fields is not None:
+            results = selectinload(db.Task.results)
+            options += [
+                results.undefer(column) if field in result_fields
+                else results.defer(column)
+                for field, column in RESULT_PAYLOAD_COLUMNS.items()
+            ]
+            if 'input' in result_fields:
+                options.append(undefer(db.Task._shared_input))
+            if 'organization' in result_fields:
+                options.append(results.selectinload(db.Result.organization))
+            if 'ports' in result_fields:
+                options.append(results.selectinload(db.Result.ports))
+        return options
+
+    def schema(self, fields: set):
+        """Schema to serialize tasks, with only the selected `fields`."""
+        if self.is_included('result'):
+            schema, schema_class = task_result_schema, TaskIncludedSchema
+        else:
+            schema, schema_class = task_schema, TaskSchema
+        if fields == set(schema.fields):
+            return schema
+        return schema_class(only=fields)
+
 
 class Tasks(TaskBase):
 
@@ -122,7 +211,10 @@ class Tasks(TaskBase):
 
             Results can be paginated by using the parameter `page`. The
             pagination metadata can be included using `include=metadata`, note
-            that this will put the actual data in an envelope.
+            that this will put the actual data in an envelope.\n\n
+            Large tables are paged faster with the parameter `cursor`
+            (keyset pagination). The total number of items is then only
+            counted when `include=total` is given.
 
 
         parameters:
@@ -188,11 +280,28 @@ class Tasks(TaskBase):
               schema:
                 type: int
               description: A result id that belongs to the task
+            - in: query
+              name: status
+              schema:
+                type: string
+              description: >-
+                Status of the task: 'open' (not all results are finished),
+                'complete' (all results are finished) or 'failed' (the
+                algorithm of at least one result has crashed)
             - in: query
               name: include
               schema:
                 type: string
-              description: what to include in the output ('metadata')
+              description: >-
+                what to include in the output ('metadata', 'result')
+            - in: query
+              name: fields
+              schema:
+                type: string
+              description: >-
+                comma separated fields to return, fields of the included
+                results as 'results.<field>', e.g.
+                'id,results.finished_at'
             - in: query
               name: page
               schema:
@@ -203,10 +312,19 @@ class Tasks(TaskBase):
               schema:
                 type: integer
               description: number of items per page
+            - in: query
+              name: cursor
+              schema:
+                type: string
+              description: >-
+                cursor for keyset pagination, empty for the first page. The
+                cursor of the next page is given in the `next` link
 
         responses:
             200:
                 description: Ok
+            400:
+                description: Unknown field or status requested
             404:
                 description: Task not found
             401:
@@ -217,9 +335,16 @@ class Tasks(TaskBase):
 
         tags: ["Task"]
         """
-        q = DatabaseSessionManager.get_session().query(db.Task)
         args = request.args
 
+        fields = self.fields()
+        error = self.validate_fields(fields)
+        if error:
+            return error, HTTPStatus.BAD_REQUEST
+
+        q = DatabaseSessionManager.get_session().query(db.Task)\
+            .options(*self.load_options(fields))
+
         # obtain organization id
         auth_org_id = self.obtain_organization_id()
 
@@ -242,16 +367,26 @@ class Tasks(TaskBase):
                 q = q.filter(getattr(db.Task, param).like(args[param]))
         if 'result_id' in args:
             q = q.join(db.Result).filter(db.Result.id == args['result_id'])
+        if 'status' in args:
+            statuses = {
+                'open': ~db.Task.complete,
+                'complete': db.Task.complete,
+                'failed': db.Task.failed_count > 0,
+            }
+            if args['status'] not in statuses:
+                return {'msg': f"Unknown status '{args['status']}', use one "
+                        f"of {', '.join(statuses)}"}, HTTPStatus.BAD_REQUEST
+            q = q.filter(statuses[args['status']])
 
         q = q.order_by(desc(db.Task.id))
         # paginate tasks
         page = Pagination.from_query(q, request)
+        if 'node' in (self.result_fields(fields) or ()):
+            db.Result.load_nodes(
+                [result for task in page.page.items for result in task.results]
+            )
 
-        # serialization schema
-        schema = task_result_schema if self.is_included('result') else\
-            task_schema
-
-        return self.response(page, schema)
+        return self.response(page, self.schema(fields))
 
     @only_for(["user", "container"])
     @swag_from(str(Path(r"swagger/post_task_without_id.yaml")),
@@ -268,24 +403,21 @@ class Tasks(TaskBase):
 
         organizations_json_list = data.get('organizations')
         org_ids = [org.get("id") for org in organizations_json_list]
-        db_ids = collaboration.get_organization_ids()
 
         # Check that all organization ids are within the collaboration, this
-        # also ensures us that the organizations exist
-        if not set(org_ids).issubset(db_ids):
+        # also ensures us that the organizations exist, and that all the
+        # organizations have a registered node
+        organizations, node_org_ids = self.__collaboration_organizations(
+            collaboration_id, org_ids
+        )
+        if not set(org_ids).issubset(organizations):
             return {"msg": (
                 "At least one of the supplied organizations in not within "
                 "the collaboration."
             )}, HTTPStatus.BAD_REQUEST
 
-        # check if all the organizations have a registered node
-        nodes = DatabaseSessionManager.get_session().query(db.Node)\
-            .filter(db.Node.organization_id.in_(org_ids))\
-            .filter(db.Node.collaboration_id == collaboration_id)\
-            .all()
-        if len(nodes) < len(org_ids):
-            present_nodes = [node.organization_id for node in nodes]
-            missing = [str(id) for id in org_ids if id not in present_nodes]
+        if not set(org_ids).issubset(node_org_ids):
+            missing = [str(id) for id in org_ids if id not in node_org_ids]
             return {"msg": (
                 "Cannot create this task because there are no nodes registered"
                 f" for the following organization(s): {', '.join(missing)}."
@@ -325,7 +457,8 @@ class Tasks(TaskBase):
         # permissions ok, create record
         task = db.Task(collaboration=collaboration, name=data.get('name', ''),
                        description=data.get('description', ''), image=image,
-                       database=data.get('database', ''), initiator=initiator)
+                       database=data.get('database', ''), initiator=initiator,
+                       shared_input=data.get('shared_input'))
 
         # create run_id. Users can only create top-level -tasks (they will not
         # have sub-tasks). Therefore, always create a new run_id. Tasks created
@@ -338,9 +471,6 @@ class Tasks(TaskBase):
             task.run_id = db.Task.get(g.container["task_id"]).run_id
             log.debug(f"Sub task from parent_id={task.parent_id}")
 
-        # ok commit session...
-        task.save()
-
         # if the 'master'-flag is set to true the (master) task is executed on
         # a node in the collaboration from the organization to which the user
         # belongs. If also organization_ids are supplied, then these are
@@ -364,29 +494,58 @@ class Tasks(TaskBase):
             assign_orgs = organizations_json_list
 
         # now we need to create results for the nodes to fill. Each node
-        # receives their instructions from a result, not from the task itself
+        # receives their instructions from a result, not from the task itself.
+        # The task and its results are stored in a single transaction, the
+        # results are inserted at once.
         log.debug(f"Assigning task to {len(assign_orgs)} nodes.")
-        for org in assign_orgs:
-            organization = db.Organization.get(org['id'])
-            log.debug(f"Assigning task to '{organization.name}'.")
-            input_ = org.get('input')
-            # FIXME: legacy input from the client, could be removed at some
-            # point
-            if isinstance(input_, dict):
-                input_ = json.dumps(input_).encode(STRING_ENCODING)
-            # Create result
-            result = db.Result(
-                task=task,
-                organization=organization,
-                input=input_,
-            )
-            result.save()
-
-        # notify nodes a new task available (only to online nodes), nodes that
-        # are offline will receive this task on sign in.
+        session = DatabaseSessionManager.get_session()
+        try:
+            # the results are inserted in bulk, which bypasses the events
+            # that count them
+            task.result_count = len(assign_orgs)
+            session.add(task)
+            session.flush()
+
+            results = []
+            for org in assign_orgs:
+                log.debug("Assigning task to "
+                          f"'{organizations[org['id']].name}'.")
+                input_ = org.get('input')
+                # FIXME: legacy input from the client, could be removed at
+                # some point
+                if isinstance(input_, dict):
+                    input_ = json.dumps(input_).encode(STRING_ENCODING)
+                results.append(db.Result(
+                    task_id=task.id,
+                    organization_id=org['id'],
+                    input=input_,
+                ))
+            session.bulk_save_objects(results)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+        # notify nodes and users a new task available (only to online nodes),
+        # nodes that are offline will receive this task on sign in.
         self.socketio.emit('new_task', task.id, namespace='/tasks',
                            room=f'collaboration_{task.collaboration_id}')
 
+        # notify the nodes of the assigned organizations, each with the id of
+        # their own result, so that they do not need to look it up. Nodes
+        # that receive this event ignore the `new_task` event.
+        assigned = session.query(db.Result.id, db.Node.id)\
+            .join(db.Node, and_(
+                db.Node.organization_id == db.Result.organization_id,
+                db.Node.collaboration_id == task.collaboration_id
+            ))\
+            .filter(db.Result.task_id == task.id)
+        for result_id, node_id in assigned:
+            self.socketio.emit(
+                'task_assigned', {'task_id': task.id, 'result_id': result_id},
+                namespace='/tasks', room=f'node_{node_id}'
+            )
+
         # add some logging
         log.info(f"New task for collaboration '{task.collaboration.name}'")
         if g.user:
@@ -402,6 +561,30 @@ class Tasks(TaskBase):
 
         return task_schema.dump(task, many=False).data, HTTPStatus.CREATED
 
+    @staticmethod
+    def __collaboration_organizations(collaboration_id, org_ids):
+        """Organizations of `org_ids` that are in the collaboration.
+
+        Returns the organizations by their id, and the ids of the
+        organizations that have a node in the collaboration. Both are
+        obtained with a single query.
+        """
+        rows = DatabaseSessionManager.get_session()\
+            .query(db.Organization, db.Node.id)\
+            .join(db.Member,
+                  db.Member.c.organization_id == db.Organization.id)\
+            .outerjoin(db.Node, and_(
+                db.Node.organization_id == db.Organization.id,
+                db.Node.collaboration_id == collaboration_id
+            ))\
+            .filter(db.Member.c.collaboration_id == collaboration_id)\
+            .filter(db.Organization.id.in_(set(org_ids)))\
+            .all()
+
+        organizations = {org.id: org for org, _ in rows}
+        node_org_ids = {org.id for org, node_id in rows if node_id}
+        return organizations, node_org_ids
+
     @staticmethod
     def __verify_container_permissions(container, image, collaboration_id):
         """Validates that the container is allowed to create the task."""
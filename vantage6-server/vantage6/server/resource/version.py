@@ -10,6 +10,7 @@ from http import HTTPStatus
 from vantage6.common import logger_name
 from vantage6.server.resource import ServicesResources
 from vantage6.server._version import __version__
+from vantage6.server.globals import SERVER_FEATURES
 
 
 module_name = logger_name(__name__)
@@ -37,6 +38,7 @@ class Version(ServicesResources):
 
     @swag_from(str(Path(r"swagger/get_version.yaml")), endpoint='version')
     def get(self):
-        """Return the version of this server."""
+        """Return the version and supported features of this server."""
 
-        return {"version": __version__}, HTTPStatus.OK
+        return {"version": __version__, "features": SERVER_FEATURES}, \
+            HTTPStatus.OK
@@ -0,0 +1,361 @@
+""" Storage of (large) payloads
+
+The input and the result of a task can be large. Rather than storing them in
+the database, where they are loaded with every `Result` row, payloads above a
+configured size are put in a separate storage backend: a folder on the local
+file system or a bucket of an S3-compatible object store. The database only
+contains a reference to the payload, which is retrieved from the storage once
+it is actually used.
+
+Payloads are stored by their content (the reference is the SHA-256 hash of
+the payload), so the same payload is only stored once. For that reason
+payloads are never removed from the storage.
+
+Payloads are text: in encrypted collaborations
+`<encrypted key>$<iv>$<encrypted message>`, otherwise `<message>`, all
+base64 encoded. Results that are uploaded as binary data (see
+`/result/<id>/payload`) are put in the storage backend in their binary
+representation, in which the (encrypted) message is raw bytes. They are
+streamed to and from the backend, and only converted to text when they are
+requested as JSON.
+
+The storage is configured in the server configuration file:
+
+    storage:
+      type: local           # 'database' (default), 'local' or 's3'
+      path: /data/payloads  # local: folder to store the payloads in
+      bucket: vantage6      # s3: bucket to store the payloads in
+      endpoint_url: http://minio:9000  # s3: (optional) custom endpoint
+      region: eu-west-1     # s3: (optional)
+      access_key_id: ...    # s3: (optional) otherwise taken from environment
+      secret_access_key: ...
+      prefix: payloads/     # s3: (optional) prefix of the object keys
+      inline_threshold: 4096  # payloads smaller than this (in bytes) are
+                              # kept in the database
+"""
+import os
+import base64
+import hashlib
+import logging
+import itertools
+import tempfile
+
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+
+from vantage6.common import (
+    logger_name, Singleton, read_chunks, aligned_chunks
+)
+from vantage6.common.globals import STRING_ENCODING
+from vantage6.server.globals import DEFAULT_STORAGE_INLINE_THRESHOLD
+
+module_name = logger_name(__name__)
+log = logging.getLogger(module_name)
+
+# separates the encrypted key, the iv and the message of a payload
+SEPARATOR = '$'
+
+# number of bytes that is converted or transferred at once, a multiple of 3
+# and 4 so that base64 can be encoded and decoded in parts
+PAYLOAD_CHUNK_SIZE = 3 * 4 * 2**14
+
+
+def payload_to_text(chunks: Iterable[bytes], n_header: int) -> str:
+    """Convert a binary payload to its text representation."""
+    chunks = checked_payload(chunks, n_header)
+    separator = SEPARATOR.encode(STRING_ENCODING)
+
+    *fields, rest = next(chunks).split(separator, n_header)
+    header = separator.join(fields + [b''])
+    chunks = itertools.chain([rest], chunks)
+
+    message = b''.join(
+        base64.b64encode(chunk) for chunk in aligned_chunks(chunks, 3)
+    )
+    return (header + message).decode(STRING_ENCODING)
+
+
+def text_to_payload(text: str, n_header: int) -> Iterator[bytes]:
+    """Convert the text representation of a payload to binary, in chunks."""
+    start = 0
+    for _ in range(n_header):
+        start = text.index(SEPARATOR, start) + 1
+    yield text[:start].encode(STRING_ENCODING)
+
+    for i in range(start, len(text), PAYLOAD_CHUNK_SIZE):
+        yield base64.b64decode(text[i:i + PAYLOAD_CHUNK_SIZE])
+
+
+def checked_payload(chunks: Iterable[bytes],
+                    n_header: int) -> Iterator[bytes]:
+    """Pass on the chunks of a binary payload, of which the first chunk
+    contains (at least) the `n_header` base64 fields that precede the
+    message. Raises a ValueError if the payload does not contain them."""
+    chunks = iter(chunks)
+    separator = SEPARATOR.encode(STRING_ENCODING)
+
+    header = b''
+    if n_header:
+        for chunk in chunks:
+            header += chunk
+            if header.count(separator) >= n_header:
+                break
+        else:
+            raise ValueError("Payload does not contain the encrypted key")
+    yield header
+    yield from chunks
+
+
+class StorageBackend:
+    """Interface for the storage of payloads."""
+
+    @staticmethod
+    def reference(data: bytes) -> str:
+        """Reference under which `data` is stored."""
+        return hashlib.sha256(data).hexdigest()
+
+    def put(self, data: bytes) -> str:
+        """Store `data` and return the reference to it."""
+        raise NotImplementedError
+
+    def get(self, reference: str) -> bytes:
+        """Retrieve the data that is stored under `reference`."""
+        raise NotImplementedError
+
+    def put_stream(self, chunks: Iterable[bytes]) -> Tuple[str, int]:
+        """Store the data in `chunks`, return the reference and the size."""
+        data = b''.join(chunks)
+        return self.put(data), len(data)
+
+    def get_stream(self, reference: str) -> Iterator[bytes]:
+        """Retrieve the data that is stored under `reference` in chunks."""
+        yield self.get(reference)
+
+
+class FileSystemStorage(StorageBackend):
+    """Stores payloads as files in a folder on the local file system."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, reference: str) -> Path:
+        # spread the files over subfolders, to keep the folders small
+        return self.path / reference[:2] / reference
+
+    def put(self, data: bytes) -> str:
+        return self.put_stream([data])[0]
+
+    def get(self, reference: str) -> bytes:
+        return self._file(reference).read_bytes()
+
+    def put_stream(self, chunks: Iterable[bytes]) -> Tuple[str, int]:
+        # write to a temporary file first, so that a payload is never read
+        # while it is only partly written. The reference is only known once
+        # all data has been written.
+        hash_, size = hashlib.sha256(), 0
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                for chunk in chunks:
+                    hash_.update(chunk)
+                    size += len(chunk)
+                    fp.write(chunk)
+            file_ = self._file(hash_.hexdigest())
+            file_.parent.mkdir(exist_ok=True)
+            os.replace(tmp, file_)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return hash_.hexdigest(), size
+
+    def get_stream(self, reference: str) -> Iterator[bytes]:
+        with open(self._file(reference), 'rb') as fp:
+            yield from read_chunks(fp, PAYLOAD_CHUNK_SIZE)
+
+
+class S3Storage(StorageBackend):
+    """Stores payloads as objects in a bucket of an S3-compatible object
+    store, e.g. AWS S3 or MinIO. Requires the `boto3` package."""
+
+    def __init__(self, bucket: str, endpoint_url: str = None,
+                 region: str = None, access_key_id: str = None,
+                 secret_access_key: str = None, prefix: str = ''):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("S3 storage requires the 'boto3' package, "
+                               "install it with 'pip install boto3'")
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key
+        )
+
+    def put(self, data: bytes) -> str:
+        reference = self.reference(data)
+        self.client.put_object(Bucket=self.bucket,
+                               Key=self.prefix + reference, Body=data)
+        return reference
+
+    def get(self, reference: str) -> bytes:
+        response = self.client.get_object(Bucket=self.bucket,
+                                          Key=self.prefix + reference)
+        return response['Body'].read()
+
+    def put_stream(self, chunks: Iterable[bytes]) -> Tuple[str, int]:
+        # the key is only known once all data has been read, so the data is
+        # spooled to a temporary file (on disk once it gets large) first
+        hash_, size = hashlib.sha256(), 0
+        with tempfile.SpooledTemporaryFile(max_size=PAYLOAD_CHUNK_SIZE) as fp:
+            for chunk in chunks:
+                hash_.update(chunk)
+                size += len(chunk)
+                fp.write(chunk)
+            fp.seek(0)
+            reference = hash_.hexdigest()
+            self.client.upload_fileobj(fp, self.bucket,
+                                       self.prefix + reference)
+        return reference, size
+
+    def get_stream(self, reference: str) -> Iterator[bytes]:
+        response = self.client.get_object(Bucket=self.bucket,
+                                          Key=self.prefix + reference)
+        yield from response['Body'].iter_chunks(PAYLOAD_CHUNK_SIZE)
+
+
+class Storage(metaclass=Singleton):
+    """Storage of the payloads of this server.
+
+    Decides whether a payload is kept in the database or put in the storage
+    backend. Without a backend, all payloads are kept in the database.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.inline_threshold = DEFAULT_STORAGE_INLINE_THRESHOLD
+
+    def configure(self, config: dict, data_dir: Path = None) -> None:
+        """Setup the storage backend
+
+        Parameters
+        ----------
+        config : dict
+            The `storage` section of the server configuration
+        data_dir : Path, optional
+            Data folder of the server, the default location of the payloads
+            for the local storage
+        """
+        type_ = config.get('type', 'database')
+        self.inline_threshold = config.get('inline_threshold',
+                                           DEFAULT_STORAGE_INLINE_THRESHOLD)
+
+        if type_ == 'local':
+            path = config.get('path') or Path(data_dir) / 'payloads'
+            self.backend = FileSystemStorage(path)
+        elif type_ == 's3':
+            self.backend = S3Storage(
+                bucket=config['bucket'],
+                endpoint_url=config.get('endpoint_url'),
+                region=config.get('region'),
+                access_key_id=config.get('access_key_id'),
+                secret_access_key=config.get('secret_access_key'),
+                prefix=config.get('prefix', '')
+            )
+        else:
+            self.backend = None
+
+        log.info(f"Storing payloads in: {type_}")
+
+    def store(self, payload: str):
+        """Store a payload
+
+        Parameters
+        ----------
+        payload : str
+            The payload to store
+
+        Returns
+        -------
+        Tuple[str, str]
+            The payload if it should be kept in the database (otherwise
+            None) and the reference to it in the storage backend (or None)
+        """
+        if not payload or not self.backend:
+            return payload, None
+
+        data = payload.encode(STRING_ENCODING)
+        if len(data) < self.inline_threshold:
+            return payload, None
+
+        return None, self.backend.put(data)
+
+    def load(self, payload: str, reference: str) -> str:
+        """Load a payload, from the storage backend if it is stored there
+
+        Parameters
+        ----------
+        payload : str
+            Payload as kept in the database
+        reference : str
+            Reference to the payload in the storage backend
+
+        Returns
+        -------
+        str
+            The payload
+        """
+        if not reference:
+            return payload
+
+        if not self.backend:
+            raise RuntimeError(f"Payload {reference} is stored in a storage "
+                               "backend, but no storage is configured!")
+        return self.backend.get(reference).decode(STRING_ENCODING)
+
+    def streams(self, size: Optional[int]) -> bool:
+        """Whether a binary payload of `size` bytes (None if unknown) is
+        streamed to the storage backend, rather than kept in the database
+        as text."""
+        return self.backend is not None and \
+            (size is None or size >= self.inline_threshold)
+
+    def store_stream(self, chunks: Iterable[bytes]) -> Tuple[str, int]:
+        """Stream a binary payload to the storage backend
+
+        Parameters
+        ----------
+        chunks : Iterable[bytes]
+            The payload, in chunks
+
+        Returns
+        -------
+        Tuple[str, int]
+            The reference to the payload and its size in bytes
+        """
+        if not self.backend:
+            raise RuntimeError("No storage backend is configured!")
+        return self.backend.put_stream(chunks)
+
+    def load_stream(self, reference: str) -> Iterator[bytes]:
+        """Stream a binary payload from the storage backend
+
+        Parameters
+        ----------
+        reference : str
+            Reference to the payload in the storage backend
+
+        Returns
+        -------
+        Iterator[bytes]
+            The payload, in chunks
+        """
+        if not self.backend:
+            raise RuntimeError(f"Payload {reference} is stored in a storage "
+                               "backend, but no storage is configured!")
+        return self.backend.get_stream(reference)
@@ -1,3 +1,5 @@
+import datetime
+
 from schema import And, Or, Use, Optional
 
 from vantage6.common.configuration_manager import (
@@ -24,7 +26,31 @@ class ServerConfiguration(Configuration):
             "max_size": And(Use(int), lambda b: b > 16),
             "format": Use(str),
             "datefmt": Use(str)
-        }
+        },
+        Optional("storage"): {
+            "type": And(Use(str), lambda t: t in ("database", "local", "s3")),
+            Optional("path"): Use(str),
+            Optional("bucket"): Use(str),
+            Optional("endpoint_url"): Use(str),
+            Optional("region"): Use(str),
+            Optional("access_key_id"): Use(str),
+            Optional("secret_access_key"): Use(str),
+            Optional("prefix"): Use(str),
+            Optional("inline_threshold"): And(Use(int), lambda n: n >= 0)
+        },
+        Optional("database"): {
+            Optional("pool_size"): And(Use(int), lambda n: n > 0),
+            Optional("max_overflow"): And(Use(int), lambda n: n >= -1),
+            Optional("pool_recycle"): Use(int),
+            Optional("pool_timeout"): And(Use(float), lambda t: t > 0),
+            Optional("sqlite_wal"): Use(bool),
+            Optional("sqlite_busy_timeout"): And(Use(int), lambda t: t >= 0)
+        },
+        Optional("permission_cache_ttl"): And(Use(float), lambda t: t >= 0),
+        Optional("last_seen_flush_interval"):
+            And(Use(float), lambda t: t >= 0),
+        Optional("legacy_api_keys_until"):
+            Or(None, Use(lambda d: datetime.date.fromisoformat(str(d))))
     }
 
 
@@ -50,7 +76,10 @@ class NodeConfiguration(Configuration):
         "encryption": {
             "enabled": bool,
             Optional("private_key"): Use(str)
-        }
+        },
+        Optional("max_concurrent_tasks"): And(Use(int), lambda n: n > 0),
+        Optional("metrics_log_interval"): And(Use(float), lambda t: t >= 0),
+        Optional("task_sync_interval"): And(Use(float), lambda t: t >= 0)
     }
 
 